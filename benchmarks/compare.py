@@ -0,0 +1,92 @@
+import argparse
+import sys
+
+from benchmarks import harness
+
+
+# The metrics that are compared, where they are in the results of a scenario, and whether higher is better
+_METRICS = [
+    ("throughput", ("throughput_per_second",), True),
+    ("p50 ms", ("latency_ms", "p50"), False),
+    ("p99 ms", ("latency_ms", "p99"), False),
+    ("peak MiB", ("peak_memory_bytes",), False)
+]
+
+
+def _metric(result: dict, path: tuple[str, ...]) -> float | None:
+    """
+    :param result: The results of a scenario
+    :param path: The keys of the metric
+    :return: The value of the metric, or None if it was not measured
+    """
+
+    for key in path:
+        result = result.get(key) if isinstance(result, dict) else None
+
+    if result is not None and path == ("peak_memory_bytes",):
+        return result / 2 ** 20
+
+    return result
+
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> tuple[list[str], list[str]]:
+    """
+    :param baseline: The results of the baseline run
+    :param candidate: The results of the run to compare to the baseline
+    :param threshold: The relative change, e.g. 0.1 for 10%, past which a metric that got worse is a regression
+    :return: The lines of the comparison table, and a description of each regression
+    """
+
+    lines = [f"{'scenario':<18} {'metric':<11} {'baseline':>12} {'candidate':>12} {'change':>9}"]
+    regressions = []
+
+    for name in baseline["scenarios"]:
+        if name not in candidate["scenarios"]:
+            lines.append(f"{name:<18} missing from the candidate")
+            continue
+
+        for label, path, higher_is_better in _METRICS:
+            before = _metric(baseline["scenarios"][name], path)
+            after = _metric(candidate["scenarios"][name], path)
+
+            if before is None or after is None:
+                continue
+
+            change = (after - before) / before if before != 0 else 0.0
+            lines.append(f"{name:<18} {label:<11} {before:>12,.2f} {after:>12,.2f} {change:>+9.1%}")
+
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(f"{name} {label} changed by {change:+.1%}")
+
+    return lines, regressions
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Compares two benchmark results files.")
+
+    parser.add_argument("baseline", help="the results of the baseline run, e.g. of the main branch")
+    parser.add_argument("candidate", help="the results of the run to compare")
+    parser.add_argument("--threshold", type=float, default=10,
+                        help="the percentage that a metric may get worse by before it is a regression")
+
+    args = parser.parse_args(argv)
+
+    baseline = harness.load_results(args.baseline)
+    candidate = harness.load_results(args.candidate)
+
+    if baseline["parameters"] != candidate["parameters"]:
+        print("Warning: the runs used different parameters", file=sys.stderr)
+
+    print(f"Baseline {baseline['commit']}{' (dirty)' if baseline['dirty'] else ''}, "
+          f"candidate {candidate['commit']}{' (dirty)' if candidate['dirty'] else ''}")
+
+    lines, regressions = compare(baseline, candidate, args.threshold / 100)
+    print("\n".join(lines))
+
+    if regressions:
+        print("\nRegressions:\n" + "\n".join(f"  {regression}" for regression in regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
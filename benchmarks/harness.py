@@ -0,0 +1,227 @@
+import datetime
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+
+class Scenario:
+    """
+    A workload that is measured one tick at a time. Subclasses override setup, tick, and teardown.
+    """
+
+    # The name of the scenario in the results
+    name = ""
+
+    # What tick counts, e.g. "launches" or "recipients"
+    unit = ""
+
+    def setup(self) -> None:
+        """
+        Builds the state that every tick works on. It is not timed, but its memory is part of the peak memory.
+        """
+
+    def before_tick(self) -> None:
+        """
+        Prepares the input of the next tick, e.g. new mail in the inbox. It is not timed.
+        """
+
+    def tick(self) -> int:
+        """
+        Runs one tick of the workload.
+
+        :return: The number of units processed, which the throughput is computed from
+        """
+
+        raise NotImplementedError
+
+    def teardown(self) -> None:
+        """
+        Releases the state built by setup.
+        """
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    """
+    :param samples: The measured durations in seconds
+    :return: The p50, p90, p99, max, and mean of the samples in milliseconds. Percentiles are interpolated.
+    """
+
+    ordered = sorted(samples)
+
+    def percentile(fraction: float) -> float:
+        position = (len(ordered) - 1) * fraction
+        lower = int(position)
+        upper = min(lower + 1, len(ordered) - 1)
+
+        return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+    return {
+        "p50": percentile(0.5) * 1000,
+        "p90": percentile(0.9) * 1000,
+        "p99": percentile(0.99) * 1000,
+        "max": ordered[-1] * 1000,
+        "mean": statistics.fmean(ordered) * 1000
+    }
+
+
+def _time_ticks(scenario: Scenario, ticks: int, warmup: int) -> tuple[list[float], int]:
+    """
+    :param scenario: The scenario, already set up
+    :param ticks: How many ticks to time
+    :param warmup: How many ticks to run before timing
+    :return: The duration of each timed tick in seconds, and the number of units processed by the timed ticks
+    """
+
+    for _ in range(warmup):
+        scenario.before_tick()
+        scenario.tick()
+
+    durations = []
+    units = 0
+
+    for _ in range(ticks):
+        scenario.before_tick()
+
+        # A collection started by an earlier tick should not be timed as part of this one
+        gc.collect()
+
+        start = time.perf_counter()
+        units += scenario.tick()
+        durations.append(time.perf_counter() - start)
+
+    return durations, units
+
+
+def _peak_memory(scenario: Scenario, ticks: int) -> int:
+    """
+    Runs the scenario again from setup while tracing allocations. This is a separate pass because tracing slows every
+    allocation down, which would skew the timings.
+
+    :param scenario: The scenario, not set up
+    :param ticks: How many ticks to run
+    :return: The peak size of the memory blocks allocated by Python during setup and the ticks, in bytes. Allocations
+             by the local servers, which run in the same process, are included.
+    """
+
+    gc.collect()
+    tracemalloc.start()
+
+    try:
+        scenario.setup()
+
+        try:
+            for _ in range(ticks):
+                scenario.before_tick()
+                scenario.tick()
+
+        finally:
+            scenario.teardown()
+
+        return tracemalloc.get_traced_memory()[1]
+
+    finally:
+        tracemalloc.stop()
+
+
+def run_scenario(scenario: Scenario, ticks: int, warmup: int = 1, memory_ticks: int = 1) -> dict:
+    """
+    Times the ticks of a scenario and measures its peak memory.
+
+    :param scenario: The scenario, not set up
+    :param ticks: How many ticks to time
+    :param warmup: How many ticks to run before timing, e.g. to fill caches and open connections
+    :param memory_ticks: How many ticks to run after setup while measuring the peak memory. If 0, the peak memory is
+                         not measured.
+    :return: The results of the scenario
+    """
+
+    scenario.setup()
+
+    try:
+        durations, units = _time_ticks(scenario, ticks, warmup)
+
+    finally:
+        scenario.teardown()
+
+    total = sum(durations)
+
+    return {
+        "unit": scenario.unit,
+        "ticks": ticks,
+        "units": units,
+        "throughput_per_second": units / total if total > 0 else None,
+        "latency_ms": percentiles(durations),
+        "peak_memory_bytes": _peak_memory(scenario, memory_ticks) if memory_ticks > 0 else None
+    }
+
+
+def git_commit() -> tuple[str | None, bool]:
+    """
+    :return: The commit that the working tree is at, or None if it is not a git repository, and whether the working
+             tree has uncommitted changes
+    """
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True
+        ).stdout
+
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+
+    return commit, len(status.strip()) > 0
+
+
+def build_results(parameters: dict, scenarios: dict[str, dict]) -> dict:
+    """
+    :param parameters: The parameters that the benchmarks were run with
+    :param scenarios: The results of each scenario, by scenario name
+    :return: The results of the run, with what is needed to tell runs apart
+    """
+
+    commit, dirty = git_commit()
+
+    return {
+        "commit": commit,
+        "dirty": dirty,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "parameters": parameters,
+        "scenarios": scenarios
+    }
+
+
+def write_results(path: str, results: dict) -> None:
+    """
+    :param path: The path of the results file. Its directory is created if it does not exist.
+    :param results: The results of the run
+    """
+
+    directory = os.path.dirname(path)
+
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(path: str) -> dict:
+    """
+    :param path: The path of the results file
+    :return: The results of the run
+    """
+
+    with open(path, "r") as f:
+        return json.load(f)
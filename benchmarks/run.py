@@ -0,0 +1,127 @@
+import argparse
+import logging
+import os
+import sys
+
+from benchmarks import harness
+from benchmarks import scenarios
+from src.emailer import smtp_pool
+from src.helper import config_loader
+from src.recording import mail_capture
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    :param argv: The command line arguments. If None, sys.argv is used.
+    :return: The parsed arguments
+    """
+
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the feed, notification, inbox, and delivery paths against local stand-in servers."
+    )
+
+    parser.add_argument("--launches", type=int, default=5000, help="the number of launches in the feed")
+    parser.add_argument("--subscribers", type=int, default=100_000, help="the number of subscribers")
+    parser.add_argument("--replies", type=int, default=500, help="the number of emails in each inbox burst")
+    parser.add_argument("--ticks", type=int, default=20, help="the number of timed ticks of each scenario")
+    parser.add_argument("--fanout-ticks", type=int, default=3, help="the number of timed ticks of outbox_fanout")
+    parser.add_argument("--seed", type=int, default=1, help="the seed of the synthetic data")
+    parser.add_argument("--quick", action="store_true", help="run a small version of every scenario as a smoke test")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory pass of each scenario")
+    parser.add_argument("--scenario", action="append", help="only run this scenario. Can be given more than once.")
+    parser.add_argument("--config", default="config/config.toml", help="the config file to base the scenarios on")
+    parser.add_argument("--output", help="the results file. Defaults to benchmarks/results/<commit>.json")
+
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.launches = min(args.launches, 500)
+        args.subscribers = min(args.subscribers, 5000)
+        args.replies = min(args.replies, 50)
+        args.ticks = min(args.ticks, 5)
+        args.fanout_ticks = min(args.fanout_ticks, 1)
+
+    return args
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    config = config_loader.load_toml(args.config)
+
+    sink = mail_capture.MailCapture()
+    sink.start()
+
+    # Every shared SMTP pool connects to the local sink
+    smtp_pool.set_server("127.0.0.1", sink.port, starttls=False)
+
+    to_run = [
+        (scenarios.FeedPoll(config, args.seed, args.launches), args.ticks),
+        (scenarios.ReminderTick(config, args.seed, args.launches), args.ticks),
+        (scenarios.DailyNotifGen(config, args.seed, args.launches, digest=True), args.ticks),
+        (scenarios.DailyNotifGen(config, args.seed, args.launches, digest=False), args.ticks),
+        (scenarios.SubscriberCheck(config, args.seed, args.subscribers, args.replies), args.ticks),
+        (scenarios.OutboxConfirmations(config, args.seed, sink), args.ticks),
+        (scenarios.OutboxFanout(config, args.seed, sink, args.subscribers), args.fanout_ticks)
+    ]
+
+    if args.scenario:
+        unknown = set(args.scenario) - {scenario.name for scenario, _ in to_run}
+
+        if unknown:
+            sys.exit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        to_run = [(scenario, ticks) for scenario, ticks in to_run if scenario.name in args.scenario]
+
+    results = {}
+
+    try:
+        for scenario, ticks in to_run:
+            print(f"Running {scenario.name}...", file=sys.stderr)
+
+            results[scenario.name] = harness.run_scenario(
+                scenario, ticks, memory_ticks=0 if args.no_memory else 1
+            )
+
+            print(format_result(scenario.name, results[scenario.name]), file=sys.stderr)
+
+    finally:
+        sink.stop()
+
+    parameters = {
+        "launches": args.launches,
+        "subscribers": args.subscribers,
+        "replies": args.replies,
+        "ticks": args.ticks,
+        "fanout_ticks": args.fanout_ticks,
+        "seed": args.seed
+    }
+
+    run_results = harness.build_results(parameters, results)
+    output = args.output or os.path.join("benchmarks", "results", f"{run_results['commit'] or 'results'}.json")
+
+    harness.write_results(output, run_results)
+    print(f"Wrote {output}", file=sys.stderr)
+
+
+def format_result(name: str, result: dict) -> str:
+    """
+    :param name: The name of the scenario
+    :param result: The results of the scenario
+    :return: A one-line summary of the results
+    """
+
+    latency = result["latency_ms"]
+    summary = f"  {name}: {result['throughput_per_second']:,.0f} {result['unit']}/s, " \
+              f"p50 {latency['p50']:.2f} ms, p99 {latency['p99']:.2f} ms"
+
+    if result["peak_memory_bytes"] is not None:
+        summary += f", peak memory {result['peak_memory_bytes'] / 2 ** 20:.1f} MiB"
+
+    return summary
+
+
+if __name__ == "__main__":
+    # The program logs every email it sends, which would be measured too
+    logging.basicConfig(level=logging.WARNING)
+
+    main()
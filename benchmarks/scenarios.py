@@ -0,0 +1,493 @@
+import copy
+import datetime
+import os
+import random
+import tempfile
+import time
+
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from benchmarks import servers
+from benchmarks.harness import Scenario
+from src import feed
+from src import notifs
+from src import subscriber
+from src.emailer import email_receiver
+from src.emailer import outbox
+from src.emailer import smtp_pool
+from src.helper import dt_helper
+from src.recording import mail_capture
+
+
+SENDER = {"username": "bench@localhost", "password": "bench"}
+
+_PROVIDERS = ["SpaceX", "Rocket Lab", "ULA", "Blue Origin", "Arianespace", "ISRO", "CASC", "Roscosmos", "JAXA"]
+_VEHICLES = ["Falcon 9", "Electron", "Vulcan", "New Glenn", "Ariane 6", "PSLV", "Long March 2D", "Soyuz", "H3"]
+_SITES = ["Cape Canaveral SFS", "Kennedy Space Center", "Vandenberg SFB", "Mahia Peninsula", "Guiana Space Centre",
+          "Satish Dhawan Space Centre", "Jiuquan", "Baikonur", "Tanegashima"]
+
+
+def benchmark_config(config: dict, directory: str) -> dict:
+    """
+    :param config: The config file data
+    :param directory: The directory to keep the databases and state files of a scenario in
+    :return: A copy of the config that keeps every file in the directory and does not enforce rate limits, so that
+             only the program itself is measured
+    """
+
+    config = copy.deepcopy(config)
+
+    config["rate_limit"] = {"per_second": 0, "per_minute": 0, "per_day": 0, "max_wait_seconds": 0}
+    config["outbox"]["database_file"] = os.path.join(directory, "outbox.db")
+    config["subscription"]["database_file"] = os.path.join(directory, "subscribers.db")
+    config["subscription"]["inbox_state_file"] = os.path.join(directory, "inbox_state.json")
+    config["reminders"]["prelaunch"]["state_file"] = os.path.join(directory, "reminder_state.json")
+
+    return config
+
+
+def _isoformat(t0: datetime.datetime) -> str:
+    """
+    :param t0: A timezone-aware time
+    :return: The time in UTC in the format of the API
+    """
+
+    return t0.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def launch_data(launch_id: int, t0: datetime.datetime, rng: random.Random) -> dict:
+    """
+    :param launch_id: The number of the launch
+    :param t0: The launch time
+    :param rng: The random number generator
+    :return: A synthetic launch in the format of the API
+    """
+
+    site = rng.randrange(len(_SITES))
+
+    return {
+        "id": launch_id,
+        "name": f"Mission {launch_id}",
+        "provider": {"name": _PROVIDERS[site]},
+        "vehicle": {"name": _VEHICLES[(site + rng.randrange(2)) % len(_VEHICLES)]},
+        "pad": {"name": f"LC-{rng.randrange(1, 50)}", "location": {"name": _SITES[site]}},
+        "t0": _isoformat(t0)
+    }
+
+
+def launches_data(count: int, now: datetime.datetime, rng: random.Random) -> list[dict]:
+    """
+    :param count: The number of launches
+    :param now: The current time
+    :param rng: The random number generator
+    :return: Synthetic launches spread over the next 48 hours, in the format of the API
+    """
+
+    return [
+        launch_data(launch_id, now + datetime.timedelta(minutes=rng.randrange(30, 48 * 60)), rng)
+        for launch_id in range(1, count + 1)
+    ]
+
+
+def subscriber_address(number: int) -> str:
+    """
+    :param number: The number of the subscriber
+    :return: The SMS gateway address of the subscriber
+    """
+
+    return f"{5550000000 + number}@sms.example.com"
+
+
+def _reply(address: str, text: str) -> bytes:
+    """
+    :param address: The address of the subscriber
+    :param text: The text of the reply
+    :return: A reply from an SMS gateway, which puts the text in a text/plain attachment
+    """
+
+    mail = MIMEMultipart()
+    mail["From"] = address
+    mail["Subject"] = ""
+    mail["Date"] = "Sun, 18 Oct 2026 12:00:00 +0000"
+    mail.attach(MIMEText(text, "plain", "utf-8"))
+
+    return mail.as_bytes()
+
+
+def _bounce(address: str) -> bytes:
+    """
+    :param address: The address that bounced
+    :return: A delivery status notification for a hard bounce of the address
+    """
+
+    return (
+        "From: Mail Delivery Subsystem <mailer-daemon@sms.example.com>\r\n"
+        "Subject: Delivery Status Notification (Failure)\r\n"
+        "Date: Sun, 18 Oct 2026 12:00:00 +0000\r\n"
+        "MIME-Version: 1.0\r\n"
+        "Content-Type: multipart/report; report-type=delivery-status; boundary=\"bounce\"\r\n"
+        "\r\n"
+        "--bounce\r\n"
+        "Content-Type: text/plain; charset=\"utf-8\"\r\n"
+        "\r\n"
+        f"Your message to {address} could not be delivered.\r\n"
+        "--bounce\r\n"
+        "Content-Type: message/delivery-status\r\n"
+        "\r\n"
+        "Reporting-MTA: dns; sms.example.com\r\n"
+        "\r\n"
+        f"Final-Recipient: rfc822; {address}\r\n"
+        "Action: failed\r\n"
+        "Status: 5.1.1\r\n"
+        "--bounce\r\n"
+        "Content-Type: text/rfc822-headers\r\n"
+        "\r\n"
+        f"From: {SENDER['username']}\r\n"
+        f"To: {address}\r\n"
+        "Subject: Launch Soon\r\n"
+        "--bounce--\r\n"
+    ).encode()
+
+
+def reply_burst(count: int, subscribers: int, rng: random.Random) -> list[bytes]:
+    """
+    :param count: The number of emails
+    :param subscribers: The number of existing subscribers
+    :param rng: The random number generator
+    :return: A burst of inbox mail: mostly subscriptions, some with a launch filter, unsubscriptions of existing
+             subscribers, and bounces
+    """
+
+    burst = []
+
+    for _ in range(count):
+        kind = rng.random()
+
+        if kind < 0.6:
+            burst.append(_reply(subscriber_address(subscribers + rng.randrange(10 * subscribers)), "subscribe"))
+        elif kind < 0.75:
+            burst.append(_reply(subscriber_address(rng.randrange(subscribers)), f"subscribe {rng.choice(_PROVIDERS)}"))
+        elif kind < 0.95:
+            burst.append(_reply(subscriber_address(rng.randrange(subscribers)), "unsubscribe"))
+        else:
+            burst.append(_bounce(subscriber_address(rng.randrange(subscribers))))
+
+    return burst
+
+
+class _TempDirScenario(Scenario):
+    def __init__(self, config: dict, seed: int):
+        """
+        :param config: The config file data
+        :param seed: The seed of the synthetic data, so that runs are comparable
+        """
+
+        self.base_config = config
+        self.seed = seed
+
+        self.config: dict = config
+        self.rng = random.Random(seed)
+
+        self._directory: tempfile.TemporaryDirectory | None = None
+
+    def setup(self) -> None:
+        self._directory = tempfile.TemporaryDirectory(prefix=f"bench-{self.name}-")
+        self.config = benchmark_config(self.base_config, self._directory.name)
+        self.rng = random.Random(self.seed)
+
+    def teardown(self) -> None:
+        self._directory.cleanup()
+
+
+class FeedPoll(_TempDirScenario):
+    name = "feed_poll"
+    unit = "launches"
+
+    def __init__(self, config: dict, seed: int, launches: int, page_size: int = 100, change_fraction: float = 0.01):
+        """
+        Fetches every page of a large feed from a local HTTP server and diffs it, as the feed thread does on every
+        poll. Some launches change their T-0 between polls, so most pages are downloaded again.
+
+        :param launches: The number of launches in the feed
+        :param page_size: The number of launches per page
+        :param change_fraction: The fraction of the launches that change between polls
+        """
+
+        super().__init__(config, seed)
+
+        self.launches = launches
+        self.page_size = page_size
+        self.change_fraction = change_fraction
+
+    def setup(self) -> None:
+        super().setup()
+
+        self.server = servers.FeedServer(self.page_size)
+        self.server.start()
+
+        self.data = launches_data(self.launches, dt_helper.get_now(self.config), self.rng)
+        self.server.set_launches(self.data)
+
+        self.client = feed.FeedClient(self.server.url, 5, 15, -(-self.launches // self.page_size) + 1)
+        self.differ = feed.LaunchDiffer()
+
+    def before_tick(self) -> None:
+        for launch in self.rng.sample(self.data, max(1, int(len(self.data) * self.change_fraction))):
+            t0 = datetime.datetime.fromisoformat(launch["t0"]) + datetime.timedelta(minutes=1)
+            launch["t0"] = _isoformat(t0)
+
+        self.server.set_launches(self.data)
+
+    def tick(self) -> int:
+        if self.client.fetch():
+            self.differ.diff(self.client.data)
+
+        return len(self.differ.launches)
+
+    def teardown(self) -> None:
+        self.client.close()
+        self.server.stop()
+        super().teardown()
+
+
+class ReminderTick(_TempDirScenario):
+    name = "reminder_tick"
+    unit = "launches"
+
+    def __init__(self, config: dict, seed: int, launches: int, due_per_tick: int = 5, changes_per_tick: int = 50):
+        """
+        Diffs the feed and applies the delta to the ReminderList, then sends the due reminders, as the runtime does
+        whenever the feed is polled. The reminders are persisted to disk. Between ticks, some launches are rescheduled
+        and new launches are added that are due right away, so every tick reschedules reminders and queues reminders in
+        the outbox.
+
+        :param launches: The number of launches
+        :param due_per_tick: The number of reminders that come due on each tick
+        :param changes_per_tick: The number of launches whose T-0 changes before each tick
+        """
+
+        super().__init__(config, seed)
+
+        self.launches = launches
+        self.due_per_tick = due_per_tick
+        self.changes_per_tick = changes_per_tick
+
+    def setup(self) -> None:
+        super().setup()
+
+        self.store = subscriber.store.SubscriberStore(self.config["subscription"]["database_file"])
+        self.outbox = outbox.Outbox(self.config["outbox"]["database_file"], self.config, {"senders": [SENDER]},
+                                    self.store.iter_audience)
+
+        self.reminder_list = notifs.prelaunch.ReminderList(
+            self.config,
+            self.outbox,
+            notifs.ReminderState(self.config["reminders"]["prelaunch"]["state_file"])
+        )
+
+        self.launch_differ = feed.LaunchDiffer()
+        self.data = launches_data(self.launches, dt_helper.get_now(self.config), self.rng)
+
+    def before_tick(self) -> None:
+        for i in self.rng.sample(range(len(self.data)), min(self.changes_per_tick, len(self.data))):
+            t0 = datetime.datetime.fromisoformat(self.data[i]["t0"]) + datetime.timedelta(minutes=1)
+            self.data[i]["t0"] = _isoformat(t0)
+
+        # Due a few seconds ago, which is within missed_reminder_seconds
+        due_t0 = dt_helper.get_now(self.config) + datetime.timedelta(
+            minutes=self.config["reminders"]["prelaunch"]["mins_before_launch"], seconds=-5
+        )
+
+        for _ in range(self.due_per_tick):
+            self.data.append(launch_data(len(self.data) + 1, due_t0, self.rng))
+
+    def tick(self) -> int:
+        self.reminder_list.apply_delta(self.launch_differ.diff({"result": self.data}))
+        self.reminder_list.send_due_reminders()
+        return len(self.data)
+
+    def teardown(self) -> None:
+        self.reminder_list.close()
+        self.outbox.close()
+        self.store.close()
+        super().teardown()
+
+
+class DailyNotifGen(_TempDirScenario):
+    unit = "launches"
+
+    def __init__(self, config: dict, seed: int, launches: int, digest: bool):
+        """
+        Runs gen_daily_notifs over every launch, as DailyNotifList does whenever the feed changes.
+
+        :param launches: The number of launches
+        :param digest: Whether to build one digest or one notification per launch
+        """
+
+        super().__init__(config, seed)
+
+        self.name = "daily_digest" if digest else "daily_per_launch"
+        self.launches = launches
+        self.digest = digest
+
+    def setup(self) -> None:
+        super().setup()
+
+        self.config["reminders"]["daily"]["digest"] = self.digest
+
+        now = dt_helper.get_now(self.config)
+        self.current = [feed.Launch.from_api(launch) for launch in launches_data(self.launches, now, self.rng)]
+
+    def tick(self) -> int:
+        notifs.daily.gen_daily_notifs(self.current, self.config)
+        return len(self.current)
+
+
+class SubscriberCheck(_TempDirScenario):
+    name = "subscriber_check"
+    unit = "emails"
+
+    def __init__(self, config: dict, seed: int, subscribers: int, replies: int):
+        """
+        Runs Subscriber.check on a burst of replies and bounces from a local IMAP server, with a large subscriber store,
+        as the inbox thread does when a notification makes many subscribers reply at once.
+
+        :param subscribers: The number of subscribers in the store
+        :param replies: The number of emails in each burst
+        """
+
+        super().__init__(config, seed)
+
+        self.subscribers = subscribers
+        self.replies = replies
+
+    def setup(self) -> None:
+        super().setup()
+
+        self.server = servers.IMAPStub()
+        self.server.start()
+
+        self.store = subscriber.store.SubscriberStore(self.config["subscription"]["database_file"])
+        self.store.import_emails(subscriber_address(number) for number in range(self.subscribers))
+
+        self.outbox = outbox.Outbox(self.config["outbox"]["database_file"], self.config, {"senders": [SENDER]},
+                                    self.store.iter_audience)
+
+        receiver = email_receiver.EmailReceiver(
+            SENDER["username"], SENDER["password"], "127.0.0.1", self.server.port, use_ssl=False
+        )
+
+        self.subscriber = subscriber.subscriber.Subscriber(receiver, self.config, self.store, self.outbox)
+
+        # Connect before the first burst, so that the burst is after the high-water mark
+        receiver.get_new_emails()
+
+    def before_tick(self) -> None:
+        self.server.deliver(reply_burst(self.replies, self.subscribers, self.rng))
+
+    def tick(self) -> int:
+        self.subscriber.check()
+        return self.replies
+
+    def teardown(self) -> None:
+        self.subscriber.close()
+        self.outbox.close()
+        self.store.close()
+        self.server.stop()
+        super().teardown()
+
+
+class OutboxConfirmations(_TempDirScenario):
+    name = "outbox_confirmations"
+    unit = "emails"
+
+    def __init__(self, config: dict, seed: int, sink: mail_capture.MailCapture, emails: int = 20):
+        """
+        Queues single-recipient emails in the outbox and waits until the outbox workers delivered them to a local SMTP
+        server, as confirmations are sent.
+
+        :param sink: The local SMTP server that the shared pools connect to
+        :param emails: The number of emails per tick
+        """
+
+        super().__init__(config, seed)
+
+        self.sink = sink
+        self.emails = emails
+
+    def setup(self) -> None:
+        super().setup()
+
+        self.outbox = outbox.Outbox(self.config["outbox"]["database_file"], self.config, {"senders": [SENDER]},
+                                    lambda terms: [])
+        self.outbox.start()
+
+        self.sent = 0
+
+    def tick(self) -> int:
+        for i in range(self.emails):
+            self.outbox.enqueue(None, "Subscribed", "Confirmation", [subscriber_address(i)])
+
+        self.sent += self.emails
+
+        while self.outbox.counts().get("sent", 0) < self.sent:
+            time.sleep(0.005)
+
+        return self.emails
+
+    def teardown(self) -> None:
+        self.outbox.close()
+        smtp_pool.close_all()
+        super().teardown()
+
+
+class OutboxFanout(_TempDirScenario):
+    name = "outbox_fanout"
+    unit = "recipients"
+
+    def __init__(self, config: dict, seed: int, sink: mail_capture.MailCapture, subscribers: int):
+        """
+        Queues a notification for every subscriber and waits until the outbox workers delivered it to a local SMTP
+        server, which exercises the audience query, sharding, chunked fanout, and the SMTP pool.
+
+        :param sink: The local SMTP server that the shared pools connect to
+        :param subscribers: The number of subscribers
+        """
+
+        super().__init__(config, seed)
+
+        self.sink = sink
+        self.subscribers = subscribers
+
+    def setup(self) -> None:
+        super().setup()
+
+        self.store = subscriber.store.SubscriberStore(self.config["subscription"]["database_file"])
+        self.store.import_emails(subscriber_address(number) for number in range(self.subscribers))
+
+        self.outbox = outbox.Outbox(self.config["outbox"]["database_file"], self.config, {"senders": [SENDER]},
+                                    self.store.iter_audience)
+        self.outbox.start()
+
+        self.sent = 0
+
+    def tick(self) -> int:
+        recipients_before = self.sink.recipients
+
+        self.outbox.enqueue(None, "Launch Soon", "A SpaceX Falcon 9 will launch in 15 mins")
+        self.sent += 1
+
+        while self.outbox.counts().get("sent", 0) < self.sent:
+            time.sleep(0.005)
+
+        if self.sink.recipients - recipients_before != self.subscribers:
+            raise RuntimeError(f"Sent to {self.sink.recipients - recipients_before} of {self.subscribers} subscribers")
+
+        return self.subscribers
+
+    def teardown(self) -> None:
+        self.outbox.close()
+        smtp_pool.close_all()
+        self.store.close()
+        super().teardown()
@@ -0,0 +1,337 @@
+import email
+import email.message
+import hashlib
+import http.server
+import json
+import re
+import socketserver
+import threading
+import urllib.parse
+
+
+class _Server:
+    def __init__(self, server: socketserver.ThreadingMixIn):
+        """
+        Initializes the _Server object, a local server that handles each connection on its own thread.
+
+        :param server: The server, listening on a free port of the loopback interface
+        """
+
+        self._server = server
+        self._server.daemon_threads = True
+        self._server.owner = self
+
+        self._thread = threading.Thread(target=self._server.serve_forever, name=type(self).__name__, daemon=True)
+
+    @property
+    def port(self) -> int:
+        """
+        :return: The port that the server listens on
+        """
+
+        return self._server.server_address[1]
+
+    def start(self) -> None:
+        """
+        Starts serving in the background.
+        """
+
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops serving and closes the listening socket.
+        """
+
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _body_structure(part: email.message.Message) -> str:
+    """
+    :param part: A message or one of its parts
+    :return: The IMAP BODYSTRUCTURE of the part. Only the fields that EmailReceiver reads are accurate.
+    """
+
+    if part.get_content_maintype() == "multipart":
+        children = "".join(_body_structure(child) for child in part.get_payload())
+        return f"({children} \"{part.get_content_subtype().upper()}\")"
+
+    body = _section_body(part)
+    charset = part.get_content_charset()
+    parameters = f"(\"CHARSET\" \"{charset}\")" if charset else "NIL"
+    encoding = part.get("Content-Transfer-Encoding", "7bit").upper()
+    structure = f"\"{part.get_content_maintype().upper()}\" \"{part.get_content_subtype().upper()}\" {parameters} " \
+                f"NIL NIL \"{encoding}\" {len(body)}"
+
+    # Text parts also have their number of lines
+    if part.get_content_maintype() == "text":
+        lines = body.count(b"\r\n")
+        structure += f" {lines}"
+
+    return f"({structure})"
+
+
+def _section_body(part: email.message.Message) -> bytes:
+    """
+    :param part: A part of a message
+    :return: The body of the part as it was sent, without its headers
+    """
+
+    return part.as_bytes().split(b"\n\n", 1)[-1].replace(b"\r\n", b"\n").replace(b"\n", b"\r\n")
+
+
+def _section(mail: email.message.Message, section: str) -> bytes:
+    """
+    :param mail: The message
+    :param section: The IMAP section number, e.g. "1" or "1.2"
+    :return: The body of the section
+    """
+
+    part = mail
+
+    for number in section.split("."):
+        part = part.get_payload()[int(number) - 1]
+
+    return _section_body(part)
+
+
+class _Message:
+    __slots__ = ("raw", "mail", "structure", "headers")
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+        self.mail = email.message_from_bytes(raw)
+        self.structure = _body_structure(self.mail)
+
+        self.headers = b"".join(
+            f"{name}: {self.mail[name]}\r\n".encode() for name in ("From", "Subject", "Date") if self.mail[name]
+        ) + b"\r\n"
+
+
+class _IMAPHandler(socketserver.StreamRequestHandler):
+    # Replies are written in several pieces, which must not wait for the client to acknowledge the previous one
+    disable_nagle_algorithm = True
+
+    def _write(self, data: bytes | str) -> None:
+        self.wfile.write(data if isinstance(data, bytes) else data.encode())
+
+    def _fetch(self, stub: "IMAPStub", tag: str, uid_set: str, items: str) -> None:
+        partial = re.search(r"BODY\.PEEK\[([\d.]+)\]<0\.(\d+)>", items)
+
+        for number, (uid, message) in enumerate(stub.messages_in(uid_set), 1):
+            if "BODYSTRUCTURE" in items:
+                self._write(
+                    f"* {number} FETCH (UID {uid} BODYSTRUCTURE {message.structure} "
+                    f"BODY[HEADER.FIELDS (FROM SUBJECT DATE)] {{{len(message.headers)}}}\r\n"
+                )
+                self._write(message.headers + b")\r\n")
+
+            elif partial is not None:
+                body = _section(message.mail, partial.group(1))[:int(partial.group(2))]
+                self._write(f"* {number} FETCH (UID {uid} BODY[{partial.group(1)}]<0> {{{len(body)}}}\r\n")
+                self._write(body + b")\r\n")
+
+            else:
+                self._write(f"* {number} FETCH (UID {uid} RFC822 {{{len(message.raw)}}}\r\n")
+                self._write(message.raw + b")\r\n")
+
+        self._write(f"{tag} OK FETCH completed\r\n")
+
+    def handle(self) -> None:
+        stub: IMAPStub = self.server.owner
+
+        self._write("* OK IMAP stub ready\r\n")
+
+        while line := self.rfile.readline():
+            tag, command, *arguments = line.decode().strip().split(" ")
+            command = command.upper()
+
+            if command == "CAPABILITY":
+                self._write(f"* CAPABILITY IMAP4rev1 IDLE\r\n{tag} OK CAPABILITY completed\r\n")
+
+            elif command == "LOGIN":
+                self._write(f"{tag} OK LOGIN completed\r\n")
+
+            elif command == "SELECT":
+                self._write(
+                    f"* {stub.count()} EXISTS\r\n* 0 RECENT\r\n* OK [UIDVALIDITY 1]\r\n"
+                    f"* OK [UIDNEXT {stub.uid_next()}]\r\n{tag} OK [READ-WRITE] SELECT completed\r\n"
+                )
+
+            elif command == "NOOP":
+                self._write(f"* {stub.count()} EXISTS\r\n{tag} OK NOOP completed\r\n")
+
+            elif command == "IDLE":
+                self._write("+ idling\r\n")
+                self.rfile.readline()
+                self._write(f"{tag} OK IDLE terminated\r\n")
+
+            elif command == "LOGOUT":
+                self._write(f"* BYE\r\n{tag} OK LOGOUT completed\r\n")
+                return
+
+            elif command == "UID" and arguments[0].upper() == "FETCH":
+                self._fetch(stub, tag, arguments[1], " ".join(arguments[2:]))
+
+            elif command == "UID" and arguments[0].upper() == "SEARCH":
+                uids = " ".join(str(uid) for uid, _ in stub.messages_in("1:*"))
+                self._write(f"* SEARCH {uids}\r\n{tag} OK SEARCH completed\r\n")
+
+            else:
+                self._write(f"{tag} BAD Command not implemented\r\n")
+
+            self.wfile.flush()
+
+
+class IMAPStub(_Server):
+    def __init__(self):
+        """
+        Initializes the IMAPStub object, a local IMAP server without SSL that has one inbox and accepts any login. It
+        implements the commands that EmailReceiver uses, including the partial fetches of _fetch_partial.
+        """
+
+        super().__init__(socketserver.ThreadingTCPServer(("127.0.0.1", 0), _IMAPHandler))
+
+        self._lock = threading.Lock()
+        self._messages: dict[int, _Message] = {}
+
+    def deliver(self, messages: list[bytes]) -> None:
+        """
+        Adds messages to the inbox.
+
+        :param messages: The raw messages
+        """
+
+        parsed = [_Message(raw) for raw in messages]
+
+        with self._lock:
+            uid = self.uid_next()
+
+            for message in parsed:
+                self._messages[uid] = message
+                uid += 1
+
+    def count(self) -> int:
+        """
+        :return: The number of messages in the inbox
+        """
+
+        return len(self._messages)
+
+    def uid_next(self) -> int:
+        """
+        :return: The UID that the next message will get
+        """
+
+        return max(self._messages, default=0) + 1
+
+    def messages_in(self, uid_set: str) -> list[tuple[int, _Message]]:
+        """
+        :param uid_set: An IMAP UID set, e.g. "1,2,3" or "4:*"
+        :return: The UIDs and messages in the set, in ascending UID order. Like a real server, "n:*" always includes
+                 the newest message.
+        """
+
+        with self._lock:
+            uids: set[int] = set()
+
+            for item in uid_set.split(","):
+                if item.endswith(":*"):
+                    start = int(item[:-2])
+                    uids.update(uid for uid in self._messages if uid >= start)
+
+                    if self._messages:
+                        uids.add(max(self._messages))
+
+                elif int(item) in self._messages:
+                    uids.add(int(item))
+
+            return [(uid, self._messages[uid]) for uid in sorted(uids)]
+
+
+class _FeedHandler(http.server.BaseHTTPRequestHandler):
+    # Replies are written in several pieces, which must not wait for the client to acknowledge the previous one
+    disable_nagle_algorithm = True
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        feed: FeedServer = self.server.owner
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        body, etag = feed.page(int(query.get("page", ["1"])[0]))
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FeedServer(_Server):
+    def __init__(self, page_size: int = 100):
+        """
+        Initializes the FeedServer object, a local HTTP server that serves synthetic launches in pages, like the paged
+        launches feed. Responses have an ETag, so unchanged pages are answered with 304 Not Modified.
+
+        :param page_size: The number of launches per page
+        """
+
+        super().__init__(http.server.ThreadingHTTPServer(("127.0.0.1", 0), _FeedHandler))
+
+        self.page_size = page_size
+
+        self._lock = threading.Lock()
+        self._pages: list[tuple[bytes, str]] = []
+
+        self.set_launches([])
+
+    @property
+    def url(self) -> str:
+        """
+        :return: The URL of the feed
+        """
+
+        return f"http://127.0.0.1:{self.port}/json/launches"
+
+    def set_launches(self, launches: list[dict]) -> None:
+        """
+        Replaces the launches in the feed. The pages are serialized here so that serving them is cheap.
+
+        :param launches: The launches, in the format of the API
+        """
+
+        page_count = max(1, -(-len(launches) // self.page_size))
+        pages = []
+
+        for page_number in range(1, page_count + 1):
+            result = launches[(page_number - 1) * self.page_size:page_number * self.page_size]
+            body = json.dumps({"result": result, "last_page": page_count}).encode()
+            pages.append((body, f"\"{hashlib.blake2b(body, digest_size=8).hexdigest()}\""))
+
+        with self._lock:
+            self._pages = pages
+
+    def page(self, page_number: int) -> tuple[bytes, str]:
+        """
+        :param page_number: The number of the page, starting at 1
+        :return: The body and ETag of the page. Pages past the last page are empty.
+        """
+
+        with self._lock:
+            if 1 <= page_number <= len(self._pages):
+                return self._pages[page_number - 1]
+
+        body = json.dumps({"result": [], "last_page": len(self._pages)}).encode()
+        return body, "\"empty\""
@@ -5,15 +5,15 @@ def main():
     sender_email = input("Sender email address: ")
     sender_password = input("Sender password: ")
 
+    senders = [{"username": sender_email, "password": sender_password}]
+
+    # Subscribers are spread over every sender account to send to more subscribers than one account's quota allows
+    while sender_email := input("Additional sender email address (leave blank to finish): "):
+        sender_password = input("Sender password: ")
+        senders.append({"username": sender_email, "password": sender_password})
+
     data = {
-        "sender": {
-            "username": sender_email,
-            "password": sender_password
-        },
-
-        "receiver": {
-            "emails": []
-        }
+        "senders": senders
     }
 
     with open("config/secret.json", "w") as f:
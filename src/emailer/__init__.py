@@ -1 +1,3 @@
 from .emailer import *
+from . import fanout
+from . import outbox
@@ -1,53 +1,501 @@
 import email
 import imaplib
+import logging
+import re
+import select
+import time
+
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from src.emailer import imap_structure
+from src.helper import metrics
+
+
+_IMAP_SECONDS = metrics.histogram("launchify_imap_seconds", "Time to open an IMAP session or fetch new emails")
+_EMAILS = metrics.counter("launchify_imap_emails_total", "Emails fetched from the inbox")
+_SESSIONS_LOST = metrics.counter("launchify_imap_sessions_lost_total", "IMAP sessions that were lost and reopened")
+
+# The tag of the IDLE command, which is sent outside of imaplib. imaplib's own tags are uppercase.
+_IDLE_TAG = b"idle"
+
+
+def _group_fetch_response(data: list) -> list[tuple[int, bytes, list[tuple[bytes, bytes]]]]:
+    """
+    Groups the parts of a FETCH response by message. imaplib splits the response of a message after every literal, so a
+    message whose BODYSTRUCTURE contains a literal string is spread over several parts.
+
+    :param data: The data of a FETCH response from imaplib
+    :return: The UID, the response text without the literal data, and the literals of each message that has a UID. Each
+             literal is given with the response text before it, which ends with its {size}.
+    """
+
+    messages: list[tuple[list[bytes], list[tuple[bytes, bytes]]]] = []
+
+    for part in data:
+        line = part[0] if isinstance(part, tuple) else part
+
+        if not isinstance(line, bytes):
+            continue
+
+        # Every message starts with its sequence number, and the rest of a line after a literal never does
+        if re.match(rb"\d+ \(", line) is not None or len(messages) == 0:
+            messages.append(([], []))
+
+        lines, literals = messages[-1]
+        lines.append(line)
+
+        if isinstance(part, tuple):
+            literals.append(part)
+
+    grouped = []
+
+    for lines, literals in messages:
+        text = b"".join(lines)
+        uid = re.search(rb"UID (\d+)", text)
+
+        if uid is not None:
+            grouped.append((int(uid.group(1)), text, literals))
+
+    return grouped
+
+
+def _find_literal(literals: list[tuple[bytes, bytes]], item: bytes) -> bytes | None:
+    """
+    :param literals: The literals of a message, as returned by _group_fetch_response
+    :param item: The start of the name of the data item, e.g. b"RFC822" or b"BODY["
+    :return: The data of the literal of the data item, or None if there is none
+    """
+
+    # imaplib ends every part at a literal, so the data item of the literal is in its part
+    for line, literal in literals:
+        if item in line:
+            return literal
+
+    return None
 
 
 class EmailReceiver:
-    def __init__(self, username: str, password: str, imap_server: str = "imap.gmail.com"):
+    def __init__(self, username: str, password: str, imap_server: str = "imap.gmail.com", port: int = 993,
+                 use_ssl: bool = True):
+        """
+        Initializes the EmailReceiver object. The IMAP session is opened lazily and kept open between calls.
+
+        :param username: The username of the email account to receive from
+        :param password: The password of the email account to receive from
+        :param imap_server: The IMAP server to connect to
+        :param port: The port of the IMAP server
+        :param use_ssl: Whether to connect over SSL. Only local test servers should be used without it.
+        """
+
         self.username = username
         self.password = password
         self.imap_server = imap_server
+        self.port = port
+        self.use_ssl = use_ssl
+
+        self._connection: imaplib.IMAP4 | None = None
 
-    def get_last_email(self):
+        # The UIDVALIDITY of the selected mailbox. UIDs are only comparable while this stays the same.
+        self.uid_validity: int | None = None
+
+        # The highest UID that has been returned by get_new_emails
+        self.last_seen_uid: int | None = None
+
+    def _connect(self) -> imaplib.IMAP4:
         """
-        :return: The last email. If there is an abort in imaplib, it will return None.
+        Opens the IMAP session, logs in, and selects the inbox. If the UIDVALIDITY of the inbox changed since the last
+        session, the last seen UID is reset to the newest message.
+
+        :return: The connection
         """
 
-        last_email = self.get_last_emails(1)
+        logging.info(f"Opening IMAP connection to {self.imap_server}")
+
+        with _IMAP_SECONDS.time(operation="connect"):
+            if self.use_ssl:
+                connection = imaplib.IMAP4_SSL(self.imap_server, self.port)
+            else:
+                connection = imaplib.IMAP4(self.imap_server, self.port)
+
+            connection.login(self.username, self.password)
+            connection.select("INBOX")
 
-        if len(last_email) == 0:
-            return None
+        uid_validity = int(connection.response("UIDVALIDITY")[1][0])
+        uid_next = int(connection.response("UIDNEXT")[1][0] or 1)
 
-        return last_email[0]
+        # Clear the RECENT count from SELECT so it is not mistaken for new mail when polling
+        connection.response("RECENT")
 
-    def get_last_emails(self, last_num=1):
+        if uid_validity != self.uid_validity or self.last_seen_uid is None:
+            self.uid_validity = uid_validity
+            self.last_seen_uid = uid_next - 1
+
+        self._connection = connection
+        return connection
+
+    def _get_connection(self) -> imaplib.IMAP4:
+        """
+        :return: The open IMAP session, opening one if there is no open session
+        """
+
+        if self._connection is None:
+            return self._connect()
+
+        return self._connection
+
+    def _drop_connection(self) -> None:
         """
-        :param last_num: The last number of emails to retrieve. E.g., if this is set to 3, retrieve the last 3 emails
-        :return: The last 3 emails. If there is an abort in imaplib, it will return an empty list.
+        Forgets the current session so that the next call reconnects.
         """
 
-        connection = imaplib.IMAP4_SSL(self.imap_server)
-        connection.login(self.username, self.password)
+        if self._connection is None:
+            return
+
+        _SESSIONS_LOST.inc()
 
         try:
-            status, messages = connection.select("INBOX")
+            self._connection.shutdown()
 
-        except imaplib.IMAP4.abort:
-            return []
+        except (imaplib.IMAP4.error, OSError):
+            pass
 
-        messages = int(messages[0])
+        self._connection = None
+
+    def logout(self) -> None:
+        """
+        Logs out and closes the IMAP session.
+        """
+
+        if self._connection is None:
+            return
+
+        try:
+            self._connection.logout()
+
+        except (imaplib.IMAP4.error, OSError):
+            pass
+
+        self._connection = None
+
+    def get_state(self) -> dict:
+        """
+        :return: The high-water mark of the inbox, which can be given to set_state after a restart
+        """
+
+        return {
+            "uid_validity": self.uid_validity,
+            "last_seen_uid": self.last_seen_uid
+        }
+
+    def set_state(self, state: dict) -> None:
+        """
+        Restores the high-water mark of the inbox. If the UIDVALIDITY of the inbox changed, the high-water mark is
+        discarded when connecting.
+
+        :param state: The state returned by get_state
+        """
+
+        self.uid_validity = state["uid_validity"]
+        self.last_seen_uid = state["last_seen_uid"]
+
+    def _fetch_uids(self, uids: str) -> list[tuple[int, email.message.Message]]:
+        """
+        :param uids: The UID set of the messages to fetch, e.g. "1,2,3" or "4:*"
+        :return: The UIDs and messages, in ascending UID order
+        """
+
+        res, msg = self._get_connection().uid("FETCH", uids, "(UID RFC822)")
 
         mail_items = []
 
-        # Iterate backwards through message IDs
-        for i in range(messages, messages - last_num, -1):
-            res, msg = connection.fetch(str(i), "(RFC822)")
+        for uid, text, literals in _group_fetch_response(msg):
+            message = _find_literal(literals, b"RFC822")
+
+            if message is not None:
+                mail_items.append((uid, email.message_from_bytes(message)))
+
+        mail_items.sort(key=lambda item: item[0])
+        return mail_items
+
+    def _search_uids(self, criteria: str) -> list[int]:
+        """
+        :param criteria: The IMAP search criteria
+        :return: The UIDs of the matching messages, in ascending order
+        """
+
+        res, data = self._get_connection().uid("SEARCH", None, criteria)
+
+        if res != "OK" or not data or not data[0]:
+            return []
+
+        return sorted(int(uid) for uid in data[0].split())
+
+    def _fetch_partial(self, uids: str, body_limit: int) -> list[tuple[int, email.message.Message]]:
+        """
+        Fetches the headers and the start of the first text part of each message instead of the whole message. Messages
+        that are not multipart are returned with their headers only, and delivery reports are downloaded whole.
+
+        :param uids: The UID set of the messages to fetch, e.g. "1,2,3" or "4:*"
+        :param body_limit: The maximum number of bytes to fetch from the first text part of each message
+        :return: The UIDs and messages, in ascending UID order. Each multipart message contains only its first text
+                 part.
+        """
+
+        connection = self._get_connection()
+
+        res, msg = connection.uid("FETCH", uids, "(UID BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE)])")
+
+        headers: dict[int, bytes] = {}
+        text_parts: dict[int, tuple[str, str, str, str]] = {}
+        full_fetch: list[int] = []
+
+        for uid, text, literals in _group_fetch_response(msg):
+            header = _find_literal(literals, b"BODY[HEADER")
+            structure_start = text.find(b"BODYSTRUCTURE (")
+
+            try:
+                if header is None or structure_start == -1:
+                    raise ValueError("the headers or the BODYSTRUCTURE are missing")
+
+                structure, _ = imap_structure.parse(text[structure_start + len(b"BODYSTRUCTURE "):])
+
+            except ValueError as e:
+                # E.g. a BODYSTRUCTURE with a literal string, so fall back to downloading the whole message
+                logging.info(f"Fetching the whole email with UID {uid}, since its structure can not be read: {e}")
+                full_fetch.append(uid)
+                continue
 
-            for response in msg:
-                if not isinstance(response, tuple):
+            headers[uid] = header
+
+            if len(structure) > 0 and isinstance(structure[0], list):
+                # Delivery reports are read from their delivery-status part, so they are downloaded whole
+                if imap_structure.multipart_subtype(structure) == "report":
+                    full_fetch.append(uid)
+                    continue
+
+                text_part = imap_structure.find_first_text_part(structure)
+
+                if text_part is not None:
+                    text_parts[uid] = text_part
+
+        mail_items = [
+            (uid, email.message_from_bytes(header))
+            for uid, header in headers.items()
+            if uid not in text_parts and uid not in full_fetch
+        ]
+
+        if full_fetch:
+            mail_items.extend(self._fetch_uids(",".join(str(uid) for uid in full_fetch)))
+
+        # Fetch the text parts, with one request per distinct section number
+        sections: dict[str, list[int]] = {}
+
+        for uid, (section, subtype, charset, encoding) in text_parts.items():
+            sections.setdefault(section, []).append(uid)
+
+        for section, section_uids in sections.items():
+            res, msg = connection.uid(
+                "FETCH", ",".join(str(uid) for uid in section_uids), f"(UID BODY.PEEK[{section}]<0.{body_limit}>)"
+            )
+
+            for uid, text, literals in _group_fetch_response(msg):
+                text_data = _find_literal(literals, b"BODY[")
+
+                if uid not in text_parts or text_data is None:
                     continue
 
-                mail = email.message_from_bytes(response[1])
-                mail_items.append(mail)
+                section, subtype, charset, encoding = text_parts.pop(uid)
 
+                mail = MIMEMultipart()
+
+                for key, value in email.message_from_bytes(headers[uid]).items():
+                    mail[key] = value
+
+                mail.attach(MIMEText(imap_structure.decode_partial(text_data, encoding, charset), subtype, "utf-8"))
+                mail_items.append((uid, mail))
+
+        # Messages whose text part was not returned are kept with their headers only
+        mail_items.extend((uid, email.message_from_bytes(headers[uid])) for uid in text_parts)
+
+        mail_items.sort(key=lambda item: item[0])
         return mail_items
+
+    def get_new_emails(self, body_limit: int | None = None) -> list[email.message.Message]:
+        """
+        Fetches every email that arrived after the high-water mark, and moves the high-water mark to the newest of them.
+
+        :param body_limit: If None, whole emails are downloaded. Otherwise, only the headers and the first body_limit
+                           bytes of the first text part of each email are downloaded.
+        :return: The emails that arrived since the last call, oldest first. If there is an abort in imaplib, it will
+                 return an empty list and reconnect on the next call.
+        """
+
+        try:
+            self._get_connection()
+
+            # "UID n:*" always matches the newest message, even when its UID is lower than n
+            uids = f"{self.last_seen_uid + 1}:*"
+
+            with _IMAP_SECONDS.time(operation="fetch"):
+                if body_limit is None:
+                    mail_items = self._fetch_uids(uids)
+                else:
+                    mail_items = self._fetch_partial(uids, body_limit)
+
+            mail_items = [(uid, mail) for uid, mail in mail_items if uid > self.last_seen_uid]
+
+        except (imaplib.IMAP4.abort, OSError) as e:
+            logging.warning(f"IMAP session lost, reconnecting on the next call: {e}")
+            self._drop_connection()
+            return []
+
+        if mail_items:
+            self.last_seen_uid = mail_items[-1][0]
+
+        _EMAILS.inc(len(mail_items))
+
+        return [mail for uid, mail in mail_items]
+
+    @staticmethod
+    def _wait_readable(connection: imaplib.IMAP4, timeout: float) -> bool:
+        """
+        Waits for data from the server without putting a timeout on the socket, since a timed out socket file can not be
+        read from again.
+
+        :param connection: The connection to wait on
+        :param timeout: The maximum number of seconds to wait
+        :return: If there is data to read
+        """
+
+        # SSL sockets may have already decrypted data that select does not see
+        pending = getattr(connection.sock, "pending", None)
+
+        if pending is not None and pending():
+            return True
+
+        return len(select.select([connection.sock], [], [], timeout)[0]) > 0
+
+    def _has_new_mail(self, connection: imaplib.IMAP4) -> bool:
+        """
+        Reads the untagged responses that the server sent since the last command with a NOOP, so that none are left
+        over when waiting for mail. They often report mail that was already fetched, so a reported message only counts
+        if it is after the high-water mark.
+
+        :param connection: The connection to check
+        :return: If there is mail after the high-water mark
+        """
+
+        connection.noop()
+
+        exists = connection.response("EXISTS")[1][0] is not None
+        recent = connection.response("RECENT")[1][0] is not None
+
+        if not exists and not recent:
+            return False
+
+        return any(uid > self.last_seen_uid for uid in self._search_uids(f"UID {self.last_seen_uid + 1}:*"))
+
+    def _idle(self, connection: imaplib.IMAP4, timeout: float) -> bool:
+        """
+        Waits in IMAP IDLE until the server reports a new message or the timeout passes. imaplib does not support IDLE,
+        so the command is written to and read from the connection directly, after every pending response was read.
+
+        :param connection: The connection to idle on
+        :param timeout: The maximum number of seconds to wait
+        :return: If the server reported a new message
+        """
+
+        if self._has_new_mail(connection):
+            return True
+
+        tag = _IDLE_TAG
+        connection.send(tag + b" IDLE\r\n")
+
+        if not connection.readline().startswith(b"+"):
+            raise imaplib.IMAP4.abort("server did not accept IDLE")
+
+        new_mail = False
+        deadline = time.monotonic() + timeout
+
+        while not new_mail:
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0 or not self._wait_readable(connection, remaining):
+                break
+
+            line = connection.readline()
+
+            if not line:
+                raise imaplib.IMAP4.abort("connection closed during IDLE")
+
+            new_mail = re.match(rb"\* \d+ (EXISTS|RECENT)", line) is not None
+
+        connection.send(b"DONE\r\n")
+
+        # Read the remaining untagged responses until IDLE is completed
+        while True:
+            line = connection.readline()
+
+            if not line:
+                raise imaplib.IMAP4.abort("connection closed while ending IDLE")
+
+            if line.startswith(tag + b" "):
+                return new_mail
+
+            new_mail = new_mail or re.match(rb"\* \d+ (EXISTS|RECENT)", line) is not None
+
+    def _poll(self, connection: imaplib.IMAP4, timeout: float, poll_seconds: float) -> bool:
+        """
+        Polls the server with NOOP until it reports a new message or the timeout passes. Used when the server does not
+        support IDLE.
+
+        :param connection: The connection to poll on
+        :param timeout: The maximum number of seconds to wait
+        :param poll_seconds: The number of seconds between polls
+        :return: If the server reported a new message
+        """
+
+        deadline = time.monotonic() + timeout
+
+        while True:
+            if self._has_new_mail(connection):
+                return True
+
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0:
+                return False
+
+            time.sleep(min(poll_seconds, remaining))
+
+    def wait_for_mail(self, timeout: float, poll_seconds: float = 5) -> bool:
+        """
+        Waits until new mail may have arrived or the timeout passes. Uses IMAP IDLE if the server supports it, and NOOP
+        polling otherwise.
+
+        :param timeout: The maximum number of seconds to wait
+        :param poll_seconds: The number of seconds between polls when falling back to NOOP polling
+        :return: If new mail may have arrived. get_new_emails should be called to retrieve it.
+        """
+
+        if timeout <= 0:
+            return False
+
+        deadline = time.monotonic() + timeout
+
+        try:
+            connection = self._get_connection()
+
+            if "IDLE" in connection.capabilities:
+                return self._idle(connection, timeout)
+
+            return self._poll(connection, timeout, poll_seconds)
+
+        except (imaplib.IMAP4.error, OSError) as e:
+            logging.warning(f"IMAP session lost while waiting for mail, reconnecting on the next call: {e}")
+            self._drop_connection()
+
+            # Do not spin on a broken connection: wait out the rest of the timeout
+            time.sleep(max(0.0, deadline - time.monotonic()))
+            return True
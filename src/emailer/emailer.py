@@ -1,50 +1,53 @@
-import smtplib
-import logging
-
 from src.helper import dt_helper
-from email.message import EmailMessage
-
+from src.feed.launch import Launch
 
-def send_email(sender: str, password: str, subject: str, body: str, to: list[str] | str):
-    if isinstance(to, str):
-        logging.info(f"Sending email to {to}: subject: {subject}")
-    elif isinstance(to, list):
-        logging.info(f"Sending email to {len(to)} recipients: subject: {subject}")
 
-    msg = EmailMessage()
-
-    msg.set_content(body)
+def _template_fields(launch: Launch, config: dict) -> dict:
+    """
+    :param launch: The launch. launch.t0 must not be None.
+    :param config: The config toml file.
+    :return: The fields that message templates can use for the launch
+    """
 
-    msg["subject"] = subject
-    msg["bcc"] = to
-    msg["from"] = sender
+    launch_datetime = launch.t0_in(dt_helper.get_timezone(config))
 
-    with smtplib.SMTP("smtp.gmail.com", 587) as smtp:
-        smtp.starttls()
-        smtp.login(sender, password)
-        smtp.send_message(msg)
+    return {
+        "provider": launch.provider,
+        "vehicle": launch.vehicle,
+        "mission": launch.name,
+        "launch_pad": launch.launch_pad,
+        "launch_site": launch.launch_site,
+        "remind_before_launch_mins": str(config["reminders"]["prelaunch"]["mins_before_launch"]),
+        "launch_time": launch_datetime.strftime("%H:%M on %m/%d/%Y")
+    }
 
 
-def format_message(template: str, launch_data: dict, config: dict) -> str:
+def format_message(template: str, launch: Launch, config: dict) -> str:
     """
     Formats the message to be sent to the user.
 
     :param template: The template to format
-    :param launch_data: The launch data from the API. launch_data["t0"] must not be None.
+    :param launch: The launch. launch.t0 must not be None.
     :param config: The config toml file.
     :return: The formatted message.
     """
 
-    launch_datetime = dt_helper.load_isoformat(launch_data["t0"], dt_helper.get_timezone(config))
+    return template.format(**_template_fields(launch, config))
 
-    template = template.format(
-        provider=launch_data["provider"]["name"],
-        vehicle=launch_data["vehicle"]["name"],
-        mission=launch_data["name"],
-        launch_pad=launch_data["pad"]["name"],
-        launch_site=launch_data["pad"]["location"]["name"],
-        remind_before_launch_mins=str(config["reminders"]["prelaunch"]["mins_before_launch"]),
-        launch_time=launch_datetime.strftime("%H:%M on %m/%d/%Y")
-    )
 
-    return template
+def format_digest(template: str, launch_template: str, launches: list[Launch], config: dict) -> str:
+    """
+    Formats a message about several launches. launch_template is formatted once per launch like format_message, and
+    the results are joined into the {launches} field of template.
+
+    :param template: The template of the whole message. It can use {launches} and {launch_count}.
+    :param launch_template: The template of the section about each launch
+    :param launches: The launches. The t0 of each launch must not be None.
+    :param config: The config toml file.
+    :return: The formatted message.
+    """
+
+    return template.format(
+        launches="".join(launch_template.format(**_template_fields(launch, config)) for launch in launches),
+        launch_count=len(launches)
+    )
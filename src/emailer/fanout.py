@@ -0,0 +1,239 @@
+import concurrent.futures
+import itertools
+import logging
+import smtplib
+
+from typing import Callable, Iterable, Iterator
+
+from email.message import EmailMessage
+
+from src.emailer import smtp_pool
+from src.emailer.rate_governor import RateGovernor, PRIORITY_NORMAL
+from src.helper import metrics
+
+
+# The error of recipients that were not sent to because the sender account failed on another chunk
+_ACCOUNT_FAILED = "not sent, the sender account failed"
+
+_RECIPIENTS = metrics.counter("launchify_fanout_recipients_total", "Recipients of fan-out sends, by result")
+
+
+class FanoutResult:
+    def __init__(self):
+        """
+        Initializes the FanoutResult object, which holds the per-recipient outcome of a fan-out send.
+        """
+
+        self.sent: list[str] = []
+        self.failed: dict[str, str] = {}
+
+        # If the sender account was rejected or rate limited, so that other accounts should be used
+        self.account_error = False
+
+        # If sending stopped before every recipient was sent to, because the rate limit would have to be waited for too
+        # long or because the rate governor was stopped. The recipients that were not sent to are in neither sent nor
+        # failed.
+        self.interrupted = False
+
+        # How many seconds until the rate limit allows the rest of the recipients, if interrupted
+        self.retry_seconds = 0.0
+
+    def succeeded(self) -> bool:
+        """
+        :return: If every recipient was sent to
+        """
+
+        return len(self.failed) == 0 and not self.interrupted
+
+    def merge(self, other: "FanoutResult") -> None:
+        """
+        Adds the results of another FanoutResult to this one.
+
+        :param other: The result to add
+        """
+
+        self.sent.extend(other.sent)
+        self.failed.update(other.failed)
+        self.account_error = self.account_error or other.account_error
+
+        if other.interrupted:
+            if self.interrupted:
+                self.retry_seconds = min(self.retry_seconds, other.retry_seconds)
+            else:
+                self.retry_seconds = other.retry_seconds
+
+            self.interrupted = True
+
+
+def is_account_error(e: Exception) -> bool:
+    """
+    :param e: The error that a send failed with
+    :return: If the error is about the sender account rather than the recipients: an authentication error, or a rate
+             limit or sending quota error
+    """
+
+    if isinstance(e, smtplib.SMTPAuthenticationError):
+        return True
+
+    if not isinstance(e, smtplib.SMTPResponseException):
+        return False
+
+    message = e.smtp_error.decode(errors="replace") if isinstance(e.smtp_error, bytes) else str(e.smtp_error)
+
+    # 421 and 454 are service unavailable, 4.7.x is a temporary rate limit, and 5.4.5 is an exceeded sending quota
+    return e.smtp_code in (421, 454) or message.startswith(("4.7.", "5.4.5"))
+
+
+def chunk(recipients: Iterable[str], chunk_size: int) -> Iterator[list[str]]:
+    """
+    :param recipients: The recipients to split. They are read lazily, so this can be a stream.
+    :param chunk_size: The maximum number of recipients per chunk
+    :return: The recipients split into chunks of at most chunk_size recipients
+    """
+
+    recipients = iter(recipients)
+
+    while recipient_chunk := list(itertools.islice(recipients, chunk_size)):
+        yield recipient_chunk
+
+
+def build_message(sender: str, subject: str, body: str) -> bytes:
+    """
+    Builds and serializes the message once. The recipients are not in the headers since they are given to the SMTP
+    server as envelope recipients.
+
+    :param sender: The email address to send from
+    :param subject: The subject of the email
+    :param body: The body of the email
+    :return: The serialized message
+    """
+
+    msg = EmailMessage()
+
+    msg.set_content(body)
+
+    msg["subject"] = subject
+    msg["from"] = sender
+
+    return msg.as_bytes()
+
+
+def _send_chunk(pool: smtp_pool.SMTPPool, sender: str, recipients: list[str], raw_msg: bytes,
+                governor: RateGovernor | None = None, priority: int = PRIORITY_NORMAL,
+                on_sent: Callable[[list[str]], None] | None = None) -> FanoutResult:
+    """
+    Sends the serialized message to one chunk of recipients.
+
+    :param pool: The SMTP pool to send over
+    :param sender: The envelope sender
+    :param recipients: The envelope recipients of this chunk
+    :param raw_msg: The serialized message
+    :param governor: The rate governor to wait for before sending. If None, the chunk is sent right away.
+    :param priority: The priority of the chunk in the rate governor
+    :param on_sent: Called with the recipients that were sent to as soon as the chunk is sent, e.g. to persist them
+    :return: The per-recipient results of this chunk. It is interrupted if the governor turned the chunk away.
+    """
+
+    result = FanoutResult()
+
+    if governor is not None and not governor.acquire(len(recipients), priority):
+        result.interrupted = True
+        result.retry_seconds = governor.seconds_until_available(len(recipients))
+        return result
+
+    try:
+        refused = pool.sendmail(sender, recipients, raw_msg)
+
+    except smtplib.SMTPRecipientsRefused as e:
+        refused = e.recipients
+
+    except (smtplib.SMTPException, OSError) as e:
+        logging.error(f"Failed to send to a chunk of {len(recipients)} recipients: {e}")
+        result.failed = {recipient: str(e) for recipient in recipients}
+        result.account_error = is_account_error(e)
+        return result
+
+    for recipient in recipients:
+        if recipient in refused:
+            result.failed[recipient] = str(refused[recipient])
+        else:
+            result.sent.append(recipient)
+
+    if on_sent is not None and len(result.sent) > 0:
+        on_sent(result.sent)
+
+    return result
+
+
+def send_fanout(sender: str, password: str, subject: str, body: str, to: Iterable[str], chunk_size: int = 50,
+                max_workers: int = 4, governor: RateGovernor | None = None, priority: int = PRIORITY_NORMAL,
+                on_sent: Callable[[list[str]], None] | None = None) -> FanoutResult:
+    """
+    Sends the same email to many recipients by splitting them into chunks of envelope recipients that are delivered
+    concurrently. The recipients are read as they are needed, so at most a few chunks are held in memory at once. If
+    the sender account is rejected or rate limited, no more chunks are sent and the unsent recipients are failed. If the
+    governor turns a chunk away, no more chunks are sent and the result is interrupted.
+
+    :param sender: The email address to send from
+    :param password: The password of the sender account
+    :param subject: The subject of the email
+    :param body: The body of the email
+    :param to: The recipients of the email
+    :param chunk_size: The maximum number of envelope recipients per SMTP transaction
+    :param max_workers: The maximum number of chunks that are delivered at the same time
+    :param governor: The rate governor that every chunk waits for. If None, chunks are sent as fast as possible.
+    :param priority: The priority of the email in the rate governor
+    :param on_sent: Called with the recipients of each chunk that were sent to, as soon as the chunk is sent. It is
+                    called from the worker threads.
+    :return: The per-recipient results
+    """
+
+    logging.info(f"Sending email in chunks of {chunk_size}: subject: {subject}")
+
+    result = FanoutResult()
+
+    raw_msg = build_message(sender, subject, body)
+    pool = smtp_pool.get_pool(sender, password)
+    recipients = iter(to)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight: set[concurrent.futures.Future] = set()
+
+        for recipient_chunk in chunk(recipients, chunk_size):
+            # Do not read more recipients until a worker is free
+            if len(in_flight) >= max_workers:
+                done, in_flight = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for future in done:
+                    result.merge(future.result())
+
+            if result.account_error:
+                result.failed.update(dict.fromkeys(recipient_chunk, _ACCOUNT_FAILED))
+                break
+
+            if result.interrupted:
+                break
+
+            in_flight.add(
+                executor.submit(_send_chunk, pool, sender, recipient_chunk, raw_msg, governor, priority, on_sent)
+            )
+
+        for future in concurrent.futures.as_completed(in_flight):
+            result.merge(future.result())
+
+    if result.account_error:
+        result.failed.update(dict.fromkeys(recipients, _ACCOUNT_FAILED))
+
+    _RECIPIENTS.inc(len(result.sent), result="sent")
+    _RECIPIENTS.inc(len(result.failed), result="failed")
+
+    total = len(result.sent) + len(result.failed)
+    logging.info(f"Sent email to {len(result.sent)} of {total} recipients: subject: {subject}")
+
+    if result.interrupted:
+        logging.info(f"Stopped sending before every recipient was sent to: subject: {subject}")
+
+    if len(result.failed) > 0:
+        logging.warning(f"Failed to send to {len(result.failed)} of {total} recipients: subject: {subject}")
+
+    return result
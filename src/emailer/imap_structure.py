@@ -0,0 +1,177 @@
+import base64
+import binascii
+import quopri
+
+
+def parse(data: bytes) -> tuple[list, int]:
+    """
+    Parses a parenthesized IMAP list, such as a BODYSTRUCTURE, into nested lists. Atoms and strings are returned as
+    bytes and NIL is returned as None. Literals are not supported.
+
+    :param data: The data, starting at the opening parenthesis of the list
+    :return: The parsed list and the index after its closing parenthesis
+    :raises ValueError: If the data is not a well-formed list
+    """
+
+    if not data.startswith(b"("):
+        raise ValueError(f"expected a list: {data[:20]!r}")
+
+    stack: list[list] = [[]]
+    i = 1
+
+    while i < len(data):
+        char = data[i:i + 1]
+
+        if char == b"(":
+            stack.append([])
+            i += 1
+
+        elif char == b")":
+            finished = stack.pop()
+            i += 1
+
+            if len(stack) == 0:
+                return finished, i
+
+            stack[-1].append(finished)
+
+        elif char == b" ":
+            i += 1
+
+        elif char == b"\"":
+            value = bytearray()
+            i += 1
+
+            while data[i:i + 1] != b"\"":
+                if i >= len(data):
+                    raise ValueError("unterminated string")
+
+                if data[i:i + 1] == b"\\":
+                    i += 1
+
+                value += data[i:i + 1]
+                i += 1
+
+            stack[-1].append(bytes(value))
+            i += 1
+
+        elif char == b"{":
+            raise ValueError("literals are not supported")
+
+        else:
+            end = i
+
+            while end < len(data) and data[end:end + 1] not in (b" ", b"(", b")"):
+                end += 1
+
+            atom = data[i:end]
+            stack[-1].append(None if atom.upper() == b"NIL" else atom)
+            i = end
+
+    raise ValueError("unterminated list")
+
+
+def find_first_text_part(structure: list, prefix: str = "") -> tuple[str, str, str, str] | None:
+    """
+    Finds the first text/plain or text/html part of a multipart BODYSTRUCTURE. Attached messages are not searched.
+
+    :param structure: The parsed BODYSTRUCTURE of a multipart message
+    :param prefix: The section number of the structure, used when recursing
+    :return: The section number, subtype, charset, and transfer encoding of the part, or None if there is no text part
+    """
+
+    # The parts of a multipart are the lists before the multipart subtype
+    for number, part in enumerate(_leading_lists(structure)):
+        section = f"{prefix}{number + 1}"
+
+        if len(part) > 0 and isinstance(part[0], list):
+            found = find_first_text_part(part, section + ".")
+
+            if found is not None:
+                return found
+
+            continue
+
+        if len(part) < 6 or part[0] is None or part[1] is None:
+            continue
+
+        subtype = part[1].decode().lower()
+
+        if part[0].decode().lower() != "text" or subtype not in ("plain", "html"):
+            continue
+
+        params = part[2] if isinstance(part[2], list) else []
+        charset = "us-ascii"
+
+        for key, value in zip(params[::2], params[1::2]):
+            if key is not None and value is not None and key.decode().lower() == "charset":
+                charset = value.decode()
+
+        encoding = part[5].decode().lower() if part[5] is not None else "7bit"
+
+        return section, subtype, charset, encoding
+
+    return None
+
+
+def multipart_subtype(structure: list) -> str | None:
+    """
+    :param structure: The parsed BODYSTRUCTURE of a multipart message
+    :return: The lowercase multipart subtype, e.g. "mixed" or "report", or None if it is missing
+    """
+
+    parts = _leading_lists(structure)
+
+    if len(structure) <= len(parts) or not isinstance(structure[len(parts)], bytes):
+        return None
+
+    return structure[len(parts)].decode().lower()
+
+
+def _leading_lists(structure: list) -> list[list]:
+    """
+    :param structure: The parsed BODYSTRUCTURE of a multipart message
+    :return: The body parts of the multipart
+    """
+
+    parts = []
+
+    for item in structure:
+        if not isinstance(item, list):
+            break
+
+        parts.append(item)
+
+    return parts
+
+
+def decode_partial(data: bytes, encoding: str, charset: str) -> str:
+    """
+    Decodes the start of a body part that may have been cut off at any byte.
+
+    :param data: The start of the body part
+    :param encoding: The content transfer encoding of the part
+    :param charset: The charset of the part
+    :return: The decoded text. Characters that were cut off are replaced.
+    """
+
+    if encoding == "base64":
+        data = b"".join(data.split())
+        data = data[:len(data) - len(data) % 4]
+
+        try:
+            data = base64.b64decode(data)
+
+        except binascii.Error:
+            data = b""
+
+    elif encoding == "quoted-printable":
+        # Drop a soft line break or escape that was cut off
+        cut = data.rfind(b"=", max(0, len(data) - 2))
+        data = quopri.decodestring(data[:cut] if cut != -1 else data)
+
+    try:
+        return data.decode(charset, errors="replace")
+
+    except LookupError:
+        return data.decode("utf-8", errors="replace")
@@ -0,0 +1,463 @@
+import functools
+import json
+import logging
+import sqlite3
+import threading
+import uuid
+
+from typing import Callable, Iterable, Iterator
+
+from src.emailer import sharding
+from src.emailer.rate_governor import PRIORITY_PRELAUNCH, PRIORITY_NORMAL
+from src.helper import clock
+from src.helper import metrics
+
+
+_QUEUED = metrics.gauge("launchify_outbox_emails", "Emails in the outbox, by status")
+_WAITING = metrics.gauge("launchify_rate_limit_waiting_recipients", "Recipients waiting for the rate limit")
+_ATTEMPTS = metrics.counter("launchify_outbox_attempts_total", "Delivery attempts, by result")
+_DELIVERY_SECONDS = metrics.histogram(
+    "launchify_outbox_delivery_seconds",
+    "Time from queueing an email until every recipient was sent to, by priority",
+    metrics.LAG_BUCKETS
+)
+
+# The longest rate limit period, per_day. Sends older than this no longer count against any limit.
+_RATE_LIMIT_WINDOW_SECONDS = 24 * 60 * 60
+
+
+def _without(recipients: Callable[[], Iterable[str]], excluded: set[str]) -> Iterator[str]:
+    """
+    :param recipients: A function that returns the recipients
+    :param excluded: The recipients to leave out
+    :return: The recipients that are not excluded
+    """
+
+    for recipient in recipients():
+        if recipient not in excluded:
+            yield recipient
+
+
+class Outbox:
+    def __init__(self, path: str, config: dict, secret: dict,
+                 audience: Callable[[list[str] | None], Iterable[str]]):
+        """
+        Initializes the Outbox object, a durable spool of outgoing emails in an SQLite database. Emails are queued with
+        enqueue and delivered by background workers, which retry failed recipients with exponential backoff and move
+        emails that keep failing to the dead-letter queue. Emails are sent from every sender account in the secret file,
+        every send goes through the rate governor of its account, and emails with a higher priority are sent first.
+
+        The recipients of each chunk are recorded as soon as the chunk is sent, and skipped when the email is sent
+        again after a failure or a restart. Delivery is at least once: only the chunks that were being sent when the
+        program stopped can be sent twice.
+
+        :param path: The path of the database file. It is created if it does not exist.
+        :param config: The config file data
+        :param secret: The secret file data
+        :param audience: A function that returns the subscribers whose launch filters match the given launch
+                         attributes, or every subscriber if given None. It is used for emails without recipients.
+        """
+
+        self.path = path
+        self.config = config
+        self.secret = secret
+        self.audience = audience
+        self.shards = sharding.SenderShards(sharding.sender_accounts(secret), config)
+
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._stopping = False
+        self._workers: list[threading.Thread] = []
+
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                key TEXT PRIMARY KEY,
+                subject TEXT NOT NULL,
+                body TEXT NOT NULL,
+                recipients TEXT,
+                audience TEXT,
+                priority INTEGER NOT NULL DEFAULT 1,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                last_error TEXT,
+                created REAL NOT NULL
+            )
+            """
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, priority, next_attempt)")
+
+        # The recipients that each email was sent to so far. They are deleted once the email is sent or given up on.
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS delivered (key TEXT NOT NULL, email TEXT NOT NULL, PRIMARY KEY (key, email)) "
+            "WITHOUT ROWID"
+        )
+
+        # How many recipients each account sent to and when, so that the rate limits survive a restart
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS sends (account TEXT NOT NULL, time REAL NOT NULL, recipients INTEGER NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS sends_time ON sends (time)")
+        self._seed_rate_limits()
+
+        # Emails that were being sent when the program stopped are sent again, to the recipients they were not sent to
+        self._connection.execute("UPDATE outbox SET status = 'pending' WHERE status = 'sending'")
+        self._purge_expired()
+
+        for status in ("pending", "sending", "sent", "dead"):
+            _QUEUED.set_function(lambda status=status: self.counts().get(status, 0), status=status)
+
+        _WAITING.set_function(lambda: self.shards.stats()["waiting"])
+
+    def enqueue(self, key: str | None, subject: str, body: str, recipients: list[str] | None = None,
+                priority: int = PRIORITY_NORMAL, audience: list[str] | None = None) -> bool:
+        """
+        Queues an email for delivery.
+
+        :param key: The idempotency key of the email. An email with the same key as an email that was already queued
+                    is not queued again. If None, a unique key is used.
+        :param subject: The subject of the email
+        :param body: The body of the email
+        :param recipients: The recipients of the email. If None, the email is sent to the subscribers in the audience
+                           at delivery time.
+        :param priority: The priority of the email, e.g. rate_governor.PRIORITY_PRELAUNCH
+        :param audience: The launch attributes that subscribers with launch filters are matched against, if recipients
+                         is None. If both are None, the email is sent to every subscriber.
+        :return: If the email was queued, False if an email with the same key was already queued
+        """
+
+        if key is None:
+            key = uuid.uuid4().hex
+
+        now = clock.time()
+
+        with self._lock:
+            queued = self._connection.execute(
+                "INSERT OR IGNORE INTO outbox "
+                "(key, subject, body, recipients, audience, priority, status, next_attempt, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, 'pending', ?, ?)",
+                (
+                    key,
+                    subject,
+                    body,
+                    None if recipients is None else json.dumps(recipients),
+                    None if audience is None else json.dumps(audience),
+                    priority,
+                    now,
+                    now
+                )
+            ).rowcount == 1
+
+            self._wake.notify()
+
+        if queued:
+            logging.info(f"Queued email {key}: subject: {subject}")
+        else:
+            logging.info(f"Email {key} was already queued, not queueing it again")
+
+        return queued
+
+    def _claim(self) -> tuple | None:
+        """
+        Marks the next due email with the highest priority as being sent. Must be called while holding self._lock.
+
+        :return: The key, subject, body, recipients, audience, priority, and attempts of the email, or None if no email
+                 is due
+        """
+
+        row = self._connection.execute(
+            "SELECT key, subject, body, recipients, audience, priority, attempts FROM outbox "
+            "WHERE status = 'pending' AND next_attempt <= ? ORDER BY priority, next_attempt LIMIT 1",
+            (clock.time(),)
+        ).fetchone()
+
+        if row is not None:
+            self._connection.execute("UPDATE outbox SET status = 'sending' WHERE key = ?", (row[0],))
+
+        return row
+
+    def _seconds_until_due(self) -> float | None:
+        """
+        Must be called while holding self._lock.
+
+        :return: The number of seconds until the next pending email is due, or None if there are no pending emails
+        """
+
+        row = self._connection.execute("SELECT MIN(next_attempt) FROM outbox WHERE status = 'pending'").fetchone()
+
+        if row[0] is None:
+            return None
+
+        return max(0.0, row[0] - clock.time())
+
+    def _backoff_seconds(self, attempts: int) -> float:
+        """
+        :param attempts: The number of failed attempts so far
+        :return: How many seconds to wait before the next attempt
+        """
+
+        outbox_config = self.config["outbox"]
+
+        return min(
+            outbox_config["base_backoff_seconds"] * 2 ** (attempts - 1),
+            outbox_config["max_backoff_seconds"]
+        )
+
+    def _seed_rate_limits(self) -> None:
+        """
+        Counts the sends of the last day against the rate limits, since the rate governors start with a full allowance.
+        Older sends are deleted.
+        """
+
+        now = clock.time()
+        window_start = now - _RATE_LIMIT_WINDOW_SECONDS
+
+        with self._lock:
+            self._connection.execute("DELETE FROM sends WHERE time < ?", (window_start,))
+            rows = self._connection.execute(
+                "SELECT account, time, recipients FROM sends WHERE time >= ? ORDER BY time", (window_start,)
+            ).fetchall()
+
+        sends: dict[str, list[tuple[float, int]]] = {}
+
+        for account, send_time, recipients in rows:
+            sends.setdefault(account, []).append((now - send_time, recipients))
+
+        if len(sends) > 0:
+            logging.info(f"Counting {sum(row[2] for row in rows)} recipients sent to in the last day against the rate "
+                         f"limits")
+
+        self.shards.seed(sends)
+
+    def _record_delivered(self, key: str, account: str, recipients: list[str]) -> None:
+        """
+        Records the recipients that a chunk of an email was sent to, so that they are not sent to again, and counts
+        them against the rate limits of the account after a restart.
+
+        :param key: The idempotency key of the email
+        :param account: The sender account that sent the chunk
+        :param recipients: The recipients that were sent to
+        """
+
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO delivered (key, email) VALUES (?, ?)", ((key, email) for email in recipients)
+            )
+            self._connection.execute(
+                "INSERT INTO sends (account, time, recipients) VALUES (?, ?, ?)",
+                (account, clock.time(), len(recipients))
+            )
+
+    def _deliver(self, key: str, subject: str, body: str, recipients: str | None, audience: str | None,
+                 priority: int, attempts: int) -> None:
+        """
+        Sends a claimed email, and records the result.
+
+        :param key: The idempotency key of the email
+        :param subject: The subject of the email
+        :param body: The body of the email
+        :param recipients: The JSON list of recipients, or None to send to the audience
+        :param audience: The JSON list of launch attributes to match launch filters against, or None to send to every
+                         subscriber
+        :param priority: The priority of the email
+        :param attempts: The number of failed attempts so far
+        """
+
+        if recipients is None:
+            to = functools.partial(self.audience, None if audience is None else json.loads(audience))
+        else:
+            to = functools.partial(iter, json.loads(recipients))
+
+        with self._lock:
+            rows = self._connection.execute("SELECT email FROM delivered WHERE key = ?", (key,))
+            delivered = {row[0] for row in rows}
+
+        if len(delivered) > 0:
+            logging.info(f"Resuming email {key}, skipping {len(delivered)} recipients that were already sent to")
+            to = functools.partial(_without, to, delivered)
+
+        try:
+            result = self.shards.send(subject, body, to, priority, functools.partial(self._record_delivered, key))
+
+            failed = result.failed
+            error = next(iter(failed.values()), None)
+
+        except Exception as e:
+            # The recipients are unknown if reading them failed, so the whole email is tried again
+            logging.exception(e)
+            failed = None
+            error = str(e)
+
+        with self._lock:
+            if failed is not None and result.interrupted:
+                # The recipients that were sent to are recorded, so the email is resumed when the rate limit allows it.
+                # Until then, the worker is free to send emails with a higher priority.
+                logging.info(f"Putting email {key} back in the queue for {result.retry_seconds:.1f} seconds until the "
+                             f"rate limit allows its remaining recipients")
+                self._connection.execute(
+                    "UPDATE outbox SET status = 'pending', next_attempt = ? WHERE key = ?",
+                    (clock.time() + result.retry_seconds, key)
+                )
+                self._wake.notify()
+                return
+
+            if failed is not None and len(failed) == 0:
+                self._connection.execute("UPDATE outbox SET status = 'sent' WHERE key = ?", (key,))
+                self._connection.execute("DELETE FROM delivered WHERE key = ?", (key,))
+                logging.info(f"Sent email {key}. {self._stats_message()}")
+
+                created = self._connection.execute("SELECT created FROM outbox WHERE key = ?", (key,)).fetchone()[0]
+                _DELIVERY_SECONDS.observe(
+                    clock.time() - created, priority="prelaunch" if priority == PRIORITY_PRELAUNCH else "normal"
+                )
+                _ATTEMPTS.inc(result="sent")
+                return
+
+            attempts += 1
+
+            # Only the recipients that failed are tried again
+            retry_recipients = recipients if failed is None else json.dumps(list(failed))
+
+            if attempts >= self.config["outbox"]["max_attempts"]:
+                logging.error(f"Giving up on email {key} after {attempts} attempts, moving it to the dead-letter queue")
+                status = "dead"
+                self._connection.execute("DELETE FROM delivered WHERE key = ?", (key,))
+            else:
+                status = "pending"
+
+            _ATTEMPTS.inc(result="dead" if status == "dead" else "retry")
+
+            self._connection.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, recipients = ?, last_error = ? "
+                "WHERE key = ?",
+                (status, attempts, clock.time() + self._backoff_seconds(attempts), retry_recipients, error, key)
+            )
+
+            self._wake.notify()
+
+    def _purge_expired(self) -> None:
+        """
+        Deletes the sent emails that are older than keep_sent_days, and the sends that no longer count against any rate
+        limit, so that the database does not grow while the program runs.
+        """
+
+        self.purge(self.config["outbox"]["keep_sent_days"] * 24 * 60 * 60)
+
+    def _work(self) -> None:
+        """
+        Delivers due emails until stop is called, and purges expired rows after every delivery.
+        """
+
+        while True:
+            with self._lock:
+                while not self._stopping:
+                    row = self._claim()
+
+                    if row is not None:
+                        break
+
+                    self._wake.wait(clock.to_real(self._seconds_until_due()))
+
+                if self._stopping:
+                    return
+
+            self._deliver(*row)
+            self._purge_expired()
+
+    def start(self) -> None:
+        """
+        Starts the background delivery workers.
+        """
+
+        for i in range(self.config["outbox"]["workers"]):
+            worker = threading.Thread(target=self._work, name=f"outbox-{i}", daemon=True)
+            worker.start()
+
+            self._workers.append(worker)
+
+    def stop(self) -> None:
+        """
+        Stops the background delivery workers. Emails that are being sent stop before their next chunk, including chunks
+        that are waiting for a rate limit, and are sent to their remaining recipients on the next start.
+        """
+
+        with self._lock:
+            self._stopping = True
+            self._wake.notify_all()
+
+        self.shards.stop()
+
+        for worker in self._workers:
+            worker.join()
+
+        self._workers = []
+
+    def counts(self) -> dict[str, int]:
+        """
+        :return: The number of emails with each status: pending, sending, sent, and dead
+        """
+
+        with self._lock:
+            return dict(self._connection.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+
+    def _stats_message(self) -> str:
+        """
+        Must be called while holding self._lock.
+
+        :return: A description of how many emails are queued and how many recipients were sent to
+        """
+
+        pending = self._connection.execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'").fetchone()[0]
+        governor_stats = self.shards.stats()
+
+        return f"Emails queued: {pending}, recipients waiting for the rate limit: {governor_stats['waiting']}, " \
+               f"recipients sent to: {governor_stats['sent']}"
+
+    def dead_letters(self) -> list[dict]:
+        """
+        :return: The emails that were given up on
+        """
+
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT key, subject, attempts, last_error FROM outbox WHERE status = 'dead'"
+            ).fetchall()
+
+        return [{"key": key, "subject": subject, "attempts": attempts, "last_error": error}
+                for key, subject, attempts, error in rows]
+
+    def purge(self, older_than_seconds: float) -> None:
+        """
+        Deletes sent emails that were queued more than older_than_seconds ago. Their keys no longer prevent duplicates.
+        Also deletes the sends that no longer count against any rate limit, and the delivered recipients of emails that
+        are no longer being sent.
+
+        :param older_than_seconds: The minimum age of the emails to delete
+        """
+
+        now = clock.time()
+
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM outbox WHERE status = 'sent' AND created < ?", (now - older_than_seconds,)
+            )
+            self._connection.execute("DELETE FROM sends WHERE time < ?", (now - _RATE_LIMIT_WINDOW_SECONDS,))
+            self._connection.execute(
+                "DELETE FROM delivered WHERE key NOT IN "
+                "(SELECT key FROM outbox WHERE status IN ('pending', 'sending'))"
+            )
+
+    def close(self) -> None:
+        """
+        Stops the workers and closes the database.
+        """
+
+        self.stop()
+
+        with self._lock:
+            self._connection.close()
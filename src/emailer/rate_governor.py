@@ -0,0 +1,220 @@
+import heapq
+import itertools
+import logging
+import threading
+
+from typing import Iterable
+
+from src.helper import clock
+
+
+# Lower numbers are sent first
+PRIORITY_PRELAUNCH = 0
+PRIORITY_NORMAL = 1
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, period_seconds: float):
+        """
+        Initializes the TokenBucket object, which allows up to capacity sends per period_seconds. Tokens refill
+        continuously, so sends are spread over the period instead of bursting at its start.
+
+        :param capacity: The maximum number of sends per period
+        :param period_seconds: The length of the period
+        """
+
+        self.capacity = capacity
+        self.rate = capacity / period_seconds
+
+        self._tokens = capacity
+        self._updated = clock.monotonic()
+
+    def _refill(self, now: float) -> None:
+        """
+        :param now: The current clock.monotonic() time
+        """
+
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def seconds_until_available(self, n: int, now: float) -> float:
+        """
+        :param n: The number of sends
+        :param now: The current clock.monotonic() time
+        :return: How many seconds until the sends are allowed. More sends than the capacity are allowed once the bucket
+                 is full, and the extra sends are paid back before the next send.
+        """
+
+        self._refill(now)
+
+        return max(0.0, (min(n, self.capacity) - self._tokens) / self.rate)
+
+    def take(self, n: int, now: float) -> None:
+        """
+        :param n: The number of sends
+        :param now: The current clock.monotonic() time
+        """
+
+        self._refill(now)
+        self._tokens -= n
+
+    def seed(self, sends: Iterable[tuple[float, int]], now: float) -> None:
+        """
+        Takes the tokens of sends that were made before the bucket was created, as if the bucket had been full before
+        the first of them.
+
+        :param sends: The clock.monotonic() time and the number of sends of each earlier send, oldest first
+        :param now: The current clock.monotonic() time
+        """
+
+        tokens = self.capacity
+        updated = None
+
+        for send_time, n in sends:
+            if updated is not None:
+                tokens = min(self.capacity, tokens + (send_time - updated) * self.rate)
+
+            tokens -= n
+            updated = send_time
+
+        if updated is None:
+            return
+
+        self._refill(now)
+        self._tokens = min(self._tokens, tokens + (now - updated) * self.rate, self.capacity)
+
+
+class RateGovernor:
+    def __init__(self, config: dict):
+        """
+        Initializes the RateGovernor object, which keeps sends under the per_second, per_minute, and per_day limits in
+        the rate_limit section of the config file. A limit of 0 is not enforced. One send is one recipient, since
+        providers count each recipient of an email against their quotas. Waiting senders with a higher priority go
+        first, and senders that would wait longer than max_wait_seconds are turned away so that they can requeue.
+
+        :param config: The config file data
+        """
+
+        periods = {"per_second": 1, "per_minute": 60, "per_day": 24 * 60 * 60}
+
+        self._buckets = [
+            TokenBucket(config["rate_limit"][limit], period_seconds)
+            for limit, period_seconds in periods.items()
+            if config["rate_limit"][limit] > 0
+        ]
+
+        self._condition = threading.Condition()
+
+        # A min-heap of (priority, sequence number) of the waiting senders. Only the first one may take tokens.
+        self._waiters: list[tuple[int, int]] = []
+        self._counter = itertools.count()
+
+        self.max_wait_seconds = config["rate_limit"]["max_wait_seconds"]
+
+        self.waiting = 0
+        self.sent = 0
+
+        self._stopped = False
+
+    def _seconds_until_available(self, n: int) -> float:
+        """
+        :param n: The number of sends
+        :return: How many seconds until every bucket allows the sends
+        """
+
+        now = clock.monotonic()
+
+        return max((bucket.seconds_until_available(n, now) for bucket in self._buckets), default=0.0)
+
+    def seconds_until_available(self, n: int) -> float:
+        """
+        :param n: The number of sends
+        :return: How many seconds until every limit allows the sends, if no other sender takes them first
+        """
+
+        with self._condition:
+            return self._seconds_until_available(n)
+
+    def seed(self, sends: Iterable[tuple[float, int]]) -> None:
+        """
+        Counts sends that were made before the governor was created, e.g. before a restart, against its limits, so that
+        a restart does not grant a fresh allowance.
+
+        :param sends: How many seconds ago each earlier send was made and its number of recipients, oldest first
+        """
+
+        now = clock.monotonic()
+        sends = [(now - age, n) for age, n in sends]
+
+        with self._condition:
+            for bucket in self._buckets:
+                bucket.seed(sends, now)
+
+    def acquire(self, n: int, priority: int = PRIORITY_NORMAL) -> bool:
+        """
+        Waits until n sends are allowed, and counts them as sent. Gives up without waiting if the sends are not allowed
+        within max_wait_seconds, so that the caller can try again later instead of holding on to its email.
+
+        :param n: The number of sends
+        :param priority: The priority of the sends, e.g. PRIORITY_PRELAUNCH
+        :return: If the sends are allowed, False if they would wait longer than max_wait_seconds or if the governor was
+                 stopped
+        """
+
+        with self._condition:
+            ticket = (priority, next(self._counter))
+            heapq.heappush(self._waiters, ticket)
+            self.waiting += n
+
+            # The first waiter may now be this one
+            self._condition.notify_all()
+
+            try:
+                while not self._stopped:
+                    if self._waiters[0] != ticket:
+                        self._condition.wait()
+                        continue
+
+                    wait_seconds = self._seconds_until_available(n)
+
+                    if wait_seconds <= 0:
+                        now = clock.monotonic()
+
+                        for bucket in self._buckets:
+                            bucket.take(n, now)
+
+                        self.sent += n
+                        return True
+
+                    if wait_seconds > self.max_wait_seconds:
+                        return False
+
+                    logging.info(f"Rate limit reached, waiting {wait_seconds:.1f} seconds to send to {n} recipients")
+
+                    # Woken early if a sender with a higher priority starts waiting, or if the governor is stopped
+                    self._condition.wait(clock.to_real(wait_seconds))
+
+                return False
+
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self.waiting -= n
+                self._condition.notify_all()
+
+    def stop(self) -> None:
+        """
+        Wakes every waiting sender, and makes acquire return False from now on, so that the senders can stop.
+        """
+
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    def stats(self) -> dict[str, int]:
+        """
+        :return: The number of sends that are waiting for the rate limit, and the number of sends that were allowed
+        """
+
+        with self._condition:
+            return {"waiting": self.waiting, "sent": self.sent}
@@ -0,0 +1,242 @@
+import bisect
+import concurrent.futures
+import functools
+import hashlib
+import logging
+import threading
+
+from typing import Callable, Iterable, Iterator
+
+from src.emailer import fanout
+from src.emailer.rate_governor import RateGovernor, PRIORITY_NORMAL
+from src.helper import clock
+
+
+def sender_accounts(secret: dict) -> list[dict]:
+    """
+    :param secret: The secret file data
+    :return: The accounts to send from. Secret files written before several sender accounts were supported only have
+             a sender account, and send from that account.
+    """
+
+    return secret["senders"] if "senders" in secret else [secret["sender"]]
+
+
+def _hash(key: str) -> int:
+    """
+    :param key: The key to hash
+    :return: A stable 64-bit hash of the key
+    """
+
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    def __init__(self, names: list[str], replicas: int = 100):
+        """
+        Initializes the HashRing object, which consistently maps keys to names. Each name is placed on the ring
+        replicas times, so keys are spread evenly, and removing a name only moves the keys that mapped to it.
+
+        :param names: The names to map keys to
+        :param replicas: How many times each name is placed on the ring
+        """
+
+        points = sorted((_hash(f"{name}#{replica}"), name) for name in names for replica in range(replicas))
+
+        self._hashes = [point_hash for point_hash, _ in points]
+        self._names = [name for _, name in points]
+
+    def get(self, key: str, excluded: set[str] = frozenset()) -> str | None:
+        """
+        :param key: The key
+        :param excluded: Names that the key should not map to
+        :return: The name that the key maps to, or None if every name is excluded
+        """
+
+        start = bisect.bisect(self._hashes, _hash(key))
+
+        for i in range(len(self._names)):
+            name = self._names[(start + i) % len(self._names)]
+
+            if name not in excluded:
+                return name
+
+        return None
+
+
+class SenderShards:
+    def __init__(self, accounts: list[dict], config: dict):
+        """
+        Initializes the SenderShards object, which spreads recipients over several sender accounts by consistent
+        hashing. Each account has its own connections and rate limit, so capacity grows with the number of accounts.
+        Accounts that are rejected or rate limited are skipped for account_cooldown_seconds, and their recipients are
+        sent from the other accounts.
+
+        :param accounts: The sender accounts, each with a username and a password
+        :param config: The config file data
+        """
+
+        self.config = config
+
+        self._passwords = {account["username"]: account["password"] for account in accounts}
+        self._ring = HashRing(list(self._passwords))
+        self._governors = {username: RateGovernor(config) for username in self._passwords}
+
+        # When each account that failed can be used again
+        self._cooldowns: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _unavailable(self) -> set[str]:
+        """
+        :return: The accounts that are cooling down after failing
+        """
+
+        now = clock.monotonic()
+
+        with self._lock:
+            return {username for username, until in self._cooldowns.items() if until > now}
+
+    def _cool_down(self, username: str) -> None:
+        """
+        :param username: The account to skip for account_cooldown_seconds
+        """
+
+        logging.warning(f"Sender account {username} was rejected or rate limited, sending from the other accounts")
+
+        with self._lock:
+            self._cooldowns[username] = clock.monotonic() + self.config["delivery"]["account_cooldown_seconds"]
+
+    def _shard(self, recipients: Iterable[str], username: str, excluded: set[str]) -> Iterator[str]:
+        """
+        :param recipients: Every recipient
+        :param username: The account of the shard
+        :param excluded: The accounts that are not sent from
+        :return: The recipients that map to the account
+        """
+
+        for recipient in recipients:
+            if self._ring.get(recipient, excluded) == username:
+                yield recipient
+
+    def _send_shard(self, username: str, subject: str, body: str, to: Iterable[str], priority: int,
+                    on_sent: Callable[[str, list[str]], None] | None) -> fanout.FanoutResult:
+        """
+        :param username: The account to send from
+        :param subject: The subject of the email
+        :param body: The body of the email
+        :param to: The recipients of the shard
+        :param priority: The priority of the email in the rate governor
+        :param on_sent: Called with the account and the recipients of each chunk that was sent
+        :return: The per-recipient results
+        """
+
+        return fanout.send_fanout(
+            username,
+            self._passwords[username],
+            subject,
+            body,
+            to,
+            chunk_size=self.config["delivery"]["chunk_size"],
+            max_workers=self.config["delivery"]["max_workers"],
+            governor=self._governors[username],
+            priority=priority,
+            on_sent=None if on_sent is None else functools.partial(on_sent, username)
+        )
+
+    def send(self, subject: str, body: str, recipients: Callable[[], Iterable[str]],
+             priority: int = PRIORITY_NORMAL,
+             on_sent: Callable[[str, list[str]], None] | None = None) -> fanout.FanoutResult:
+        """
+        Sends an email with every shard delivered in parallel from its own account. The recipients of an account that
+        fails are sent again from the remaining accounts.
+
+        :param subject: The subject of the email
+        :param body: The body of the email
+        :param recipients: A function that returns the recipients. It is called once per shard, so that each shard can
+                           stream the recipients instead of holding them all in memory.
+        :param priority: The priority of the email in the rate governors
+        :param on_sent: Called with the account and the recipients of each chunk that was sent, as soon as it is sent.
+                        It is called from the worker threads.
+        :return: The per-recipient results
+        """
+
+        result = fanout.FanoutResult()
+        excluded = self._unavailable()
+
+        while True:
+            usernames = [username for username in self._passwords if username not in excluded]
+
+            if len(usernames) == 0:
+                logging.error("Every sender account was rejected or rate limited")
+                result.failed.update(dict.fromkeys(recipients(), "every sender account failed"))
+                result.account_error = True
+                return result
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(usernames)) as executor:
+                futures = {
+                    executor.submit(
+                        self._send_shard,
+                        username,
+                        subject,
+                        body,
+                        self._shard(recipients(), username, frozenset(excluded)),
+                        priority,
+                        on_sent
+                    ): username
+                    for username in usernames
+                }
+
+                shard_results = {futures[future]: future.result() for future in futures}
+
+            failed_over: list[str] = []
+
+            for username, shard_result in shard_results.items():
+                if not shard_result.account_error:
+                    result.merge(shard_result)
+                    continue
+
+                self._cool_down(username)
+                excluded.add(username)
+
+                result.sent.extend(shard_result.sent)
+                failed_over.extend(shard_result.failed)
+
+            if len(failed_over) == 0:
+                return result
+
+            # Send the recipients of the failed accounts from the remaining accounts
+            recipients = functools.partial(iter, failed_over)
+
+    def seed(self, sends: dict[str, list[tuple[float, int]]]) -> None:
+        """
+        Counts sends that were made before a restart against the rate limits of their accounts.
+
+        :param sends: A dict of account to how many seconds ago each of its sends was made and its number of
+                      recipients, oldest first. Accounts that are no longer used are ignored.
+        """
+
+        for username, account_sends in sends.items():
+            if username in self._governors:
+                self._governors[username].seed(account_sends)
+
+    def stop(self) -> None:
+        """
+        Stops the rate governors of every account, so that sends that are waiting for a rate limit are interrupted.
+        """
+
+        for governor in self._governors.values():
+            governor.stop()
+
+    def stats(self) -> dict[str, int]:
+        """
+        :return: The number of sends that are waiting for the rate limits, and the number of sends that were allowed,
+                 across every account
+        """
+
+        totals = {"waiting": 0, "sent": 0}
+
+        for governor in self._governors.values():
+            for name, count in governor.stats().items():
+                totals[name] += count
+
+        return totals
@@ -0,0 +1,266 @@
+import contextlib
+import logging
+import smtplib
+import threading
+
+from email.message import EmailMessage
+
+from src.helper import metrics
+
+
+_SEND_SECONDS = metrics.histogram(
+    "launchify_smtp_send_seconds", "Time to send one message over SMTP, including reconnecting"
+)
+_CONNECTIONS = metrics.counter("launchify_smtp_connections_total", "SMTP connections opened")
+
+
+class _SMTP(smtplib.SMTP):
+    """
+    An SMTP connection that remembers if the DATA command was sent, after which the server may have accepted the message
+    even if the connection drops before it replies.
+    """
+
+    data_started = False
+
+    def data(self, msg) -> tuple[int, bytes]:
+        self.data_started = True
+        return super().data(msg)
+
+
+class SMTPPool:
+    def __init__(self, username: str, password: str, smtp_server: str = "smtp.gmail.com", port: int = 587,
+                 max_size: int = 4, starttls: bool = True):
+        """
+        Initializes the SMTPPool object. Connections are opened lazily and kept logged in between sends.
+
+        :param username: The username of the email account to send from
+        :param password: The password of the email account to send from
+        :param smtp_server: The SMTP server to connect to
+        :param port: The port of the SMTP server
+        :param max_size: The maximum number of idle connections to keep open
+        :param starttls: Whether to use STARTTLS. Only local test servers should be used without it.
+        """
+
+        self.username = username
+        self.password = password
+        self.smtp_server = smtp_server
+        self.port = port
+        self.max_size = max_size
+        self.starttls = starttls
+
+        self._idle: list[smtplib.SMTP] = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> smtplib.SMTP:
+        """
+        :return: A new SMTP connection that has completed STARTTLS, if enabled, and logged in
+        """
+
+        logging.info(f"Opening SMTP connection to {self.smtp_server}:{self.port}")
+
+        _CONNECTIONS.inc()
+        smtp = _SMTP(self.smtp_server, self.port)
+
+        try:
+            if self.starttls:
+                smtp.starttls()
+
+            smtp.login(self.username, self.password)
+
+        except Exception:
+            self._close(smtp)
+            raise
+
+        return smtp
+
+    @staticmethod
+    def _close(smtp: smtplib.SMTP) -> None:
+        """
+        Closes the connection, ignoring any errors since the connection may already be dead.
+
+        :param smtp: The connection to close
+        """
+
+        try:
+            smtp.quit()
+
+        except (smtplib.SMTPException, OSError):
+            smtp.close()
+
+    @staticmethod
+    def _is_alive(smtp: smtplib.SMTP) -> bool:
+        """
+        :param smtp: The connection to check
+        :return: If the connection still responds to NOOP
+        """
+
+        try:
+            return smtp.noop()[0] == 250
+
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _acquire(self) -> smtplib.SMTP:
+        """
+        :return: A live idle connection, or a new connection if there are no live idle connections
+        """
+
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+
+                smtp = self._idle.pop()
+
+            if self._is_alive(smtp):
+                return smtp
+
+            logging.info("Dropping dead SMTP connection")
+            self._close(smtp)
+
+        return self._connect()
+
+    def _release(self, smtp: smtplib.SMTP) -> None:
+        """
+        Returns the connection to the pool, or closes it if the pool is full.
+
+        :param smtp: The connection to return
+        """
+
+        with self._lock:
+            if len(self._idle) < self.max_size:
+                self._idle.append(smtp)
+                return
+
+        self._close(smtp)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        A context manager that lends out a logged in connection. The connection is returned to the pool if the body
+        finishes without an error, otherwise it is closed.
+        """
+
+        smtp = self._acquire()
+
+        try:
+            yield smtp
+
+        except BaseException:
+            self._close(smtp)
+            raise
+
+        self._release(smtp)
+
+    def _with_reconnect(self, send_func) -> dict:
+        """
+        Runs send_func on a pooled connection, retrying once on a new connection if the server dropped the connection
+        before the message was sent. If it dropped after the DATA command, the message may have been delivered, so it is
+        counted as sent instead of being sent twice.
+
+        :param send_func: A function that takes a connection and sends over it
+        :return: The return value of send_func, or no refused recipients if the connection dropped after DATA
+        """
+
+        smtp = None
+
+        try:
+            with self.connection() as smtp:
+                smtp.data_started = False
+                return send_func(smtp)
+
+        except smtplib.SMTPServerDisconnected:
+            if smtp is not None and smtp.data_started:
+                logging.warning("SMTP connection dropped after the message was sent, not sending it again")
+                return {}
+
+            logging.warning("SMTP connection dropped while sending, reconnecting")
+
+        with self.connection() as smtp:
+            return send_func(smtp)
+
+    def send(self, msg: EmailMessage, to_addrs: list[str] | None = None) -> dict:
+        """
+        Sends the message over a pooled connection, reconnecting once if the server dropped the connection.
+
+        :param msg: The message to send
+        :param to_addrs: The envelope recipients. If None, the recipients are taken from the message headers.
+        :return: The refused recipients, as returned by smtplib.SMTP.send_message
+        """
+
+        with _SEND_SECONDS.time():
+            return self._with_reconnect(lambda smtp: smtp.send_message(msg, to_addrs=to_addrs))
+
+    def sendmail(self, from_addr: str, to_addrs: list[str], msg: bytes) -> dict:
+        """
+        Sends an already serialized message over a pooled connection, reconnecting once if the server dropped the
+        connection.
+
+        :param from_addr: The envelope sender
+        :param to_addrs: The envelope recipients
+        :param msg: The serialized message
+        :return: The refused recipients, as returned by smtplib.SMTP.sendmail
+        """
+
+        with _SEND_SECONDS.time():
+            return self._with_reconnect(lambda smtp: smtp.sendmail(from_addr, to_addrs, msg))
+
+    def close(self) -> None:
+        """
+        Closes all idle connections.
+        """
+
+        with self._lock:
+            idle, self._idle = self._idle, []
+
+        for smtp in idle:
+            self._close(smtp)
+
+
+_pools: dict[tuple[str, str], SMTPPool] = {}
+_pools_lock = threading.Lock()
+
+# The server that new shared pools connect to
+_server: dict = {"smtp_server": "smtp.gmail.com", "port": 587, "starttls": True}
+
+
+def set_server(smtp_server: str, port: int, starttls: bool = True) -> None:
+    """
+    Sets the SMTP server that shared pools created after this call connect to, e.g. a local server for benchmarks.
+
+    :param smtp_server: The SMTP server to connect to
+    :param port: The port of the SMTP server
+    :param starttls: Whether to use STARTTLS
+    """
+
+    with _pools_lock:
+        _server.update(smtp_server=smtp_server, port=port, starttls=starttls)
+
+
+def get_pool(username: str, password: str) -> SMTPPool:
+    """
+    :param username: The username of the email account to send from
+    :param password: The password of the email account to send from
+    :return: The shared SMTPPool for the account, creating it if it does not exist
+    """
+
+    with _pools_lock:
+        pool = _pools.get((username, password))
+
+        if pool is None:
+            pool = SMTPPool(username, password, **_server)
+            _pools[(username, password)] = pool
+
+        return pool
+
+
+def close_all() -> None:
+    """
+    Closes every idle connection in every shared pool.
+    """
+
+    with _pools_lock:
+        pools = list(_pools.values())
+
+    for pool in pools:
+        pool.close()
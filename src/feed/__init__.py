@@ -0,0 +1,4 @@
+from .feed_client import FeedClient, FeedError
+from .launch_cache import LaunchCache
+from .launch import Launch
+from .launch_diff import LaunchDelta, LaunchDiffer
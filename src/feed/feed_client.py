@@ -0,0 +1,196 @@
+import datetime
+import hashlib
+import logging
+import zoneinfo
+
+from src.helper import clock
+from src.helper import dt_helper
+from src.helper import metrics
+
+import requests
+
+
+_REQUEST_SECONDS = metrics.histogram("launchify_feed_request_seconds", "Time to fetch one page of the launch feed")
+_REQUESTS = metrics.counter("launchify_feed_requests_total", "Launch feed page requests, by status code")
+
+
+class FeedError(Exception):
+    """
+    Raised when the launch feed could not be fetched.
+    """
+
+
+class FeedClient:
+    def __init__(self, url: str, connect_timeout: float, read_timeout: float, max_pages: int = 1,
+                 horizon_hours: float | None = None):
+        """
+        Initializes the FeedClient object, which fetches the launch feed over a keep-alive session and remembers the
+        last response of each page so that unchanged responses can be skipped.
+
+        :param url: The URL of the launch feed
+        :param connect_timeout: The maximum number of seconds to wait for a connection
+        :param read_timeout: The maximum number of seconds to wait between bytes of the response
+        :param max_pages: The maximum number of pages to fetch. If this is 1, the page parameter is not sent.
+        :param horizon_hours: Stop fetching pages once a page has a launch more than this many hours away. If None,
+                              pages are fetched until the last page or max_pages.
+        """
+
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_pages = max_pages
+        self.horizon_hours = horizon_hours
+
+        self._session = requests.Session()
+
+        # The validators, body hash, and launches of each page that was fetched
+        self._pages: list[dict] = []
+
+        # The launches of every page merged by launch ID, in the "result" key like the API responses
+        self.data: dict | None = None
+
+    def seed(self, data: dict) -> None:
+        """
+        Uses launch data from another source, such as the launch cache, until the feed is fetched.
+
+        :param data: The launch data
+        """
+
+        self.data = data
+
+    @staticmethod
+    def _conditional_headers(page: dict) -> dict:
+        """
+        :param page: The state of the page
+        :return: The headers that ask the server to only send the page if it changed
+        """
+
+        headers = {}
+
+        if page["etag"] is not None:
+            headers["If-None-Match"] = page["etag"]
+
+        if page["last_modified"] is not None:
+            headers["If-Modified-Since"] = page["last_modified"]
+
+        return headers
+
+    def _fetch_page(self, page: dict, page_number: int) -> bool:
+        """
+        Fetches one page of the launch feed and updates its state.
+
+        :param page: The state of the page, updated in place
+        :param page_number: The number of the page, starting at 1
+        :return: If the page changed since it was last fetched
+        :raises FeedError: If the page could not be fetched
+        """
+
+        params = {"page": page_number} if self.max_pages > 1 else None
+
+        try:
+            with _REQUEST_SECONDS.time():
+                response = self._session.get(
+                    self.url, params=params, headers=self._conditional_headers(page), timeout=self.timeout
+                )
+
+        except requests.RequestException as e:
+            _REQUESTS.inc(status="error")
+            raise FeedError(f"API request failed: {e}") from e
+
+        _REQUESTS.inc(status=str(response.status_code))
+
+        if response.status_code == 304 and page["body"] is not None:
+            return False
+
+        if response.status_code != 200:
+            raise FeedError(f"API error: got status code {response.status_code}. Response: {response.text}")
+
+        body_hash = hashlib.sha256(response.content).digest()
+
+        if body_hash != page["body_hash"]:
+            try:
+                page["body"] = response.json()
+
+            except ValueError as e:
+                raise FeedError(f"API returned invalid JSON: {e}") from e
+
+        # Only remember the validators of a response that was parsed
+        page["etag"] = response.headers.get("ETag")
+        page["last_modified"] = response.headers.get("Last-Modified")
+
+        if body_hash == page["body_hash"]:
+            return False
+
+        page["body_hash"] = body_hash
+        return True
+
+    def _is_last_page(self, body: dict, page_number: int) -> bool:
+        """
+        :param body: The JSON of the page
+        :param page_number: The number of the page, starting at 1
+        :return: If no more pages should be fetched after this page
+        """
+
+        if page_number >= self.max_pages or len(body["result"]) == 0:
+            return True
+
+        if "last_page" in body and page_number >= body["last_page"]:
+            return True
+
+        if self.horizon_hours is None:
+            return False
+
+        utc = zoneinfo.ZoneInfo("UTC")
+        horizon = clock.now(utc) + datetime.timedelta(hours=self.horizon_hours)
+
+        return any(
+            isinstance(launch.get("t0"), str) and dt_helper.load_isoformat(launch["t0"], utc) > horizon
+            for launch in body["result"]
+        )
+
+    def fetch(self) -> bool:
+        """
+        Fetches the pages of the launch feed and merges their launches by launch ID. The merged launches are stored in
+        self.data.
+
+        :return: If the feed changed since the last fetch
+        :raises FeedError: If any page could not be fetched. The pages are then left as they were.
+        """
+
+        pages: list[dict] = []
+        changed = False
+
+        for page_number in range(1, self.max_pages + 1):
+            if page_number <= len(self._pages):
+                page = dict(self._pages[page_number - 1])
+            else:
+                page = {"etag": None, "last_modified": None, "body_hash": None, "body": None}
+
+            changed = self._fetch_page(page, page_number) or changed
+            pages.append(page)
+
+            if self._is_last_page(page["body"], page_number):
+                break
+
+        changed = changed or len(pages) != len(self._pages) or self.data is None
+        self._pages = pages
+
+        if not changed:
+            return False
+
+        merged: dict[str, dict] = {}
+
+        for page in pages:
+            for launch in page["body"]["result"]:
+                merged[launch["id"]] = launch
+
+        logging.info(f"Launch data changed, tracking {len(merged)} launches from {len(pages)} pages")
+
+        self.data = {"result": list(merged.values())}
+        return True
+
+    def close(self) -> None:
+        """
+        Closes the session.
+        """
+
+        self._session.close()
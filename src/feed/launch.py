@@ -0,0 +1,85 @@
+import datetime
+import zoneinfo
+
+from src.helper import dt_helper
+
+
+_UTC = zoneinfo.ZoneInfo("UTC")
+
+
+class Launch:
+    __slots__ = ("launch_id", "name", "provider", "vehicle", "launch_pad", "launch_site", "t0", "_local_t0",
+                 "_local_tz")
+
+    def __init__(self, launch_id: str, name: str, provider: str, vehicle: str, launch_pad: str, launch_site: str,
+                 t0: datetime.datetime | None):
+        """
+        Initializes the Launch object.
+
+        :param launch_id: The unique launch ID. The numeric IDs of the API are converted to strings.
+        :param name: The name of the mission
+        :param provider: The name of the launch provider
+        :param vehicle: The name of the launch vehicle
+        :param launch_pad: The name of the launch pad
+        :param launch_site: The name of the launch site
+        :param t0: The timezone-aware launch time, or None if the launch time is not known yet
+        """
+
+        self.launch_id = launch_id
+        self.name = name
+        self.provider = provider
+        self.vehicle = vehicle
+        self.launch_pad = launch_pad
+        self.launch_site = launch_site
+        self.t0 = t0
+
+        # The launch time in the last timezone it was converted to
+        self._local_t0: datetime.datetime | None = None
+        self._local_tz: zoneinfo.ZoneInfo | None = None
+
+    @classmethod
+    def from_api(cls, launch_data: dict) -> "Launch":
+        """
+        :param launch_data: The launch data from the API
+        :return: The launch
+        :raises ValueError: If the launch data is missing a field or has a field of the wrong type
+        """
+
+        try:
+            t0 = launch_data["t0"]
+
+            return cls(
+                launch_id=str(launch_data["id"]),
+                name=str(launch_data["name"]),
+                provider=str(launch_data["provider"]["name"]),
+                vehicle=str(launch_data["vehicle"]["name"]),
+                launch_pad=str(launch_data["pad"]["name"]),
+                launch_site=str(launch_data["pad"]["location"]["name"]),
+                t0=dt_helper.load_isoformat(t0, _UTC) if isinstance(t0, str) else None
+            )
+
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"malformed launch data: missing or invalid {e}") from e
+
+    def filter_terms(self) -> list[str]:
+        """
+        :return: The attributes of the launch that subscribers can filter launches by
+        """
+
+        return [self.provider, self.vehicle, self.launch_site]
+
+    def t0_in(self, timezone: zoneinfo.ZoneInfo) -> datetime.datetime | None:
+        """
+        :param timezone: The timezone to convert the launch time to
+        :return: The launch time in the timezone, or None if the launch time is not known yet
+        """
+
+        if self.t0 is None:
+            return None
+
+        if timezone is not self._local_tz:
+            self._local_t0 = self.t0.astimezone(timezone)
+            self._local_tz = timezone
+
+        return self._local_t0
+
@@ -0,0 +1,50 @@
+import json
+import logging
+import os
+
+
+class LaunchCache:
+    def __init__(self, path: str):
+        """
+        Initializes the LaunchCache object, which keeps the last launch feed on disk so that reminders can be scheduled
+        at startup before the API responds.
+
+        :param path: The path of the cache file
+        """
+
+        self.path = path
+
+    def load(self) -> dict | None:
+        """
+        :return: The cached launch feed, or None if there is no usable cache
+        """
+
+        if not os.path.exists(self.path):
+            return None
+
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not load the launch cache {self.path}: {e}")
+            return None
+
+        logging.info(f"Loaded {len(data['result'])} launches from the launch cache")
+        return data
+
+    def save(self, data: dict) -> None:
+        """
+        Writes the launch feed compactly. The file is replaced atomically so that a crash can not leave a torn file.
+
+        :param data: The launch feed
+        """
+
+        tmp_path = self.path + ".tmp"
+
+        with open(tmp_path, "w") as f:
+            json.dump({"result": data["result"]}, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, self.path)
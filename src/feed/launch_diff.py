@@ -0,0 +1,90 @@
+import hashlib
+import json
+import logging
+
+from src.feed.launch import Launch
+
+
+class LaunchDelta:
+    def __init__(self):
+        """
+        Initializes the LaunchDelta object, which holds the launches that changed between two feed responses.
+        """
+
+        self.added: list[Launch] = []
+        self.changed: list[Launch] = []
+
+
+class LaunchDiffer:
+    def __init__(self):
+        """
+        Initializes the LaunchDiffer object, which remembers a fingerprint of every launch it has seen so that only the
+        launches that changed are decoded and passed on.
+        """
+
+        self._fingerprints: dict[str, bytes] = {}
+
+        # The decoded launches of the last response, by launch ID
+        self.launches: dict[str, Launch] = {}
+
+    def filter_terms(self) -> set[str]:
+        """
+        Can be called from another thread than diff, since diff replaces self.launches instead of changing it.
+
+        :return: The providers, vehicles, and launch sites of the launches of the last response
+        """
+
+        return {term for launch in self.launches.values() for term in launch.filter_terms()}
+
+    @staticmethod
+    def _fingerprint(launch_data: dict) -> bytes:
+        """
+        :param launch_data: The launch data from the API
+        :return: A digest that changes whenever any field of the launch changes
+        """
+
+        return hashlib.blake2b(
+            json.dumps(launch_data, sort_keys=True, separators=(",", ":")).encode(),
+            digest_size=16
+        ).digest()
+
+    def diff(self, api_response: dict) -> LaunchDelta:
+        """
+        :param api_response: The API response
+        :return: The launches that were added or changed since the last call. Malformed launches are logged
+                 and left out.
+        """
+
+        delta = LaunchDelta()
+        fingerprints: dict[str, bytes] = {}
+        launches: dict[str, Launch] = {}
+
+        for launch_data in api_response["result"]:
+            fingerprint = self._fingerprint(launch_data)
+            launch_id = str(launch_data.get("id"))
+
+            previous = self._fingerprints.get(launch_id)
+
+            if previous == fingerprint:
+                fingerprints[launch_id] = fingerprint
+                launches[launch_id] = self.launches[launch_id]
+                continue
+
+            try:
+                launch = Launch.from_api(launch_data)
+
+            except ValueError as e:
+                logging.warning(f"Skipping launch {launch_id}: {e}")
+                continue
+
+            fingerprints[launch_id] = fingerprint
+            launches[launch_id] = launch
+
+            if previous is None:
+                delta.added.append(launch)
+            else:
+                delta.changed.append(launch)
+
+        self._fingerprints = fingerprints
+        self.launches = launches
+        return delta
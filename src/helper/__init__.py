@@ -1,2 +1,5 @@
+from . import clock
 from . import config_loader
 from . import dt_helper
+from . import poll_policy
+from . import metrics
@@ -0,0 +1,138 @@
+import datetime
+import threading
+import time as _time
+
+
+class Clock:
+    """
+    The wall clock. Every time and timeout of the program goes through the current clock, so that a replay can run the
+    program faster than real time.
+    """
+
+    def time(self) -> float:
+        """
+        :return: The current time as seconds since the epoch
+        """
+
+        return _time.time()
+
+    def monotonic(self) -> float:
+        """
+        :return: A time in seconds that never goes backwards, for measuring intervals
+        """
+
+        return _time.monotonic()
+
+    def now(self, tz: datetime.tzinfo | None = None) -> datetime.datetime:
+        """
+        :param tz: The timezone. If None, the naive local time is returned.
+        :return: The current time
+        """
+
+        return datetime.datetime.now(tz)
+
+    def to_real(self, seconds: float | None) -> float | None:
+        """
+        :param seconds: A duration on this clock, e.g. a timeout, or None
+        :return: How many real seconds the duration takes, or None if it was None
+        """
+
+        return seconds
+
+
+class ScaledClock(Clock):
+    def __init__(self, start: float, speed: float):
+        """
+        Initializes the ScaledClock object, a clock that starts at the given time and runs speed times faster than real
+        time. Timeouts are shortened to match, so waiting for 30 seconds on a clock with a speed of 1000 takes 30 real
+        milliseconds.
+
+        :param start: The time that the clock starts at, as seconds since the epoch
+        :param speed: How many seconds pass on this clock per real second
+        """
+
+        self.start = start
+        self.speed = speed
+
+        self._real_start = _time.monotonic()
+
+    def _elapsed(self) -> float:
+        """
+        :return: How many seconds passed on this clock since it started
+        """
+
+        return (_time.monotonic() - self._real_start) * self.speed
+
+    def time(self) -> float:
+        return self.start + self._elapsed()
+
+    def monotonic(self) -> float:
+        return self._elapsed()
+
+    def now(self, tz: datetime.tzinfo | None = None) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(self.time(), tz)
+
+    def to_real(self, seconds: float | None) -> float | None:
+        if seconds is None:
+            return None
+
+        return seconds / self.speed
+
+
+_clock = Clock()
+_clock_lock = threading.Lock()
+
+
+def set_clock(clock: Clock) -> None:
+    """
+    Replaces the clock of the whole program. Must be called before anything reads the time.
+
+    :param clock: The new clock
+    """
+
+    global _clock
+
+    with _clock_lock:
+        _clock = clock
+
+
+def get_clock() -> Clock:
+    """
+    :return: The clock of the program
+    """
+
+    return _clock
+
+
+def time() -> float:
+    """
+    :return: The current time as seconds since the epoch, on the clock of the program
+    """
+
+    return _clock.time()
+
+
+def monotonic() -> float:
+    """
+    :return: A time in seconds that never goes backwards, on the clock of the program
+    """
+
+    return _clock.monotonic()
+
+
+def now(tz: datetime.tzinfo | None = None) -> datetime.datetime:
+    """
+    :param tz: The timezone. If None, the naive local time is returned.
+    :return: The current time, on the clock of the program
+    """
+
+    return _clock.now(tz)
+
+
+def to_real(seconds: float | None) -> float | None:
+    """
+    :param seconds: A duration on the clock of the program, e.g. a timeout, or None
+    :return: How many real seconds the duration takes, or None if it was None
+    """
+
+    return _clock.to_real(seconds)
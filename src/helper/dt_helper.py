@@ -1,6 +1,9 @@
 import datetime
+import functools
 import zoneinfo
 
+from src.helper import clock
+
 
 def load_isoformat(isoformat: str, to_convert: zoneinfo.ZoneInfo) -> datetime.datetime:
     """
@@ -12,7 +15,7 @@ def load_isoformat(isoformat: str, to_convert: zoneinfo.ZoneInfo) -> datetime.da
     :return: The datetime.datetime object
     """
 
-    return datetime.datetime.fromisoformat(isoformat).replace(tzinfo=zoneinfo.ZoneInfo("UTC")).astimezone(to_convert)
+    return datetime.datetime.fromisoformat(isoformat).replace(tzinfo=_load_timezone("UTC")).astimezone(to_convert)
 
 
 def get_now(config: dict) -> datetime.datetime:
@@ -23,7 +26,7 @@ def get_now(config: dict) -> datetime.datetime:
     :return: The current time in the timezone specified in the config file
     """
 
-    return datetime.datetime.now(get_timezone(config))
+    return clock.now(get_timezone(config))
 
 
 def get_timezone(config: dict) -> zoneinfo.ZoneInfo:
@@ -34,4 +37,14 @@ def get_timezone(config: dict) -> zoneinfo.ZoneInfo:
     :return: The timezone specified in the config file
     """
 
-    return zoneinfo.ZoneInfo(config["timezone"])
+    return _load_timezone(config["timezone"])
+
+
+@functools.lru_cache(maxsize=None)
+def _load_timezone(key: str) -> zoneinfo.ZoneInfo:
+    """
+    :param key: The timezone identifier
+    :return: The timezone. The same object is returned for the same identifier.
+    """
+
+    return zoneinfo.ZoneInfo(key)
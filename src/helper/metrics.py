@@ -0,0 +1,511 @@
+import contextlib
+import cProfile
+import http.server
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+from typing import Callable
+
+from src.helper import clock
+
+
+# Upper bounds of the histogram buckets, in seconds, for network round trips and ticks
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Upper bounds of the histogram buckets, in seconds, for how late notifications are sent
+LAG_BUCKETS = (0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 900.0, 3600.0)
+
+
+def _label_key(labels: dict[str, str]) -> tuple[tuple[str, str], ...]:
+    """
+    :param labels: The labels of a sample
+    :return: The labels in a hashable, ordered form
+    """
+
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: tuple[tuple[str, str], ...], extra: tuple[tuple[str, str], ...] = ()) -> str:
+    """
+    :param key: The labels of a sample, as returned by _label_key
+    :param extra: Labels to add after them, e.g. the le label of a histogram bucket
+    :return: The labels in the Prometheus text format, e.g. {status="sent"}, or an empty string if there are none
+    """
+
+    pairs = key + extra
+
+    if len(pairs) == 0:
+        return ""
+
+    escaped = (name + "=\"" + value.replace("\\", "\\\\").replace("\"", "\\\"") + "\"" for name, value in pairs)
+
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    """
+    :param value: A sample value
+    :return: The value in the Prometheus text format
+    """
+
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+
+    return repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        """
+        Initializes the Counter object, a count that only goes up, such as the number of emails sent.
+
+        :param name: The name of the metric
+        :param help_text: What the metric counts
+        """
+
+        self.name = name
+        self.help_text = help_text
+
+        self._lock = threading.Lock()
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """
+        :param amount: How much to add to the count
+        :param labels: The labels of the count, e.g. status="sent"
+        """
+
+        key = _label_key(labels)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> list[tuple[tuple, float]]:
+        """
+        :return: The labels and value of each count
+        """
+
+        with self._lock:
+            return list(self._values.items())
+
+    def render(self) -> list[str]:
+        """
+        :return: The lines of the metric in the Prometheus text format, without the HELP and TYPE lines
+        """
+
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in self.samples()]
+
+    def snapshot(self) -> list[dict]:
+        """
+        :return: The labels and value of each count, as JSON
+        """
+
+        return [{"labels": dict(key), "value": value} for key, value in self.samples()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str):
+        """
+        Initializes the Gauge object, a value that can go up and down, such as the number of queued emails. A gauge
+        can be set directly, or read from a function whenever the metrics are collected.
+
+        :param name: The name of the metric
+        :param help_text: What the metric measures
+        """
+
+        super().__init__(name, help_text)
+
+        self._functions: dict[tuple, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        """
+        :param value: The new value
+        :param labels: The labels of the value
+        """
+
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        """
+        :param function: Returns the value whenever the metrics are collected. It replaces any earlier function with
+                         the same labels.
+        :param labels: The labels of the value
+        """
+
+        with self._lock:
+            self._functions[_label_key(labels)] = function
+
+    def samples(self) -> list[tuple[tuple, float]]:
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+
+        for key, function in functions:
+            try:
+                values[key] = function()
+
+            except Exception as e:
+                # The object that the function reads from may have been closed
+                logging.debug(f"Could not collect {self.name}: {e}")
+
+        return list(values.items())
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        """
+        Initializes the Histogram object, which counts observations, such as durations, in buckets, and keeps their
+        count, sum, and maximum.
+
+        :param name: The name of the metric
+        :param help_text: What the metric observes
+        :param buckets: The upper bounds of the buckets, in ascending order
+        """
+
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets) + (math.inf,)
+
+        self._lock = threading.Lock()
+
+        # The bucket counts, count, sum, and maximum of each label set
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """
+        :param value: The observation
+        :param labels: The labels of the observation
+        """
+
+        key = _label_key(labels)
+
+        with self._lock:
+            values = self._values.get(key)
+
+            if values is None:
+                values = self._values[key] = [[0] * len(self.buckets), 0, 0.0, -math.inf]
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[0][i] += 1
+                    break
+
+            values[1] += 1
+            values[2] += value
+            values[3] = max(values[3], value)
+
+    @contextlib.contextmanager
+    def time(self, **labels: str):
+        """
+        A context manager that observes how many seconds its body took, including when the body raises.
+
+        :param labels: The labels of the observation
+        """
+
+        start = time.perf_counter()
+
+        try:
+            yield
+
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> list[tuple[tuple, list[int], int, float, float]]:
+        """
+        :return: The labels, bucket counts, count, sum, and maximum of each label set
+        """
+
+        with self._lock:
+            return [(key, list(buckets), count, total, maximum) for key, (buckets, count, total, maximum)
+                    in self._values.items()]
+
+    def render(self) -> list[str]:
+        """
+        :return: The lines of the metric in the Prometheus text format, without the HELP and TYPE lines
+        """
+
+        lines = []
+
+        for key, buckets, count, total, _ in self.samples():
+            cumulative = 0
+
+            for bound, bucket_count in zip(self.buckets, buckets):
+                cumulative += bucket_count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} {cumulative}"
+                )
+
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+
+        return lines
+
+    def snapshot(self) -> list[dict]:
+        """
+        :return: The labels, count, sum, mean, maximum, and bucket counts of each label set, as JSON
+        """
+
+        return [
+            {
+                "labels": dict(key),
+                "count": count,
+                "sum": total,
+                "mean": total / count,
+                "max": maximum,
+                "buckets": {("+Inf" if math.isinf(bound) else str(bound)): bucket_count
+                            for bound, bucket_count in zip(self.buckets, buckets)}
+            }
+            for key, buckets, count, total, maximum in self.samples()
+        ]
+
+
+_metrics: dict[str, Counter | Gauge | Histogram] = {}
+_metrics_lock = threading.Lock()
+
+
+def _register(metric_class: type, name: str, *args):
+    """
+    :param metric_class: The class of the metric
+    :param name: The name of the metric
+    :param args: The other arguments of the class
+    :return: The metric with the name, created if it does not exist yet
+    """
+
+    with _metrics_lock:
+        metric = _metrics.get(name)
+
+        if metric is None:
+            metric = _metrics[name] = metric_class(name, *args)
+
+        elif type(metric) is not metric_class:
+            raise ValueError(f"{name} is already a {metric.kind}")
+
+        return metric
+
+
+def counter(name: str, help_text: str) -> Counter:
+    """
+    :param name: The name of the metric
+    :param help_text: What the metric counts
+    :return: The shared counter with the name
+    """
+
+    return _register(Counter, name, help_text)
+
+
+def gauge(name: str, help_text: str) -> Gauge:
+    """
+    :param name: The name of the metric
+    :param help_text: What the metric measures
+    :return: The shared gauge with the name
+    """
+
+    return _register(Gauge, name, help_text)
+
+
+def histogram(name: str, help_text: str, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+    """
+    :param name: The name of the metric
+    :param help_text: What the metric observes
+    :param buckets: The upper bounds of the buckets, in ascending order
+    :return: The shared histogram with the name
+    """
+
+    return _register(Histogram, name, help_text, buckets)
+
+
+def render() -> str:
+    """
+    :return: Every metric in the Prometheus text exposition format
+    """
+
+    with _metrics_lock:
+        metrics = sorted(_metrics.values(), key=lambda metric: metric.name)
+
+    lines = []
+
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+
+    return "\n".join(lines) + "\n"
+
+
+def snapshot() -> dict:
+    """
+    :return: Every metric as JSON, with the time it was collected
+    """
+
+    with _metrics_lock:
+        metrics = sorted(_metrics.values(), key=lambda metric: metric.name)
+
+    return {
+        "time": clock.time(),
+        "metrics": {
+            metric.name: {"type": metric.kind, "help": metric.help_text, "samples": metric.snapshot()}
+            for metric in metrics
+        }
+    }
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = render().encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(port: int, host: str = "127.0.0.1") -> http.server.ThreadingHTTPServer:
+    """
+    Serves the metrics at /metrics in the Prometheus text format on a background thread.
+
+    :param port: The port to listen on
+    :param host: The address to listen on. Keep this on localhost unless the port is firewalled.
+    :return: The server, which can be stopped with shutdown
+    """
+
+    server = http.server.ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logging.info(f"Serving metrics at http://{host}:{server.server_address[1]}/metrics")
+
+    return server
+
+
+def write_snapshot(path: str) -> None:
+    """
+    Writes every metric as JSON. The file is replaced atomically, so a reader never sees a partial file.
+
+    :param path: The path of the file
+    """
+
+    tmp_path = path + ".tmp"
+
+    with open(tmp_path, "w") as f:
+        json.dump(snapshot(), f, indent=2)
+
+    os.replace(tmp_path, path)
+
+
+def dump_periodically(path: str, interval_seconds: float, stopping: threading.Event) -> threading.Thread:
+    """
+    Writes every metric as JSON every interval_seconds on a background thread, and once more when stopping is set.
+
+    :param path: The path of the file
+    :param interval_seconds: How many seconds to wait between writes
+    :param stopping: Set to stop writing
+    :return: The thread
+    """
+
+    def dump() -> None:
+        while not stopping.wait(interval_seconds):
+            try:
+                write_snapshot(path)
+
+            except OSError as e:
+                logging.error(f"Could not write the metrics to {path}: {e}")
+
+        write_snapshot(path)
+
+    thread = threading.Thread(target=dump, name="metrics-dump", daemon=True)
+    thread.start()
+
+    return thread
+
+
+class SlowTickProfiler:
+    # cProfile can only profile one thread at a time in newer Python versions, so ticks are profiled one at a time
+    _active = threading.Lock()
+
+    def __init__(self, directory: str, threshold_seconds: float, sample_every: int = 1):
+        """
+        Initializes the SlowTickProfiler object, which profiles a sample of ticks with cProfile and keeps the profiles
+        of the ticks that were slower than threshold_seconds, so that a slow tick in production can be looked at later
+        with pstats or snakeviz.
+
+        :param directory: The directory to write the profiles to. It is created if it does not exist.
+        :param threshold_seconds: Ticks slower than this are kept. If 0, nothing is profiled.
+        :param sample_every: Profile one in every this many ticks of each task, since profiling slows the tick down
+        """
+
+        self.directory = directory
+        self.threshold_seconds = threshold_seconds
+        self.sample_every = max(1, sample_every)
+
+        self._lock = threading.Lock()
+        self._ticks: dict[str, int] = {}
+
+    def _next_tick(self, task: str) -> int:
+        """
+        :param task: The name of the task
+        :return: The number of the next tick of the task, starting at 0
+        """
+
+        with self._lock:
+            tick = self._ticks.get(task, 0)
+            self._ticks[task] = tick + 1
+
+        return tick
+
+    @contextlib.contextmanager
+    def profile(self, task: str):
+        """
+        A context manager that profiles its body if this tick is sampled, and writes the profile if the body was slow.
+
+        :param task: The name of the task, which is put in the file name of the profile
+        """
+
+        tick = self._next_tick(task)
+
+        if self.threshold_seconds <= 0 or tick % self.sample_every != 0 or not self._active.acquire(blocking=False):
+            yield
+            return
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+
+        try:
+            profiler.enable()
+
+            try:
+                yield
+
+            finally:
+                profiler.disable()
+
+            duration = time.perf_counter() - start
+
+            if duration > self.threshold_seconds:
+                os.makedirs(self.directory, exist_ok=True)
+
+                path = os.path.join(self.directory, f"{task}-{time.strftime('%Y%m%d-%H%M%S')}-{tick}.prof")
+                profiler.dump_stats(path)
+
+                logging.warning(f"Slow {task} tick took {duration:.3f} seconds, wrote its profile to {path}")
+
+        finally:
+            self._active.release()
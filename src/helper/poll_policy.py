@@ -0,0 +1,54 @@
+import datetime
+import logging
+
+
+class PollPolicy:
+    def __init__(self, config: dict):
+        """
+        Initializes the PollPolicy object, which decides how long to wait between API polls. It polls every
+        refresh_seconds while a launch is near or its T-0 changed recently, and backs off exponentially up to
+        max_refresh_seconds otherwise.
+
+        :param config: The config file data
+        """
+
+        self.config = config
+        self.interval: float = config["refresh"]["refresh_seconds"]
+
+    def is_active(self, now: datetime.datetime, launch_is_near: bool,
+                  last_rescheduled: datetime.datetime | None) -> bool:
+        """
+        :param now: The current time
+        :param launch_is_near: If a prelaunch reminder is due soon, or was sent and has not expired yet
+        :param last_rescheduled: When a T-0 last changed, or None if no T-0 changed
+        :return: If the launch data should be polled as often as possible
+        """
+
+        t0_is_volatile = last_rescheduled is not None and now - last_rescheduled <= datetime.timedelta(
+            minutes=self.config["refresh"]["volatile_minutes"]
+        )
+
+        return launch_is_near or t0_is_volatile
+
+    def next_interval(self, now: datetime.datetime, launch_is_near: bool,
+                      last_rescheduled: datetime.datetime | None) -> float:
+        """
+        :param now: The current time
+        :param launch_is_near: If a prelaunch reminder is due soon, or was sent and has not expired yet
+        :param last_rescheduled: When a T-0 last changed, or None if no T-0 changed
+        :return: How many seconds to wait until the next poll
+        """
+
+        refresh_config = self.config["refresh"]
+        previous_interval = self.interval
+
+        if not refresh_config["adaptive"] or self.is_active(now, launch_is_near, last_rescheduled):
+            self.interval = refresh_config["refresh_seconds"]
+
+        else:
+            self.interval = min(self.interval * refresh_config["backoff_factor"], refresh_config["max_refresh_seconds"])
+
+        if self.interval != previous_interval:
+            logging.info(f"Polling the launch data every {self.interval} seconds")
+
+        return self.interval
@@ -1,84 +1,122 @@
 import datetime
 import logging
-import time
+import threading
 
 from . import subscriber
 from . import notifs
 from . import helper
+from . import feed
+from . import recording
+from . import runtime
 from .emailer import email_receiver
+from .emailer import outbox
+from .emailer import sharding
+from .emailer import smtp_pool
 
-import requests
 
-
-def request_api() -> requests.Response:
+def run(config: dict, secret: dict, feed_client: feed.FeedClient, receiver: email_receiver.EmailReceiver,
+        until: datetime.datetime | None = None) -> None:
     """
-    :return: The JSON response from the API
+    Runs the program until the exit time, the end time, or until it is stopped.
+
+    :param config: The config file data
+    :param secret: The secret file data
+    :param feed_client: The launch feed client, or a stand-in such as recording.ReplayFeedClient
+    :param receiver: The inbox receiver, or a stand-in such as recording.ReplayReceiver
+    :param until: A timezone-aware time to stop at. If None, the program runs until the exit time or until it is
+           stopped.
     """
 
-    return requests.get("https://fdo.rocketlaunch.live/json/launches/next/5")
+    store = subscriber.store.SubscriberStore(config["subscription"]["database_file"])
 
+    # Subscribers used to be kept in the secret file
+    if store.migrate_secret(secret):
+        helper.config_loader.write_json("config/secret.json", secret)
 
-def should_exit(config: dict) -> bool:
-    """
-    :return: If the program should exit
-    """
+    # Emails are queued here and sent in the background, so a slow or failing mail server never blocks the scheduler
+    mail_outbox = outbox.Outbox(config["outbox"]["database_file"], config, secret, store.iter_audience)
+    mail_outbox.start()
+
+    launch_cache = feed.LaunchCache(config["api"]["cache_file"])
+    cached_data = launch_cache.load()
+
+    # Schedule from the launch cache right away. The first poll of the feed thread brings it up to date.
+    if cached_data is not None:
+        feed_client.seed(cached_data)
+
+    # If the API doesn't return 200 here honestly idk what to do
+    else:
+        feed_client.fetch()
+        launch_cache.save(feed_client.data)
+
+    launch_differ = feed.LaunchDiffer()
+    startup_delta = launch_differ.diff(feed_client.data)
+
+    daily_notifs = notifs.daily.DailyNotifList(config, mail_outbox, store.filter_groups)
+    daily_notifs.update(launch_differ.launches.values())
 
-    if not config["exit"]["should_exit"]:
-        return False
+    reminder_list = notifs.prelaunch.ReminderList(
+        config,
+        mail_outbox,
+        notifs.ReminderState(config["reminders"]["prelaunch"]["state_file"])
+    )
+    reminder_list.apply_delta(startup_delta)
 
-    exit_datetime = datetime.datetime.combine(datetime.datetime.today(), config["exit"]["exit_time"])
+    sub = subscriber.subscriber.Subscriber(receiver, config, store, mail_outbox, launch_differ.filter_terms)
 
-    diff = abs(datetime.datetime.now() - exit_datetime)
-    exit_margin = datetime.timedelta(seconds=config["refresh"]["refresh_seconds"] * 3)
+    runtime.Runtime(config, feed_client, launch_cache, launch_differ, daily_notifs, reminder_list, sub, until).run()
 
-    return diff < exit_margin
+    sub.close()
+    reminder_list.close()
+    mail_outbox.close()
+    store.close()
+    feed_client.close()
 
 
 def main():
     config = helper.config_loader.load_toml("config/config.toml")
     secret = helper.config_loader.load_json("config/secret.json")
 
-    reminder_list = notifs.prelaunch.ReminderList(config, secret)
+    metrics_config = config["metrics"]
+    metrics_stopping = threading.Event()
+    metrics_dump = None
 
-    # If the API doesn't return 200 here honestly idk what to do
-    daily_notifs = notifs.daily.gen_daily_notifs(request_api().json(), config)
+    if metrics_config["port"] != 0:
+        helper.metrics.serve(metrics_config["port"])
 
-    sub = subscriber.subscriber.Subscriber(
-        email_receiver.EmailReceiver(secret["sender"]["username"], secret["sender"]["password"]),
-        config,
-        secret
-    )
+    if metrics_config["dump_file"]:
+        metrics_dump = helper.metrics.dump_periodically(
+            metrics_config["dump_file"], metrics_config["dump_seconds"], metrics_stopping
+        )
 
-    while True:
-        # Check if the program should exit
-        if should_exit(config):
-            logging.info("Exiting program")
-            break
-
-        # Get the API response for this iteration
-        api_response: requests.Response = request_api()
-
-        if api_response.status_code != 200:
-            logging.error(f"API error: got status code {api_response.status_code}. Response: {api_response.text}")
-            time.sleep(config["refresh"]["refresh_seconds"])
-            continue
+    feed_client = feed.FeedClient(
+        config["api"]["url"],
+        config["api"]["connect_timeout_seconds"],
+        config["api"]["read_timeout_seconds"],
+        config["api"]["max_pages"],
+        config["api"]["horizon_hours"]
+    )
 
-        # Send daily notifications
-        for notif in daily_notifs:
-            notif.send(secret)
+    # Replies are read from the inbox of the first sender account
+    account = sharding.sender_accounts(secret)[0]
+    receiver = email_receiver.EmailReceiver(account["username"], account["password"])
+    recorder = None
 
-        # Check for the prelaunch reminders
-        reminder_list.update_reminders(api_response.json())
+    # Record what the feed and the inbox return, so that it can be replayed with src.recording.simulate
+    if config["recording"]["file"]:
+        recorder = recording.Recorder(config["recording"]["file"])
+        feed_client = recording.RecordingFeedClient(feed_client, recorder)
+        receiver = recording.RecordingReceiver(receiver, recorder)
 
-        # Check for subscriptions and unsubscriptions
-        secret_changed = sub.check()
+    run(config, secret, feed_client, receiver)
 
-        # Update the secret if it changed
-        if secret_changed:
-            secret = sub.get_secret()
-            helper.config_loader.write_json("config/secret.json", sub.get_secret())
+    if recorder is not None:
+        recorder.close()
 
-        time.sleep(config["refresh"]["refresh_seconds"])
+    # Write the final metrics
+    if metrics_dump is not None:
+        metrics_stopping.set()
+        metrics_dump.join()
 
 
 if __name__ == "__main__":
@@ -97,3 +135,6 @@ if __name__ == "__main__":
     except Exception as e:
         logging.exception(e)
         raise e
+
+    finally:
+        smtp_pool.close_all()
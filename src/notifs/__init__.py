@@ -2,3 +2,4 @@ from . import prelaunch
 from . import daily
 
 from .reminder import Reminder
+from .reminder_state import ReminderState
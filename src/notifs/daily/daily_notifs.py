@@ -1,62 +1,162 @@
 import datetime
+import logging
 
+from typing import Callable, Iterable
+
+from src.feed.launch import Launch
 from src.helper import dt_helper
+from src.emailer.outbox import Outbox
+from src.subscriber.store import SubscriberStore
 from src import emailer
 from src import notifs
 
 
 class DailyNotif:
-    def __init__(self, config: dict, launch_data: dict):
+    def __init__(self, config: dict, launch: Launch, day: datetime.date | None = None):
         """
         Initializes the DailyNotif object.
 
         :param config: The configuration file data
-        :param launch_data: The launch data from the API. launch_data["t0"] must not be a string.
+        :param launch: The launch. launch.t0 must not be None.
+        :param day: The day to send the notification on. If None, it is sent today.
         """
 
+        if day is None:
+            day = dt_helper.get_now(config).date()
+
         self.reminder: notifs.Reminder = notifs.Reminder(
             subject=config["reminders"]["daily"]["subject"],
-            body=emailer.format_message(config["reminders"]["daily"]["message"], launch_data, config),
-            launch_id=launch_data["id"],
+            body=emailer.format_message(config["reminders"]["daily"]["message"], launch, config),
+            launch_id=launch.launch_id,
             time_to_remind=datetime.datetime.combine(
-                datetime.date.today(),
+                day,
                 config["reminders"]["daily"]["send_time"],
                 tzinfo=dt_helper.get_timezone(config)
             ),
-            config=config
+            config=config,
+            kind="daily",
+            audience=launch.filter_terms()
         )
 
-    def send(self, secret: dict) -> None:
+    def next_due_time(self) -> datetime.datetime | None:
+        """
+        :return: When the daily notification should be sent, or None if it was already sent or missed
+        """
+
+        if not self.reminder.pending():
+            return None
+
+        return self.reminder.time_to_remind
+
+    def send(self, outbox: Outbox) -> None:
         """
-        Sends the daily notification if they should send.
+        Queues the daily notification if it should send.
+
+        :param outbox: The outbox to queue the notification in
         """
 
         if self.reminder.should_remind():
-            self.reminder.remind(
-                secret["sender"]["username"],
-                secret["sender"]["password"],
-                secret["receiver"]["emails"]
-            )
+            self.reminder.remind(outbox)
+
 
+class DailyDigest(DailyNotif):
+    def __init__(self, config: dict, launches: list[Launch], day: datetime.date | None = None,
+                 filter_groups: Callable[[], dict[tuple[str, ...], list[str]]] | None = None):
+        """
+        Initializes the DailyDigest object, a daily notification about every launch of the day in one email.
 
-def gen_daily_notifs(api_data: dict, config: dict) -> list[DailyNotif]:
+        :param config: The configuration file data
+        :param launches: The launches, in the order they are listed in the email. The t0 of each launch must not be
+                         None.
+        :param day: The day to send the notification on. If None, it is sent today.
+        :param filter_groups: Returns the subscribers with launch filters, grouped by their normalized filters, as
+                              SubscriberStore.filter_groups does. If given, the subscribers without filters get every
+                              launch, and each group gets a digest of only the launches that match its filters. If None,
+                              the digest of every launch is sent to each subscriber with a filter that matches any of
+                              them.
+        """
+
+        if day is None:
+            day = dt_helper.get_now(config).date()
+
+        self.config = config
+        self.launches = launches
+        self.day = day
+        self.filter_groups = filter_groups
+
+        if filter_groups is None:
+            audience = [term for launch in launches for term in launch.filter_terms()]
+        else:
+            audience = []
+
+        self.reminder: notifs.Reminder = self._digest(launches, "digest", audience)
+
+    def _digest(self, launches: list[Launch], launch_id: str, audience: list[str]) -> "notifs.Reminder":
+        """
+        :param launches: The launches to list in the email
+        :param launch_id: The ID of the digest, which is part of its idempotency key
+        :param audience: The launch attributes that subscribers with launch filters are matched against
+        :return: The digest
+        """
+
+        return notifs.Reminder(
+            subject=self.config["reminders"]["daily"]["digest_subject"],
+            body=emailer.format_digest(
+                self.config["reminders"]["daily"]["digest_message"],
+                self.config["reminders"]["daily"]["digest_launch"],
+                launches,
+                self.config
+            ),
+            launch_id=launch_id,
+            time_to_remind=datetime.datetime.combine(
+                self.day,
+                self.config["reminders"]["daily"]["send_time"],
+                tzinfo=dt_helper.get_timezone(self.config)
+            ),
+            config=self.config,
+            kind="daily",
+            audience=audience
+        )
+
+    def send(self, outbox: Outbox) -> None:
+        """
+        Queues the digest if it should send. The filter groups are read now, so that subscriptions made since the digest
+        was built are included.
+
+        :param outbox: The outbox to queue the digest in
+        """
+
+        if not self.reminder.should_remind():
+            return
+
+        if self.filter_groups is not None:
+            for filters, recipients in self.filter_groups().items():
+                launches = [
+                    launch for launch in self.launches
+                    if any(SubscriberStore.normalize_term(term) in filters for term in launch.filter_terms())
+                ]
+
+                if len(launches) > 0:
+                    self._digest(launches, f"digest:{','.join(filters)}", []).remind(outbox, recipients)
+
+        self.reminder.remind(outbox)
+
+
+def _launches_in_window(launches: Iterable[Launch], config: dict, now: datetime.datetime) -> list[Launch]:
     """
-    Sends the beginning-of-day report
-    :param api_data: The API data
+    :param launches: The launches
     :param config: The config.toml data
+    :param now: The time that the hours_before_launch window starts at
+    :return: The launches within hours_before_launch of now, in order of launch time
     """
 
-    daily_notifs: list[DailyNotif] = []
+    in_window = []
 
-    for launch in api_data["result"]:
-        now = dt_helper.get_now(config)
-
-        if not isinstance(launch["t0"], str):
+    for launch in launches:
+        if launch.t0 is None:
             continue
 
-        launch_date = datetime.datetime.fromisoformat(launch["t0"])
-
-        time_to_launch = launch_date - now
+        time_to_launch = launch.t0 - now
 
         launch_is_too_far = time_to_launch > datetime.timedelta(
             hours=config["reminders"]["daily"]["hours_before_launch"]
@@ -67,8 +167,139 @@ def gen_daily_notifs(api_data: dict, config: dict) -> list[DailyNotif]:
         if launch_is_too_far or launch_already_happened:
             continue
 
-        daily_notifs.append(
-            DailyNotif(config, launch)
+        in_window.append(launch)
+
+    in_window.sort(key=lambda launch: launch.t0)
+    return in_window
+
+
+def gen_daily_notifs(launches: Iterable[Launch], config: dict, day: datetime.date | None = None,
+                     now: datetime.datetime | None = None,
+                     filter_groups: Callable[[], dict[tuple[str, ...], list[str]]] | None = None) -> list[DailyNotif]:
+    """
+    Sends the beginning-of-day report. In digest mode, this is one notification about every launch, otherwise it is
+    one notification per launch.
+
+    :param launches: The launches
+    :param config: The config.toml data
+    :param day: The day to send the report on. If None, it is sent today.
+    :param now: The time that the hours_before_launch window starts at. If None, it is the current time.
+    :param filter_groups: Returns the subscribers with launch filters, grouped by their filters. See DailyDigest.
+    """
+
+    if now is None:
+        now = dt_helper.get_now(config)
+
+    in_window = _launches_in_window(launches, config, now)
+
+    if not config["reminders"]["daily"]["digest"]:
+        return [DailyNotif(config, launch, day) for launch in in_window]
+
+    if len(in_window) == 0:
+        return []
+
+    return [DailyDigest(config, in_window, day, filter_groups)]
+
+
+class DailyNotifList:
+    def __init__(self, config: dict, outbox: Outbox,
+                 filter_groups: Callable[[], dict[tuple[str, ...], list[str]]] | None = None):
+        """
+        Initializes the DailyNotifList object, which keeps the daily notifications of the current day. They are rebuilt
+        from the live launch data until they are sent, and replaced when the day rolls over, so only one day of
+        notifications is ever held.
+
+        :param config: The configuration file data
+        :param outbox: The outbox to queue the notifications in
+        :param filter_groups: Returns the subscribers with launch filters, grouped by their filters, so that each group
+                              gets a digest of only its launches. See DailyDigest.
+        """
+
+        self.config = config
+        self.outbox = outbox
+        self.filter_groups = filter_groups
+
+        self._day: datetime.date | None = None
+        self._notifs: list[DailyNotif] = []
+        self._launches: list[Launch] = []
+
+    def _send_datetime(self, day: datetime.date) -> datetime.datetime:
+        """
+        :param day: The day
+        :return: When the daily notifications are sent on the day
+        """
+
+        return datetime.datetime.combine(
+            day,
+            self.config["reminders"]["daily"]["send_time"],
+            tzinfo=dt_helper.get_timezone(self.config)
         )
 
-    return daily_notifs
+    def _rebuild(self, now: datetime.datetime) -> None:
+        """
+        Rolls over to the current day if the day changed, and rebuilds the notifications of the day from the latest
+        launches if they have not been sent yet. Launches are included if they launch within hours_before_launch of
+        the send time.
+
+        :param now: The current time
+        """
+
+        day = now.date()
+
+        if day != self._day:
+            if self._day is not None:
+                logging.info(f"Rolling daily notifications over to {day}")
+
+            self._day = day
+            self._notifs = []
+
+        elif now >= self._send_datetime(day):
+            # The notifications of the day were sent or missed and should not change anymore
+            return
+
+        send_datetime = self._send_datetime(day)
+
+        self._notifs = gen_daily_notifs(self._launches, self.config, day, max(now, send_datetime), self.filter_groups)
+
+    def update(self, launches: Iterable[Launch]) -> None:
+        """
+        Uses the latest launch data for the notifications that have not been sent yet.
+
+        :param launches: Every launch in the feed
+        """
+
+        self._launches = list(launches)
+        self._rebuild(dt_helper.get_now(self.config))
+
+    def next_due_time(self) -> datetime.datetime | None:
+        """
+        :return: When the daily notifications of today should be sent. If they were already sent or missed, when the
+                 notifications of the next day should be sent.
+        """
+
+        due_times = [notif.next_due_time() for notif in self._notifs]
+        due_times = [due_time for due_time in due_times if due_time is not None]
+
+        if len(due_times) > 0:
+            return min(due_times)
+
+        now = dt_helper.get_now(self.config)
+        send_datetime = self._send_datetime(now.date())
+
+        if send_datetime > now:
+            return send_datetime
+
+        return self._send_datetime(now.date() + datetime.timedelta(days=1))
+
+    def send(self) -> None:
+        """
+        Rolls over to the current day if needed and sends the daily notifications that should send.
+        """
+
+        now = dt_helper.get_now(self.config)
+
+        if now.date() != self._day:
+            self._rebuild(now)
+
+        for notif in self._notifs:
+            notif.send(self.outbox)
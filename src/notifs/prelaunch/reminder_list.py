@@ -1,130 +1,307 @@
 import datetime
+import heapq
+import itertools
 import logging
 
+from typing import Iterable
+
+from src.feed.launch import Launch
+from src.feed.launch_diff import LaunchDelta
 from src.notifs.reminder import Reminder
+from src.notifs.reminder_state import ReminderState
 from src.helper import dt_helper
+from src.helper import metrics
+from src.emailer.outbox import Outbox
 from src import emailer
 
 
+_UPDATE_SECONDS = metrics.histogram(
+    "launchify_reminder_update_seconds", "Time to apply a feed change to the prelaunch reminders or send the due ones"
+)
+
+
 class ReminderList:
-    def __init__(self, config: dict, secret: dict):
-        self._reminders: list[Reminder] = []
+    def __init__(self, config: dict, outbox: Outbox, state: ReminderState | None = None):
+        """
+        Initializes the ReminderList object.
+
+        :param config: The config file data
+        :param outbox: The outbox to queue the reminders in
+        :param state: Where the reminders are persisted. If given, the reminders that were scheduled or sent before the
+                      last restart are restored from it. If None, the reminders are only kept in memory.
+        """
+
+        self._reminders: dict[str, Reminder] = {}
         self.config: dict = config
-        self.secret: dict = secret
+        self.outbox: Outbox = outbox
+        self.state: ReminderState | None = state
+
+        # A min-heap of (event time, sequence number, launch ID). Each reminder has one live event: the time to remind
+        # while it has not been sent, then the time to remove it. Superseded events are skipped when they are popped.
+        self._events: list[tuple[datetime.datetime, int, str]] = []
+        self._event_seq: dict[str, int] = {}
+        self._counter = itertools.count()
+
+        # When a T-0 last changed
+        self.last_rescheduled: datetime.datetime | None = None
 
-    def get_reminder(self, launch_id: int) -> Reminder | None:
+        if state is not None:
+            self._restore(state.load())
+
+    def _restore(self, reminder_states: dict[str, dict]) -> None:
+        """
+        Adds the persisted reminders and schedules them as they were before the restart.
+
+        :param reminder_states: A dict of launch ID to reminder state
+        """
+
+        for reminder_state in reminder_states.values():
+            reminder = Reminder.from_state(reminder_state, self.config)
+            launch_id = reminder.launch_id
+            self._reminders[launch_id] = reminder
+
+            if reminder.reminded():
+                self._schedule(launch_id, self._expiry_time(reminder))
+            else:
+                self._schedule(launch_id, reminder.time_to_remind)
+
+    def _states(self) -> dict[str, dict]:
+        """
+        :return: A dict of launch ID to the state of its reminder
+        """
+
+        return {launch_id: reminder.to_state() for launch_id, reminder in self._reminders.items()}
+
+    def _persist(self, launch_id: str) -> None:
+        """
+        Persists the current state of a reminder, or its removal if it is no longer in the ReminderList.
+
+        :param launch_id: The launch ID of the reminder
+        """
+
+        if self.state is None:
+            return
+
+        reminder = self._reminders.get(launch_id)
+
+        if reminder is None:
+            self.state.remove(launch_id)
+        else:
+            self.state.record(launch_id, reminder.to_state())
+
+        if self.state.should_snapshot():
+            self.state.snapshot(self._states())
+
+    def get_reminder(self, launch_id: str) -> Reminder | None:
         """
         :param launch_id: The launch ID
         :return: A notifs with the specified launch ID, or None if the notifs is not found
         """
-        for reminder in self._reminders:
-            if reminder.launch_id == launch_id:
-                return reminder
 
-        return None
+        return self._reminders.get(launch_id)
 
-    def has_launch_id(self, launch_id: int) -> bool:
+    def has_launch_id(self, launch_id: str) -> bool:
         """
         :param launch_id: The launch ID
         :return: If the ReminderList has the launch ID
         """
 
-        return self.get_reminder(launch_id) is not None
+        return launch_id in self._reminders
 
-    def _add_new_reminders(self, api_response: dict) -> None:
+    def _schedule(self, launch_id: str, event_time: datetime.datetime) -> None:
         """
-        Adds a reminder if the launch ID is not already in the ReminderList.
-        :param api_response: The API response
+        Replaces the pending event of the reminder.
+
+        :param launch_id: The launch ID of the reminder
+        :param event_time: When the reminder should next be looked at
         """
 
-        for launch_data in api_response["result"]:
-            if self.has_launch_id(launch_data["id"]):
-                continue
+        seq = next(self._counter)
+        self._event_seq[launch_id] = seq
+        heapq.heappush(self._events, (event_time, seq, launch_id))
 
-            if not isinstance(launch_data["t0"], str):
-                continue
+    def _expiry_time(self, reminder: Reminder) -> datetime.datetime:
+        """
+        :param reminder: The reminder
+        :return: When the reminder should be removed: 1 hour past the time to remind + the remind_before_launch time,
+                 effectively 1 hour after launch
+        """
 
-            launch_time = dt_helper.load_isoformat(launch_data["t0"], dt_helper.get_timezone(self.config))
+        return reminder.time_to_remind + datetime.timedelta(
+            hours=1,
+            minutes=self.config["reminders"]["prelaunch"]["mins_before_launch"]
+        )
 
-            logging.info(f"Adding reminder for launch ID {launch_data['id']} for {launch_time}")
+    def _add_reminder(self, launch: Launch, remind_time: datetime.datetime) -> None:
+        """
+        Adds a reminder for the launch.
 
-            remind_time = launch_time - datetime.timedelta(
-                minutes=self.config["reminders"]["prelaunch"]["mins_before_launch"]
-            )
+        :param launch: The launch
+        :param remind_time: When to send the reminder
+        """
 
-            self._reminders.append(
-                Reminder(
-                    subject=self.config["reminders"]["prelaunch"]["subject"],
-                    body=emailer.format_message(
-                        self.config["reminders"]["prelaunch"]["message"],
-                        launch_data,
-                        self.config
-                    ),
-                    launch_id=launch_data["id"],
-                    time_to_remind=remind_time,
-                    config=self.config
-                )
-            )
+        logging.info(f"Adding reminder for launch ID {launch.launch_id} for {remind_time}")
 
-    def _update_reminder_time(self, api_response: dict):
-        for launch_data in api_response["result"]:
-            reminder: Reminder | None = self.get_reminder(launch_data["id"])
+        self._reminders[launch.launch_id] = Reminder(
+            subject=self.config["reminders"]["prelaunch"]["subject"],
+            body=emailer.format_message(
+                self.config["reminders"]["prelaunch"]["message"],
+                launch,
+                self.config
+            ),
+            launch_id=launch.launch_id,
+            time_to_remind=remind_time,
+            config=self.config,
+            audience=launch.filter_terms()
+        )
 
-            if reminder is None:
-                continue
+        self._schedule(launch.launch_id, remind_time)
+        self._persist(launch.launch_id)
 
-            if not isinstance(launch_data["t0"], str):
-                continue
+    def _update_reminder_time(self, reminder: Reminder, remind_time: datetime.datetime,
+                              now: datetime.datetime) -> None:
+        """
+        Reschedules the reminder in place when T-0 changed.
+
+        :param reminder: The reminder to reschedule
+        :param remind_time: The new time to remind
+        :param now: The current time
+        """
+
+        logging.info(f"Updating reminder time for launch ID {reminder.launch_id} to {remind_time}")
+
+        reminder.time_to_remind = remind_time
+        reminder.reset_status(now)
+        self.last_rescheduled = now
 
-            launch_time = dt_helper.load_isoformat(launch_data["t0"], dt_helper.get_timezone(self.config))
+        if reminder.reminded():
+            self._schedule(reminder.launch_id, self._expiry_time(reminder))
+        else:
+            self._schedule(reminder.launch_id, remind_time)
+
+        self._persist(reminder.launch_id)
+
+    def _sync_reminders(self, launches: Iterable[Launch], now: datetime.datetime) -> None:
+        """
+        Adds a reminder for each launch that is not already in the ReminderList, and reschedules the reminders whose
+        T-0 changed.
+
+        :param launches: The launches to sync
+        :param now: The current time
+        """
 
-            remind_time = launch_time - datetime.timedelta(
-                minutes=self.config["reminders"]["prelaunch"]["mins_before_launch"]
-            )
+        timezone = dt_helper.get_timezone(self.config)
+        remind_before = datetime.timedelta(minutes=self.config["reminders"]["prelaunch"]["mins_before_launch"])
+
+        for launch in launches:
+            if launch.t0 is None:
+                # The launch time is no longer known, so the reminder would be sent at the wrong time
+                if launch.launch_id in self._reminders:
+                    logging.info(f"Removing reminder for launch ID {launch.launch_id}, its launch time is unknown")
+                    self._remove_reminder(launch.launch_id)
 
-            if remind_time == reminder.time_to_remind:
                 continue
 
-            logging.info(f"Updating reminder time for launch ID {launch_data['id']} to {remind_time}")
+            remind_time = launch.t0_in(timezone) - remind_before
+            reminder = self._reminders.get(launch.launch_id)
+
+            if reminder is None:
+                self._add_reminder(launch, remind_time)
 
-            reminder.time_to_remind = remind_time
+            elif remind_time != reminder.time_to_remind:
+                self._update_reminder_time(reminder, remind_time, now)
 
-    def _remove_completed_reminders(self) -> None:
+    def _remove_reminder(self, launch_id: str) -> None:
         """
-        Removes reminders once they are 1 hour past their completion time + the remind_before_launch time, effectively
-        removing the reminder 1 hour after launch
+        :param launch_id: The launch ID of the reminder to remove
         """
 
-        max_timedelta = datetime.timedelta(
-            hours=1,
-            minutes=self.config["reminders"]["prelaunch"]["mins_before_launch"]
+        del self._reminders[launch_id]
+        del self._event_seq[launch_id]
+        self._persist(launch_id)
+
+    def apply_delta(self, delta: LaunchDelta) -> None:
+        """
+        Adds and reschedules reminders for only the launches that were added or changed. Reminders of removed launches
+        are kept, since a launch that leaves the feed window has not necessarily launched, and they expire on their own.
+
+        :param delta: The launches that changed since the last feed response
+        """
+
+        if len(delta.added) == 0 and len(delta.changed) == 0:
+            return
+
+        with _UPDATE_SECONDS.time(operation="apply_delta"):
+            self._sync_reminders(itertools.chain(delta.added, delta.changed), dt_helper.get_now(self.config))
+
+    def launch_is_near(self, now: datetime.datetime, minutes: float) -> bool:
+        """
+        :param now: The current time
+        :param minutes: How many minutes ahead of the time to remind a launch counts as near
+        :return: If a reminder is due within the given number of minutes, or was sent and has not expired yet
+        """
+
+        window = datetime.timedelta(minutes=minutes)
+
+        return any(
+            reminder.reminded() or now <= reminder.time_to_remind <= now + window
+            for reminder in self._reminders.values()
         )
 
-        # Remove all reminders past 1 hour + remind_before_launch_mins
-        self._reminders = [
-            reminder for reminder in self._reminders
-            if dt_helper.get_now(self.config) - reminder.time_to_remind < max_timedelta
-        ]
+    def next_due_time(self) -> datetime.datetime | None:
+        """
+        :return: When the earliest reminder should next be sent or removed, or None if there are no reminders
+        """
+
+        # Drop superseded events so that they do not cause early wake-ups
+        while self._events and self._event_seq.get(self._events[0][2]) != self._events[0][1]:
+            heapq.heappop(self._events)
+
+        if not self._events:
+            return None
 
-    def update_reminders(self, api_response: dict) -> None:
+        return self._events[0][0]
+
+    def send_due_reminders(self) -> None:
         """
-        Updates all reminders, adds new reminders, and removes all reminders that need to be reminded.
+        Sends the reminders that are due and removes the reminders that have expired. Only reminders that are due or
+        expired are looked at. Reminders that are due but too late to send are logged as missed.
         """
 
-        self._add_new_reminders(api_response)
-        self._update_reminder_time(api_response)
+        with _UPDATE_SECONDS.time(operation="send_due"):
+            now = dt_helper.get_now(self.config)
+
+            while self._events and self._events[0][0] < now:
+                event_time, seq, launch_id = heapq.heappop(self._events)
+
+                if self._event_seq.get(launch_id) != seq:
+                    continue
+
+                reminder = self._reminders[launch_id]
+                expiry_time = self._expiry_time(reminder)
+
+                if now >= expiry_time:
+                    self._remove_reminder(launch_id)
+                    continue
 
-        # Update all reminders
-        for reminder in self._reminders:
-            reminder.reset_status()
+                # Notify the reminder if it should be reminded
+                if reminder.should_remind(now):
+                    logging.info(f"Sending reminder for launch ID {launch_id}, {now - reminder.time_to_remind} late")
+                    reminder.remind(self.outbox)
+                    self._persist(launch_id)
+
+                elif reminder.missed(now):
+                    logging.warning(f"Missed the reminder for launch ID {launch_id} at {reminder.time_to_remind}")
+
+                self._schedule(launch_id, expiry_time)
+
+    def close(self) -> None:
+        """
+        Writes a final snapshot of the reminders, so that the next start does not need to replay the journal.
+        """
 
-        self._remove_completed_reminders()
+        if self.state is None:
+            return
 
-        # Notify all reminders that should be reminded
-        for reminder in self._reminders:
-            if reminder.should_remind():
-                reminder.remind(
-                    self.secret["sender"]["username"],
-                    self.secret["sender"]["password"],
-                    self.secret["receiver"]["emails"]
-                )
+        self.state.snapshot(self._states())
+        self.state.close()
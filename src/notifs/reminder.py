@@ -1,12 +1,22 @@
 import datetime
 import logging
 
+from src.emailer.outbox import Outbox
+from src.emailer.rate_governor import PRIORITY_PRELAUNCH, PRIORITY_NORMAL
 from src.helper import dt_helper
-from src import emailer
+from src.helper import metrics
+
+
+_LAG_SECONDS = metrics.histogram(
+    "launchify_reminder_lag_seconds",
+    "How long after its time to remind a reminder was queued, by kind",
+    metrics.LAG_BUCKETS
+)
 
 
 class Reminder:
-    def __init__(self, subject: str, body: str, launch_id: str, time_to_remind: datetime.datetime, config: dict):
+    def __init__(self, subject: str, body: str, launch_id: str, time_to_remind: datetime.datetime, config: dict,
+                 kind: str = "prelaunch", audience: list[str] | None = None):
         """
         Initializes the Reminder object.
 
@@ -16,31 +26,59 @@ class Reminder:
         :param time_to_remind: A timezone-aware datetime.datetime object
                (several methods will not work with timezone-naive datetime.datetime objects)
         :param config: The config file data
+        :param kind: The kind of reminder, e.g. "prelaunch" or "daily", used in the idempotency key
+        :param audience: The launch attributes that subscribers with launch filters are matched against. If None, the
+                         reminder is sent to every subscriber.
         """
 
         self.reminder_subject = subject
         self.reminder_body = body
         self.launch_id = launch_id
+        self.kind = kind
+        self.audience = audience
         self.config = config
 
         self._reminded = False
         self.time_to_remind = time_to_remind
 
-    def should_remind(self) -> bool:
+    def should_remind(self, now: datetime.datetime | None = None) -> bool:
         """
         The conditions for if the notification should go off are:
         1. The notification has not gone off yet
         2. The current time is past the time to remind
-        3. The current time is not more than 2 * refresh_seconds past the time to remind
+        3. The current time is not more than missed_reminder_seconds past the time to remind
 
+        :param now: The current time. If None, the current time is looked up.
         :return: True if the notifs should go off, False otherwise
         """
 
+        if now is None:
+            now = dt_helper.get_now(self.config)
+
         return self._reminded is False \
-            and dt_helper.get_now(self.config) > self.time_to_remind \
-            and dt_helper.get_now(self.config) - self.time_to_remind < datetime.timedelta(
-                seconds=self.config["refresh"]["refresh_seconds"] * 2
-            )
+            and now > self.time_to_remind \
+            and not self.missed(now)
+
+    def missed(self, now: datetime.datetime | None = None) -> bool:
+        """
+        :param now: The current time. If None, the current time is looked up.
+        :return: If the notification has not gone off and it is too late to send it
+        """
+
+        if now is None:
+            now = dt_helper.get_now(self.config)
+
+        return self._reminded is False and now - self.time_to_remind >= datetime.timedelta(
+            seconds=self.config["refresh"]["missed_reminder_seconds"]
+        )
+
+    def pending(self, now: datetime.datetime | None = None) -> bool:
+        """
+        :param now: The current time. If None, the current time is looked up.
+        :return: If the notification has not gone off yet and it is not too late to send it
+        """
+
+        return self._reminded is False and not self.missed(now)
 
     def reminded(self) -> bool:
         """
@@ -48,26 +86,77 @@ class Reminder:
         """
         return self._reminded
 
-    def reset_status(self) -> None:
+    def reset_status(self, now: datetime.datetime | None = None) -> None:
         """
         Sets self._reminded back to False if it is True and self.time_to_remind is at least 1 hour in the future. This
         is useful if self.time_to_remind was set to a later date.
+
+        :param now: The current time. If None, the current time is looked up.
         """
 
-        if (self._reminded is True and
-                self.time_to_remind - dt_helper.get_now(self.config) > datetime.timedelta(hours=1)):
+        if now is None:
+            now = dt_helper.get_now(self.config)
+
+        if self._reminded is True and self.time_to_remind - now > datetime.timedelta(hours=1):
 
             logging.info(f"Resetting reminder status for ID {self.launch_id}, time to remind: {self.time_to_remind}")
             self._reminded = False
 
-    def remind(self, username: str, password: str, to: list[str] | str) -> None:
+    def to_state(self) -> dict:
+        """
+        :return: The reminder as JSON-serializable data, for persisting it across restarts
         """
-        Sends an email to the specified recipient(s) with the specified subject and body.
 
-        :param username: The username of the email account to send the email from
-        :param password: The password of the email account to send the email from
-        :param to: The recipient(s) of the email
+        return {
+            "subject": self.reminder_subject,
+            "body": self.reminder_body,
+            "launch_id": self.launch_id,
+            "time_to_remind": self.time_to_remind.isoformat(),
+            "kind": self.kind,
+            "audience": self.audience,
+            "reminded": self._reminded
+        }
+
+    @classmethod
+    def from_state(cls, state: dict, config: dict) -> "Reminder":
         """
+        :param state: The data from to_state
+        :param config: The config file data
+        :return: The reminder
+        """
+
+        reminder = cls(
+            subject=state["subject"],
+            body=state["body"],
+            launch_id=str(state["launch_id"]),
+            time_to_remind=datetime.datetime.fromisoformat(state["time_to_remind"]),
+            config=config,
+            kind=state["kind"],
+            audience=state["audience"]
+        )
+
+        reminder._reminded = state["reminded"]
+        return reminder
+
+    def key(self) -> str:
+        """
+        :return: The idempotency key of the reminder, which changes when the time to remind changes
+        """
+
+        return f"{self.launch_id}:{self.kind}:{self.time_to_remind.isoformat()}"
+
+    def remind(self, outbox: Outbox, to: list[str] | None = None) -> None:
+        """
+        Queues the reminder in the outbox, which sends it in the background. A reminder with the same key that was
+        already queued, e.g. before a restart, is not queued again. Prelaunch reminders are sent before other emails.
+
+        :param outbox: The outbox
+        :param to: The recipients of the reminder. If None, it is sent to the subscribers in its audience.
+        """
+
+        priority = PRIORITY_PRELAUNCH if self.kind == "prelaunch" else PRIORITY_NORMAL
+
+        _LAG_SECONDS.observe((dt_helper.get_now(self.config) - self.time_to_remind).total_seconds(), kind=self.kind)
 
-        emailer.send_email(username, password, self.reminder_subject, self.reminder_body, to)
+        outbox.enqueue(self.key(), self.reminder_subject, self.reminder_body, to, priority, self.audience)
         self._reminded = True
@@ -0,0 +1,142 @@
+import json
+import logging
+import os
+
+
+class ReminderState:
+    def __init__(self, path: str, compact_every: int = 100):
+        """
+        Initializes the ReminderState object, which persists the scheduled and sent reminders so that a restart
+        neither sends a reminder twice nor misses one. The state is a snapshot file plus a journal of the changes since
+        the snapshot. Each change is appended to the journal and synced to disk, and the journal is folded into a new
+        snapshot every compact_every changes. The snapshot is replaced atomically, and a torn last journal line from a
+        crash is ignored.
+
+        :param path: The path of the snapshot file. The journal is kept next to it with a .journal suffix.
+        :param compact_every: How many journal entries to write before writing a new snapshot
+        """
+
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.compact_every = compact_every
+
+        self._journal_entries = 0
+        self._journal = None
+
+    def load(self) -> dict[str, dict]:
+        """
+        Replays the journal on top of the snapshot. Must be called before anything else.
+
+        :return: A dict of launch ID to reminder state, as returned by Reminder.to_state
+        """
+
+        reminders: dict[str, dict] = {}
+        torn = False
+
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    snapshot = json.load(f)["reminders"]
+
+                # State files written before launch IDs were always strings may hold int launch IDs
+                reminders = {str(reminder["launch_id"]): reminder for reminder in snapshot.values()}
+
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logging.warning(f"Could not load the reminder snapshot {self.path}: {e}")
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+
+                    except ValueError:
+                        logging.warning(f"Ignoring a torn entry at the end of {self.journal_path}")
+                        torn = True
+                        break
+
+                    if entry["reminder"] is None:
+                        reminders.pop(str(entry["launch_id"]), None)
+                    else:
+                        reminders[str(entry["launch_id"])] = entry["reminder"]
+
+                    self._journal_entries += 1
+
+        logging.info(f"Restored {len(reminders)} reminders from {self.path}")
+
+        self._journal = open(self.journal_path, "a")
+
+        # New entries would be appended to the torn entry, so start a new journal
+        if torn:
+            self.snapshot(reminders)
+
+        return reminders
+
+    def _append(self, launch_id: str, reminder: dict | None) -> None:
+        """
+        Appends a change to the journal and syncs it to disk.
+
+        :param launch_id: The launch ID of the reminder
+        :param reminder: The new state of the reminder, or None if it was removed
+        """
+
+        self._journal.write(json.dumps({"launch_id": launch_id, "reminder": reminder}, separators=(",", ":")) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+        self._journal_entries += 1
+
+    def record(self, launch_id: str, reminder: dict) -> None:
+        """
+        Persists the state of a reminder that was added, rescheduled, or sent.
+
+        :param launch_id: The launch ID of the reminder
+        :param reminder: The state of the reminder
+        """
+
+        self._append(launch_id, reminder)
+
+    def remove(self, launch_id: str) -> None:
+        """
+        Persists the removal of a reminder.
+
+        :param launch_id: The launch ID of the reminder
+        """
+
+        self._append(launch_id, None)
+
+    def should_snapshot(self) -> bool:
+        """
+        :return: If the journal is long enough that a new snapshot should be written
+        """
+
+        return self._journal_entries >= self.compact_every
+
+    def snapshot(self, reminders: dict[str, dict]) -> None:
+        """
+        Writes every reminder state to a new snapshot and empties the journal. If the program stops between the two,
+        the journal is replayed on top of the new snapshot, which gives the same state.
+
+        :param reminders: Every reminder state
+        """
+
+        tmp_path = self.path + ".tmp"
+
+        with open(tmp_path, "w") as f:
+            json.dump({"reminders": reminders}, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, self.path)
+
+        self._journal.truncate(0)
+        self._journal_entries = 0
+
+    def close(self) -> None:
+        """
+        Closes the journal.
+        """
+
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
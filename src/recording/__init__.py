@@ -0,0 +1,3 @@
+from .recorder import Recorder, RecordingFeedClient, RecordingReceiver, load_events, load_mail
+from .replay import ReplayFeedClient, ReplayReceiver
+from .mail_capture import MailCapture
@@ -0,0 +1,167 @@
+import email
+import email.policy
+import json
+import socketserver
+import threading
+
+from src.helper import clock
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    # Replies are written in several pieces, which must not wait for the client to acknowledge the previous one
+    disable_nagle_algorithm = True
+
+    def _reply(self, line: str) -> None:
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def _read_data(self) -> tuple[bytes, int]:
+        """
+        :return: The headers of the message, and the size of the message in bytes
+        """
+
+        headers = b""
+        in_headers = True
+        size = 0
+
+        while (data := self.rfile.readline()) not in (b".\r\n", b""):
+            size += len(data)
+
+            if in_headers:
+                in_headers = data != b"\r\n"
+                headers += data
+
+        return headers, size
+
+    def handle(self) -> None:
+        capture: MailCapture = self.server.owner
+        sender = ""
+        recipients = 0
+
+        self._reply("220 localhost SMTP capture")
+
+        while line := self.rfile.readline():
+            command = line[:4].upper()
+
+            if command == b"EHLO":
+                self._reply("250-localhost")
+                self._reply("250 AUTH PLAIN LOGIN")
+
+            elif command == b"HELO":
+                self._reply("250 localhost")
+
+            elif command == b"AUTH":
+                self._reply("235 2.7.0 Authentication successful")
+
+            elif command == b"MAIL":
+                sender = line.decode(errors="replace").partition(":")[2].strip().strip("<>")
+                recipients = 0
+                self._reply("250 2.1.0 OK")
+
+            elif command == b"RCPT":
+                recipients += 1
+                self._reply("250 2.1.5 OK")
+
+            elif command == b"DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+
+                headers, size = self._read_data()
+                capture.record(sender, recipients, headers, size)
+
+                self._reply("250 2.0.0 OK")
+
+            elif command == b"RSET":
+                recipients = 0
+                self._reply("250 2.0.0 OK")
+
+            elif command == b"NOOP":
+                self._reply("250 2.0.0 OK")
+
+            elif command == b"QUIT":
+                self._reply("221 2.0.0 Bye")
+                return
+
+            else:
+                self._reply("502 5.5.2 Command not implemented")
+
+
+class MailCapture:
+    def __init__(self, path: str | None = None):
+        """
+        Initializes the MailCapture object, a local SMTP server without STARTTLS that accepts any login and every
+        message instead of delivering it. Each connection is handled on its own thread.
+
+        :param path: The file that a JSON line is appended to for each message, with the time on the clock of the
+                     program that it was received, the sender, the number of recipients, the subject, and the size. If
+                     None, messages are only counted.
+        """
+
+        self.path = path
+
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SMTPHandler)
+        self._server.daemon_threads = True
+        self._server.owner = self
+
+        self._thread = threading.Thread(target=self._server.serve_forever, name="MailCapture", daemon=True)
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8") if path is not None else None
+
+        self.messages = 0
+        self.recipients = 0
+        self.bytes = 0
+
+    @property
+    def port(self) -> int:
+        """
+        :return: The port that the server listens on
+        """
+
+        return self._server.server_address[1]
+
+    def start(self) -> None:
+        """
+        Starts serving in the background.
+        """
+
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops serving, closes the listening socket, and closes the capture file.
+        """
+
+        self._server.shutdown()
+        self._server.server_close()
+
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def record(self, sender: str, recipients: int, headers: bytes, size: int) -> None:
+        """
+        Counts a received message, and appends it to the capture file.
+
+        :param sender: The envelope sender of the message
+        :param recipients: The number of envelope recipients of the message
+        :param headers: The headers of the message
+        :param size: The size of the message in bytes
+        """
+
+        with self._lock:
+            self.messages += 1
+            self.recipients += recipients
+            self.bytes += size
+
+            if self._file is None:
+                return
+
+            message = email.message_from_bytes(headers, policy=email.policy.default)
+
+            self._file.write(json.dumps({
+                "time": clock.time(),
+                "sender": sender,
+                "recipients": recipients,
+                "subject": str(message["subject"] or ""),
+                "bytes": size
+            }) + "\n")
+            self._file.flush()
@@ -0,0 +1,146 @@
+import base64
+import email
+import email.message
+import json
+import threading
+
+from src.emailer.email_receiver import EmailReceiver
+from src.feed import FeedClient, FeedError
+from src.helper import clock
+
+
+class Recorder:
+    def __init__(self, path: str):
+        """
+        Initializes the Recorder object, which appends what the program receives from the outside world to a JSON lines
+        file, with the time on the clock of the program that it was received. Can be used from several threads.
+
+        :param path: The path of the recording
+        """
+
+        self.path = path
+
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, **fields) -> None:
+        """
+        Appends an event to the recording.
+
+        :param kind: The kind of the event: "feed", "feed_error", or "mail"
+        :param fields: The data of the event
+        """
+
+        line = json.dumps({"time": clock.time(), "kind": kind, **fields}, separators=(",", ":"))
+
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        """
+        Closes the recording.
+        """
+
+        with self._lock:
+            self._file.close()
+
+
+def load_events(path: str) -> list[dict]:
+    """
+    :param path: The path of a recording
+    :return: The events of the recording, oldest first. A torn last line, e.g. from a crash, is skipped.
+    """
+
+    events = []
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+
+            except ValueError:
+                break
+
+    events.sort(key=lambda event: event["time"])
+    return events
+
+
+def load_mail(event: dict) -> email.message.Message:
+    """
+    :param event: A "mail" event of a recording
+    :return: The recorded email
+    """
+
+    return email.message_from_bytes(base64.b64decode(event["raw"]))
+
+
+class RecordingFeedClient:
+    def __init__(self, feed_client: FeedClient, recorder: Recorder):
+        """
+        Initializes the RecordingFeedClient object, which fetches the launch feed with another feed client and records
+        every change of the launch data and every failed fetch.
+
+        :param feed_client: The feed client that fetches the launch feed
+        :param recorder: The recorder
+        """
+
+        self.feed_client = feed_client
+        self.recorder = recorder
+
+    @property
+    def data(self) -> dict | None:
+        return self.feed_client.data
+
+    def seed(self, data: dict) -> None:
+        self.feed_client.seed(data)
+
+    def fetch(self) -> bool:
+        try:
+            changed = self.feed_client.fetch()
+
+        except FeedError as e:
+            self.recorder.record("feed_error", error=str(e))
+            raise
+
+        if changed:
+            self.recorder.record("feed", data=self.feed_client.data)
+
+        return changed
+
+    def close(self) -> None:
+        self.feed_client.close()
+
+
+class RecordingReceiver:
+    def __init__(self, receiver: EmailReceiver, recorder: Recorder):
+        """
+        Initializes the RecordingReceiver object, which reads the inbox with another receiver and records every new
+        email.
+
+        :param receiver: The receiver that reads the inbox
+        :param recorder: The recorder
+        """
+
+        self.receiver = receiver
+        self.recorder = recorder
+
+    def get_new_emails(self, body_limit: int | None = None) -> list[email.message.Message]:
+        emails = self.receiver.get_new_emails(body_limit)
+
+        for mail in emails:
+            self.recorder.record("mail", raw=base64.b64encode(mail.as_bytes()).decode("ascii"))
+
+        return emails
+
+    def wait_for_mail(self, timeout: float) -> bool:
+        return self.receiver.wait_for_mail(timeout)
+
+    def get_state(self) -> dict:
+        return self.receiver.get_state()
+
+    def set_state(self, state: dict) -> None:
+        self.receiver.set_state(state)
+
+    def logout(self) -> None:
+        self.receiver.logout()
@@ -0,0 +1,108 @@
+import email.message
+import time
+
+from src.feed import FeedError
+from src.helper import clock
+from src.recording.recorder import load_mail
+
+
+class ReplayFeedClient:
+    def __init__(self, events: list[dict]):
+        """
+        Initializes the ReplayFeedClient object, which stands in for the feed client and returns the recorded launch
+        data as the clock of the program reaches the time that it was recorded at.
+
+        :param events: The "feed" and "feed_error" events of a recording, oldest first
+        """
+
+        self._events = events
+        self._next = 0
+
+        self.data: dict | None = None
+
+    def seed(self, data: dict) -> None:
+        self.data = data
+
+    def fetch(self) -> bool:
+        """
+        :return: If launch data was recorded since the last fetch
+        :raises FeedError: If the last event recorded since the last fetch is a failed fetch
+        """
+
+        now = clock.time()
+        latest = None
+
+        while self._next < len(self._events) and self._events[self._next]["time"] <= now:
+            latest = self._events[self._next]
+            self._next += 1
+
+            if latest["kind"] == "feed":
+                self.data = latest["data"]
+
+        if latest is None:
+            return False
+
+        if latest["kind"] == "feed_error":
+            raise FeedError(latest["error"])
+
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+class ReplayReceiver:
+    def __init__(self, events: list[dict]):
+        """
+        Initializes the ReplayReceiver object, which stands in for the email receiver and returns the recorded emails as
+        the clock of the program reaches the time that they were recorded at.
+
+        :param events: The "mail" events of a recording, oldest first
+        """
+
+        self._events = events
+        self._next = 0
+
+    def get_new_emails(self, body_limit: int | None = None) -> list[email.message.Message]:
+        """
+        :param body_limit: Unused, since the recorded emails were already cut to the body limit of the recording
+        :return: The emails recorded since the last call, oldest first
+        """
+
+        now = clock.time()
+        emails = []
+
+        while self._next < len(self._events) and self._events[self._next]["time"] <= now:
+            emails.append(load_mail(self._events[self._next]))
+            self._next += 1
+
+        return emails
+
+    def wait_for_mail(self, timeout: float) -> bool:
+        """
+        Waits until the next recorded email arrives or the timeout passes, on the clock of the program.
+
+        :param timeout: The maximum number of seconds to wait
+        :return: If a recorded email arrived
+        """
+
+        if self._next < len(self._events):
+            seconds_until_mail = max(0.0, self._events[self._next]["time"] - clock.time())
+        else:
+            seconds_until_mail = None
+
+        if seconds_until_mail is None or seconds_until_mail > timeout:
+            time.sleep(clock.to_real(max(0.0, timeout)))
+            return False
+
+        time.sleep(clock.to_real(seconds_until_mail))
+        return True
+
+    def get_state(self) -> dict:
+        return {"next_event": self._next}
+
+    def set_state(self, state: dict) -> None:
+        self._next = state["next_event"]
+
+    def logout(self) -> None:
+        pass
@@ -0,0 +1,228 @@
+import argparse
+import copy
+import datetime
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from src import main as program
+from src.emailer import smtp_pool
+from src.helper import clock
+from src.helper import config_loader
+from src.helper import dt_helper
+from src.helper import metrics
+from src.recording.mail_capture import MailCapture
+from src.recording.recorder import load_events
+from src.recording.replay import ReplayFeedClient, ReplayReceiver
+
+
+# The sender that the program logs in as. Any login is accepted by the mail capture.
+SENDER = {"username": "simulation@localhost", "password": "simulation"}
+
+
+class _ClockFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        """
+        Stamps the record with the time of the simulation instead of the real time.
+        """
+
+        record.created = clock.time()
+        record.msecs = record.created % 1 * 1000
+        return True
+
+
+def simulation_config(config: dict, directory: str) -> dict:
+    """
+    :param config: The config file data
+    :param directory: The directory to keep the databases and state files of the simulation in
+    :return: A copy of the config that keeps every file in the directory, does not serve metrics, does not record, and
+             does not exit at the exit time, so that the simulation only ends at the end of the recording
+    """
+
+    config = copy.deepcopy(config)
+
+    config["api"]["cache_file"] = os.path.join(directory, "launch_cache.json")
+    config["outbox"]["database_file"] = os.path.join(directory, "outbox.db")
+    config["subscription"]["database_file"] = os.path.join(directory, "subscribers.db")
+    config["subscription"]["inbox_state_file"] = os.path.join(directory, "inbox_state.json")
+    config["reminders"]["prelaunch"]["state_file"] = os.path.join(directory, "reminder_state.json")
+    config["exit"]["should_exit"] = False
+    config["metrics"]["port"] = 0
+    config["metrics"]["dump_file"] = ""
+    config["recording"]["file"] = ""
+
+    return config
+
+
+def simulate(config: dict, events: list[dict], speed: float, output_directory: str,
+             subscribers_file: str | None = None, extra_seconds: float = 0.0) -> dict:
+    """
+    Runs the whole program against a recording on a clock that runs speed times faster than real time, starting at the
+    first launch data of the recording. Outbound mail is captured by a local SMTP server instead of being delivered.
+
+    :param config: The config file data
+    :param events: The events of the recording, oldest first
+    :param speed: How many seconds pass in the simulation per real second
+    :param output_directory: The directory that the captured mail, the metrics, and the profiles are written to
+    :param subscribers_file: A subscriber database to start with, e.g. a copy of the production one. If None, the
+                             simulation starts without subscribers and only has those that subscribe in the recording.
+    :param extra_seconds: How long to keep running after the last event of the recording, e.g. to send the reminders
+                          of the last recorded launches
+    :return: A summary of the simulation
+    """
+
+    feed_events = [event for event in events if event["kind"] in ("feed", "feed_error")]
+    mail_events = [event for event in events if event["kind"] == "mail"]
+
+    if not any(event["kind"] == "feed" for event in feed_events):
+        raise ValueError("The recording has no launch data")
+
+    os.makedirs(output_directory, exist_ok=True)
+    mail_path = os.path.join(output_directory, "mail.jsonl")
+
+    # Every run starts with an empty capture file
+    if os.path.exists(mail_path):
+        os.remove(mail_path)
+
+    # The program fetches the feed first, so it starts at the first launch data. Emails and failed feed requests that
+    # were recorded before it are replayed right away.
+    start = next(event["time"] for event in feed_events if event["kind"] == "feed")
+    end = events[-1]["time"] + extra_seconds
+
+    with tempfile.TemporaryDirectory() as directory:
+        config = simulation_config(config, directory)
+        config["metrics"]["profile_directory"] = os.path.join(output_directory, "profiles")
+
+        if subscribers_file is not None:
+            shutil.copyfile(subscribers_file, config["subscription"]["database_file"])
+
+        capture = MailCapture(mail_path)
+        capture.start()
+
+        smtp_pool.set_server("127.0.0.1", capture.port, starttls=False)
+        clock.set_clock(clock.ScaledClock(start, speed))
+
+        real_start = time.monotonic()
+
+        try:
+            program.run(
+                config,
+                {"senders": [SENDER]},
+                ReplayFeedClient(feed_events),
+                ReplayReceiver(mail_events),
+                datetime.datetime.fromtimestamp(end, dt_helper.get_timezone(config))
+            )
+
+        finally:
+            real_seconds = time.monotonic() - real_start
+
+            smtp_pool.close_all()
+            capture.stop()
+            clock.set_clock(clock.Clock())
+
+    metrics.write_snapshot(os.path.join(output_directory, "metrics.json"))
+
+    return {
+        "simulated_seconds": end - start,
+        "real_seconds": real_seconds,
+        "feed_events": len(feed_events),
+        "mail_events": len(mail_events),
+        "messages": capture.messages,
+        "recipients": capture.recipients,
+        "reminder_lag_seconds": _histogram("launchify_reminder_lag_seconds", "kind"),
+        "delivery_seconds": _histogram("launchify_outbox_delivery_seconds", "priority")
+    }
+
+
+def _histogram(name: str, label: str) -> dict:
+    """
+    :param name: The name of a histogram
+    :param label: The label to group the samples of the histogram by
+    :return: The count, mean, and maximum of each value of the label
+    """
+
+    samples = metrics.snapshot()["metrics"].get(name, {"samples": []})["samples"]
+
+    return {
+        sample["labels"].get(label, ""): {"count": sample["count"], "mean": sample["mean"], "max": sample["max"]}
+        for sample in samples
+    }
+
+
+def format_summary(summary: dict) -> str:
+    """
+    :param summary: The summary returned by simulate
+    :return: The summary as text
+    """
+
+    simulated_hours = summary["simulated_seconds"] / 3600
+    real_seconds = summary["real_seconds"]
+
+    lines = [
+        f"Simulated {simulated_hours:,.1f} hours in {real_seconds:,.1f} seconds "
+        f"({summary['simulated_seconds'] / max(real_seconds, 1e-9):,.0f}x)",
+        f"Replayed {summary['feed_events']} feed events and {summary['mail_events']} emails",
+        f"Captured {summary['messages']} emails to {summary['recipients']} recipients "
+        f"({summary['recipients'] / max(real_seconds, 1e-9):,.0f} recipients per real second)"
+    ]
+
+    for title, key in (("Reminder lag", "reminder_lag_seconds"), ("Delivery time", "delivery_seconds")):
+        for label, stats in sorted(summary[key].items()):
+            lines.append(f"{title} ({label}): {stats['count']} sent, mean {stats['mean']:.1f} s, "
+                         f"max {stats['max']:.1f} s")
+
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Replays a recording of the launch feed and the inbox through the whole program faster than real "
+                    "time, and captures the emails that it sends."
+    )
+
+    parser.add_argument("recording", help="the recording, as written with the file option of [recording]")
+    parser.add_argument("--speed", type=float, default=1000, help="how many times faster than real time to run")
+    parser.add_argument("--subscribers", help="a subscriber database to start with")
+    parser.add_argument("--extra-hours", type=float, default=0,
+                        help="how long to keep running after the last event of the recording")
+    parser.add_argument("--config", default="config/config.toml", help="the config file to run with")
+    parser.add_argument("--output", default="simulation", help="the directory to write the captured emails to")
+
+    args = parser.parse_args(argv)
+
+    events = load_events(args.recording)
+
+    if len(events) == 0:
+        sys.exit(f"{args.recording} has no events")
+
+    os.makedirs(args.output, exist_ok=True)
+
+    logging.basicConfig(
+        filename=os.path.join(args.output, "simulation.log"),
+        filemode="w",
+        level=logging.INFO,
+        format="[%(asctime)s] {%(module)s:%(lineno)d} %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(_ClockFilter())
+
+    summary = simulate(
+        config_loader.load_toml(args.config),
+        events,
+        args.speed,
+        args.output,
+        args.subscribers,
+        args.extra_hours * 60 * 60
+    )
+
+    print(format_summary(summary))
+    print(f"Wrote the captured emails and metrics to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
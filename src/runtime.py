@@ -0,0 +1,278 @@
+import contextlib
+import datetime
+import logging
+import signal
+import threading
+
+from . import subscriber
+from . import notifs
+from . import helper
+from . import feed
+
+
+_TICK_SECONDS = helper.metrics.histogram("launchify_tick_seconds", "Time of one tick of each task")
+
+
+def should_exit(config: dict) -> bool:
+    """
+    :return: If the program should exit
+    """
+
+    if not config["exit"]["should_exit"]:
+        return False
+
+    now = helper.clock.now()
+    exit_datetime = datetime.datetime.combine(now.date(), config["exit"]["exit_time"])
+
+    diff = abs(now - exit_datetime)
+    exit_margin = datetime.timedelta(seconds=config["refresh"]["refresh_seconds"] * 3)
+
+    return diff < exit_margin
+
+
+def get_next_due_time(daily_notifs: notifs.daily.DailyNotifList,
+                      reminder_list: notifs.prelaunch.ReminderList) -> datetime.datetime | None:
+    """
+    :param daily_notifs: The daily notifications
+    :param reminder_list: The prelaunch reminders
+    :return: When the next notification is due, or None if no notifications are pending
+    """
+
+    due_times = [daily_notifs.next_due_time(), reminder_list.next_due_time()]
+    due_times = [due_time for due_time in due_times if due_time is not None]
+
+    if len(due_times) == 0:
+        return None
+
+    return min(due_times)
+
+
+def seconds_until_exit(config: dict) -> float | None:
+    """
+    :return: The number of seconds until the next exit time, or None if the program should not exit
+    """
+
+    if not config["exit"]["should_exit"]:
+        return None
+
+    now = helper.clock.now()
+    exit_datetime = datetime.datetime.combine(now.date(), config["exit"]["exit_time"])
+
+    if exit_datetime < now:
+        exit_datetime += datetime.timedelta(days=1)
+
+    return (exit_datetime - now).total_seconds()
+
+
+class Runtime:
+    def __init__(self, config: dict, feed_client: feed.FeedClient, launch_cache: feed.LaunchCache,
+                 launch_differ: feed.LaunchDiffer, daily_notifs: notifs.daily.DailyNotifList,
+                 reminder_list: notifs.prelaunch.ReminderList, sub: subscriber.subscriber.Subscriber,
+                 until: datetime.datetime | None = None):
+        """
+        Initializes the Runtime object, which runs feed polling and inbox processing on their own threads, each at its
+        own cadence, while the calling thread sends notifications as they come due. Outbound delivery runs on the outbox
+        workers. A slow API or IMAP server therefore never delays a reminder.
+
+        :param config: The config file data
+        :param feed_client: The launch feed client
+        :param launch_cache: The launch cache that each new feed is saved to
+        :param launch_differ: The differ that turns each new feed into a delta
+        :param daily_notifs: The daily notifications
+        :param reminder_list: The prelaunch reminders
+        :param sub: The subscriber that processes the inbox
+        :param until: A timezone-aware time to stop at, e.g. the end of a replayed recording. If None, the runtime runs
+               until the exit time or until it is stopped.
+        """
+
+        self.config = config
+        self.feed_client = feed_client
+        self.launch_cache = launch_cache
+        self.launch_differ = launch_differ
+        self.daily_notifs = daily_notifs
+        self.reminder_list = reminder_list
+        self.sub = sub
+        self.until = until
+
+        # Guards the daily notifications and prelaunch reminders, which the feed thread updates while they are sent
+        self._notifs_lock = threading.Lock()
+
+        # Set to stop every task, and to wake the scheduler early when the notifications changed
+        self._stopping = threading.Event()
+        self._wake = threading.Event()
+
+        self._poll_policy = helper.poll_policy.PollPolicy(config)
+
+        self._profiler = helper.metrics.SlowTickProfiler(
+            config["metrics"]["profile_directory"],
+            config["metrics"]["profile_slow_tick_seconds"],
+            config["metrics"]["profile_sample_every"]
+        )
+
+    @contextlib.contextmanager
+    def _tick(self, task: str):
+        """
+        A context manager that times one tick of a task, and profiles it if slow ticks are profiled.
+
+        :param task: The name of the task
+        """
+
+        with _TICK_SECONDS.time(task=task), self._profiler.profile(task):
+            yield
+
+    def _poll_feed(self) -> float:
+        """
+        Fetches the launch feed, and adds and reschedules the notifications if it changed.
+
+        :return: How many seconds to wait until the next poll
+        """
+
+        try:
+            if self.feed_client.fetch():
+                self.launch_cache.save(self.feed_client.data)
+
+                with self._notifs_lock:
+                    self.reminder_list.apply_delta(self.launch_differ.diff(self.feed_client.data))
+                    self.daily_notifs.update(self.launch_differ.launches.values())
+
+                self.sub.learn_launch_terms()
+
+                self._wake.set()
+
+        except feed.FeedError as e:
+            logging.error(e)
+
+        now = helper.dt_helper.get_now(self.config)
+
+        with self._notifs_lock:
+            launch_is_near = self.reminder_list.launch_is_near(now, self.config["refresh"]["near_launch_minutes"])
+            last_rescheduled = self.reminder_list.last_rescheduled
+
+        return self._poll_policy.next_interval(now, launch_is_near, last_rescheduled)
+
+    def _feed_task(self) -> None:
+        """
+        Polls the launch feed until the runtime stops.
+        """
+
+        interval = 0.0
+
+        while not self._stopping.wait(helper.clock.to_real(interval)):
+            try:
+                with self._tick("feed"):
+                    interval = self._poll_feed()
+
+            except Exception as e:
+                logging.exception(e)
+                interval = self.config["refresh"]["refresh_seconds"]
+
+    def _inbox_task(self) -> None:
+        """
+        Checks the inbox for subscriptions, unsubscriptions, and bounces as soon as mail arrives, until the runtime
+        stops. The inbox is also checked every refresh_seconds in case a notification of new mail was lost.
+        """
+
+        while not self._stopping.is_set():
+            try:
+                with self._tick("inbox"):
+                    self.sub.check()
+
+                self.sub.wait_for_mail(self.config["refresh"]["refresh_seconds"])
+
+            except Exception as e:
+                logging.exception(e)
+                self._stopping.wait(helper.clock.to_real(self.config["refresh"]["refresh_seconds"]))
+
+    def _seconds_until_next_event(self) -> float | None:
+        """
+        Must be called while holding self._notifs_lock.
+
+        :return: The number of seconds until the next notification is due, the exit time, or the end time, whichever is
+                 earliest, or None if none is pending
+        """
+
+        timeouts = []
+        now = helper.dt_helper.get_now(self.config)
+        next_due = get_next_due_time(self.daily_notifs, self.reminder_list)
+
+        if next_due is not None:
+            timeouts.append((next_due - now).total_seconds())
+
+        if self.until is not None:
+            timeouts.append((self.until - now).total_seconds())
+
+        exit_seconds = seconds_until_exit(self.config)
+
+        if exit_seconds is not None:
+            timeouts.append(exit_seconds)
+
+        if len(timeouts) == 0:
+            return None
+
+        return max(0.0, min(timeouts))
+
+    def _run_scheduler(self) -> None:
+        """
+        Sends the notifications as they come due until the exit time, the end time, or until the runtime stops.
+        """
+
+        while not self._stopping.is_set():
+            if should_exit(self.config):
+                logging.info("Exiting program")
+                return
+
+            if self.until is not None and helper.dt_helper.get_now(self.config) >= self.until:
+                logging.info("Reached the end time")
+                return
+
+            with self._notifs_lock, self._tick("scheduler"):
+                # Send daily notifications
+                self.daily_notifs.send()
+
+                # Send the prelaunch reminders that are due
+                self.reminder_list.send_due_reminders()
+
+                timeout = self._seconds_until_next_event()
+
+            # Woken early when the feed changes the notifications or the runtime stops
+            self._wake.wait(helper.clock.to_real(timeout))
+            self._wake.clear()
+
+    def stop(self, *args) -> None:
+        """
+        Stops every task. Can be used as a signal handler.
+        """
+
+        if self._stopping.is_set():
+            return
+
+        logging.info("Stopping")
+
+        self._stopping.set()
+        self._wake.set()
+
+    def run(self) -> None:
+        """
+        Runs every task until the exit time, the end time, or until stop is called, e.g. by SIGINT or SIGTERM. The feed
+        and inbox threads are joined before returning, after they finish the poll or inbox check that they are in.
+        """
+
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        tasks = [
+            threading.Thread(target=self._feed_task, name="feed", daemon=True),
+            threading.Thread(target=self._inbox_task, name="inbox", daemon=True)
+        ]
+
+        for task in tasks:
+            task.start()
+
+        try:
+            self._run_scheduler()
+
+        finally:
+            self.stop()
+
+            for task in tasks:
+                task.join()
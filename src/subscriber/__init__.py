@@ -1 +1,3 @@
 from . import subscriber
+from . import store
+from . import bounces
@@ -0,0 +1,102 @@
+import email.message
+import email.utils
+import logging
+
+from src.subscriber.store import SubscriberStore
+
+
+# The local parts of the addresses that bounces are sent from
+_BOUNCE_SENDERS = ("mailer-daemon", "postmaster")
+
+
+class BounceProcessor:
+    def __init__(self, store: SubscriberStore, config: dict):
+        """
+        Initializes the BounceProcessor object, which reads delivery status notifications (DSNs) and other non-delivery
+        reports from the inbox, and counts a soft or hard bounce for each recipient that failed. Recipients that keep
+        bouncing are unsubscribed and suppressed, as configured in the subscription.bounces section of the config file.
+
+        :param store: The subscriber store that keeps the bounce counters
+        :param config: The config file data
+        """
+
+        self._store = store
+        self._config = config
+
+    @staticmethod
+    def is_bounce(mail: email.message.Message) -> bool:
+        """
+        :param mail: The email
+        :return: If the email is a delivery report or was sent by a mailer daemon
+        """
+
+        if mail.get_content_type() == "multipart/report":
+            return True
+
+        _, address = email.utils.parseaddr(mail["From"] or "")
+
+        return address.partition("@")[0].lower() in _BOUNCE_SENDERS
+
+    @staticmethod
+    def parse(mail: email.message.Message) -> list[tuple[str, bool]]:
+        """
+        :param mail: A delivery report
+        :return: The recipients that failed, and whether each failure was permanent (a hard bounce). Delayed deliveries
+                 are not failures.
+        """
+
+        failures: list[tuple[str, bool]] = []
+
+        for part in mail.walk():
+            if part.get_content_type() != "message/delivery-status":
+                continue
+
+            # The first block has the per-message fields, and each following block is about one recipient
+            for block in part.get_payload()[1:]:
+                recipient = block["Final-Recipient"] or block["Original-Recipient"]
+
+                if recipient is None or (block["Action"] or "").strip().lower() != "failed":
+                    continue
+
+                # e.g. "rfc822; someone@example.com"
+                address = recipient.rpartition(";")[2].strip().strip("<>")
+                failures.append((address, (block["Status"] or "5").strip().startswith("5")))
+
+        if len(failures) > 0:
+            return failures
+
+        # Some servers only list the failed recipients in a header, which is only added for permanent failures
+        failed_recipients = mail.get_all("X-Failed-Recipients") or []
+
+        return [(address, True) for _, address in email.utils.getaddresses(failed_recipients) if address]
+
+    def process(self, mail: email.message.Message) -> list[str]:
+        """
+        Counts a bounce for each recipient that failed according to the delivery report.
+
+        :param mail: A delivery report
+        :return: The recipients that were suppressed because of this report
+        """
+
+        bounce_config = self._config["subscription"]["bounces"]
+        failures = self.parse(mail)
+
+        if len(failures) == 0:
+            logging.info(f"Ignoring a bounce without failed recipients: subject: {mail['Subject']}")
+            return []
+
+        suppressed = []
+
+        for address, hard in failures:
+            logging.info(f"{'Hard' if hard else 'Soft'} bounce from {address}")
+
+            if self._store.record_bounce(
+                address,
+                hard,
+                bounce_config["soft_bounce_limit"],
+                bounce_config["hard_bounce_limit"],
+                bounce_config["soft_bounce_reset_days"] * 24 * 60 * 60
+            ):
+                suppressed.append(address)
+
+        return suppressed
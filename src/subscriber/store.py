@@ -0,0 +1,428 @@
+import contextlib
+import email.utils
+import logging
+import sqlite3
+import threading
+
+from typing import Iterable, Iterator
+
+from src.helper import clock
+
+
+class SubscriberStore:
+    def __init__(self, path: str):
+        """
+        Initializes the SubscriberStore object, which keeps the subscribed email addresses in an SQLite database in WAL
+        mode. Every change is committed on its own unless it is made inside transaction().
+
+        Subscribers can have launch filters, which are terms such as a provider, vehicle, or launch site. Subscribers
+        with filters only receive notifications about launches that match one of them, and subscribers without filters
+        receive every notification. An inverted index from each term to its subscribers is kept in memory so that the
+        recipients of a launch are found without scanning every subscriber.
+
+        :param path: The path of the database file. It is created if it does not exist.
+        """
+
+        self.path = path
+
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS subscribers (email TEXT PRIMARY KEY) WITHOUT ROWID")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS filters (email TEXT NOT NULL, term TEXT NOT NULL, PRIMARY KEY (email, term)) "
+            "WITHOUT ROWID"
+        )
+
+        # Every provider, vehicle, and launch site seen in the feed, which launch filters are checked against
+        self._connection.execute("CREATE TABLE IF NOT EXISTS launch_terms (term TEXT PRIMARY KEY) WITHOUT ROWID")
+
+        # The suppression list: the bounce counters of each address, and whether it was removed for bouncing
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS bounces (email TEXT PRIMARY KEY, soft INTEGER NOT NULL DEFAULT 0, "
+            "hard INTEGER NOT NULL DEFAULT 0, last_bounce REAL NOT NULL, suppressed INTEGER NOT NULL DEFAULT 0) "
+            "WITHOUT ROWID"
+        )
+
+        self._migrate_addresses()
+
+        self._filter_index: dict[str, set[str]] = {}
+        self._load_filter_index()
+
+    @staticmethod
+    def normalize_address(address: str) -> str:
+        """
+        :param address: An email address, or a From header such as "Jane Doe <Jane@example.com>"
+        :return: The bare lowercase address, as it is stored and as delivery reports name it, e.g. "jane@example.com".
+                 An empty string if there is no address.
+        """
+
+        return email.utils.parseaddr(address)[1].lower()
+
+    def _migrate_addresses(self) -> None:
+        """
+        Normalizes the addresses that were stored as the whole From header of the subscription email, e.g.
+        "Jane Doe <jane@example.com>", so that bounces are counted against them.
+        """
+
+        tables = ("subscribers", "filters", "bounces")
+
+        with self.transaction():
+            rows = {
+                table: self._connection.execute(
+                    f"SELECT DISTINCT email FROM {table} WHERE email LIKE '%<%' OR email <> lower(trim(email))"
+                ).fetchall()
+                for table in tables
+            }
+
+            if not any(rows.values()):
+                return
+
+            logging.info(f"Normalizing {sum(len(table_rows) for table_rows in rows.values())} stored email addresses")
+
+            for table, table_rows in rows.items():
+                for (address,) in table_rows:
+                    normalized = self.normalize_address(address)
+
+                    # An address that is already stored normalized keeps its row
+                    if normalized:
+                        self._connection.execute(
+                            f"UPDATE OR IGNORE {table} SET email = ? WHERE email = ?", (normalized, address)
+                        )
+
+                    self._connection.execute(f"DELETE FROM {table} WHERE email = ?", (address,))
+
+    def _load_filter_index(self) -> None:
+        """
+        Rebuilds the inverted index of launch filters from the database.
+        """
+
+        with self._lock:
+            self._filter_index = {}
+
+            for email, term in self._connection.execute("SELECT email, term FROM filters"):
+                self._filter_index.setdefault(term, set()).add(email)
+
+    def add(self, email: str) -> bool:
+        """
+        :param email: The email address to subscribe
+        :return: If the email address was not already subscribed
+        """
+
+        email = self.normalize_address(email)
+
+        with self._lock:
+            return self._connection.execute(
+                "INSERT OR IGNORE INTO subscribers (email) VALUES (?)", (email,)
+            ).rowcount == 1
+
+    def remove(self, email: str) -> bool:
+        """
+        :param email: The email address to unsubscribe. Its launch filters are removed too.
+        :return: If the email address was subscribed
+        """
+
+        email = self.normalize_address(email)
+
+        with self._lock:
+            self.clear_filters(email)
+            return self._connection.execute("DELETE FROM subscribers WHERE email = ?", (email,)).rowcount == 1
+
+    @staticmethod
+    def normalize_term(term: str) -> str:
+        """
+        :param term: A launch filter term or launch attribute
+        :return: The term as it is matched, ignoring case and surrounding whitespace
+        """
+
+        return " ".join(term.split()).casefold()
+
+    def add_filters(self, email: str, terms: Iterable[str]) -> None:
+        """
+        Adds launch filters to a subscriber, which then only receives notifications about launches that match one of
+        its filters.
+
+        :param email: The email address of the subscriber
+        :param terms: The terms to filter launches by, such as "SpaceX" or "Falcon 9"
+        """
+
+        email = self.normalize_address(email)
+        terms = {self.normalize_term(term) for term in terms}
+
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO filters (email, term) VALUES (?, ?)", ((email, term) for term in terms)
+            )
+
+            for term in terms:
+                self._filter_index.setdefault(term, set()).add(email)
+
+    def clear_filters(self, email: str) -> None:
+        """
+        Removes every launch filter of a subscriber, which then receives every notification.
+
+        :param email: The email address of the subscriber
+        """
+
+        email = self.normalize_address(email)
+
+        with self._lock:
+            for term in self.filters(email):
+                subscribers = self._filter_index[term]
+                subscribers.discard(email)
+
+                if len(subscribers) == 0:
+                    del self._filter_index[term]
+
+            self._connection.execute("DELETE FROM filters WHERE email = ?", (email,))
+
+    def add_launch_terms(self, terms: Iterable[str]) -> None:
+        """
+        Remembers the providers, vehicles, and launch sites of launches, so that launch filters for them are accepted
+        even after the launches left the feed.
+
+        :param terms: The attributes of the launches
+        """
+
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO launch_terms (term) VALUES (?)",
+                ((term,) for term in {self.normalize_term(term) for term in terms})
+            )
+
+    def unknown_terms(self, terms: Iterable[str]) -> set[str]:
+        """
+        :param terms: Launch filter terms
+        :return: The terms that match no provider, vehicle, or launch site that was added with add_launch_terms
+        """
+
+        with self._lock:
+            return {
+                term for term in terms
+                if self._connection.execute(
+                    "SELECT 1 FROM launch_terms WHERE term = ?", (self.normalize_term(term),)
+                ).fetchone() is None
+            }
+
+    def filter_groups(self) -> dict[tuple[str, ...], list[str]]:
+        """
+        :return: The subscribers with launch filters, grouped by their filters. The filters of each group are sorted.
+        """
+
+        filters: dict[str, list[str]] = {}
+
+        with self._lock:
+            for term, subscribers in self._filter_index.items():
+                for email in subscribers:
+                    filters.setdefault(email, []).append(term)
+
+        groups: dict[tuple[str, ...], list[str]] = {}
+
+        for email, terms in filters.items():
+            groups.setdefault(tuple(sorted(terms)), []).append(email)
+
+        return groups
+
+    def filters(self, email: str) -> list[str]:
+        """
+        :param email: The email address of the subscriber
+        :return: The launch filters of the subscriber, or an empty list if it receives every notification
+        """
+
+        email = self.normalize_address(email)
+
+        with self._lock:
+            return [row[0] for row in self._connection.execute("SELECT term FROM filters WHERE email = ?", (email,))]
+
+    def record_bounce(self, email: str, hard: bool, soft_limit: int, hard_limit: int,
+                      soft_reset_seconds: float) -> bool:
+        """
+        Counts a bounce of an address. Once an address reaches soft_limit soft bounces or hard_limit hard bounces, it is
+        unsubscribed and suppressed.
+
+        :param email: The address that bounced
+        :param hard: If the bounce was permanent, e.g. the address does not exist, rather than temporary
+        :param soft_limit: How many soft bounces suppress the address
+        :param hard_limit: How many hard bounces suppress the address
+        :param soft_reset_seconds: The soft bounces of an address are forgotten if it has not bounced for this long
+        :return: If the address was suppressed by this bounce
+        """
+
+        email = self.normalize_address(email)
+        now = clock.time()
+
+        with self.transaction():
+            row = self._connection.execute(
+                "SELECT soft, hard, last_bounce, suppressed FROM bounces WHERE email = ?", (email,)
+            ).fetchone()
+
+            soft, hard_count, last_bounce, suppressed = row if row is not None else (0, 0, now, 0)
+
+            if now - last_bounce > soft_reset_seconds:
+                soft = 0
+
+            if hard:
+                hard_count += 1
+            else:
+                soft += 1
+
+            newly_suppressed = not suppressed and (soft >= soft_limit or hard_count >= hard_limit)
+
+            self._connection.execute(
+                "INSERT OR REPLACE INTO bounces (email, soft, hard, last_bounce, suppressed) VALUES (?, ?, ?, ?, ?)",
+                (email, soft, hard_count, now, int(suppressed or newly_suppressed))
+            )
+
+            if newly_suppressed:
+                logging.info(f"Suppressing {email} after {soft} soft and {hard_count} hard bounces")
+                self.remove(email)
+
+        return newly_suppressed
+
+    def clear_bounces(self, email: str) -> None:
+        """
+        Forgets the bounces of an address and lifts its suppression, e.g. when it subscribes again.
+
+        :param email: The address
+        """
+
+        with self._lock:
+            self._connection.execute("DELETE FROM bounces WHERE email = ?", (self.normalize_address(email),))
+
+    def __contains__(self, email: str) -> bool:
+        email = self.normalize_address(email)
+
+        with self._lock:
+            return self._connection.execute(
+                "SELECT 1 FROM subscribers WHERE email = ?", (email,)
+            ).fetchone() is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM subscribers").fetchone()[0]
+
+    def __iter__(self) -> Iterator[str]:
+        return self.iter_emails()
+
+    def iter_emails(self, batch_size: int = 1000) -> Iterator[str]:
+        """
+        Streams the subscribed email addresses. A separate read connection is used, so the addresses are a consistent
+        snapshot even if subscriptions change while iterating.
+
+        :param batch_size: How many addresses to read from the database at once
+        :return: An iterator over the subscribed email addresses
+        """
+
+        connection = sqlite3.connect(self.path)
+
+        try:
+            cursor = connection.execute("SELECT email FROM subscribers")
+
+            while rows := cursor.fetchmany(batch_size):
+                for row in rows:
+                    yield row[0]
+
+        finally:
+            connection.close()
+
+    def iter_audience(self, terms: Iterable[str] | None = None, batch_size: int = 1000) -> Iterator[str]:
+        """
+        Streams the recipients of a notification: the subscribers without launch filters, followed by the subscribers
+        with a filter that matches one of the terms. The filtered subscribers are found through the inverted index.
+
+        :param terms: The attributes of the launches that the notification is about. If None, every subscriber is a
+                      recipient.
+        :param batch_size: How many addresses to read from the database at once
+        :return: An iterator over the recipients
+        """
+
+        if terms is None:
+            yield from self.iter_emails(batch_size)
+            return
+
+        # Copy the matching subscribers before streaming, since subscriptions can change while iterating
+        with self._lock:
+            matched: set[str] = set().union(
+                *(self._filter_index.get(self.normalize_term(term), ()) for term in terms)
+            )
+
+        connection = sqlite3.connect(self.path)
+
+        try:
+            cursor = connection.execute(
+                "SELECT email FROM subscribers WHERE NOT EXISTS "
+                "(SELECT 1 FROM filters WHERE filters.email = subscribers.email)"
+            )
+
+            while rows := cursor.fetchmany(batch_size):
+                for row in rows:
+                    yield row[0]
+
+        finally:
+            connection.close()
+
+        yield from matched
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        A context manager that commits every change made inside it at once, or none of them if there is an error.
+        """
+
+        with self._lock:
+            self._connection.execute("BEGIN")
+
+            try:
+                yield self
+
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+
+                # The index may have changes that were rolled back
+                self._load_filter_index()
+                raise
+
+            self._connection.execute("COMMIT")
+
+    def import_emails(self, emails: Iterable[str]) -> None:
+        """
+        Subscribes every email address in one transaction.
+
+        :param emails: The email addresses to subscribe
+        """
+
+        with self.transaction():
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO subscribers (email) VALUES (?)",
+                ((address,) for email in emails if (address := self.normalize_address(email)))
+            )
+
+    def migrate_secret(self, secret: dict) -> bool:
+        """
+        Moves the subscribers out of the secret file data and into the store, so that the secret file only holds the
+        sender credentials.
+
+        :param secret: The secret file data. The receiver section is removed from it.
+        :return: If the secret file data changed and should be written
+        """
+
+        if "receiver" not in secret:
+            return False
+
+        emails = secret["receiver"].get("emails", [])
+        logging.info(f"Moving {len(emails)} subscribers from the secret file to {self.path}")
+
+        self.import_emails(emails)
+        del secret["receiver"]
+
+        return True
+
+    def close(self) -> None:
+        """
+        Closes the database.
+        """
+
+        with self._lock:
+            self._connection.close()
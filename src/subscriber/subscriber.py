@@ -1,40 +1,61 @@
 import logging
+import os
 import re
 
+from typing import Callable, Iterable
+
 from src.emailer.email_receiver import EmailReceiver
-from src.emailer import emailer
+from src.emailer.outbox import Outbox
+from src.helper import config_loader
+from src.subscriber.bounces import BounceProcessor
+from src.subscriber.store import SubscriberStore
+
+
+# "subscribe <launch filter>" at the start of a line, e.g. "subscribe SpaceX"
+_LAUNCH_FILTER_PATTERN = re.compile(r"^\s*subscribe[ \t]+(\S[^\r\n]{0,63}?)\s*$", re.IGNORECASE | re.MULTILINE)
 
 
 class Subscriber:
-    def __init__(self, receiver: EmailReceiver, config: dict, secret: dict):
+    def __init__(self, receiver: EmailReceiver, config: dict, store: SubscriberStore, outbox: Outbox,
+                 known_terms: Callable[[], Iterable[str]] | None = None):
         self._receiver = receiver
-        self._secret = secret
         self._config = config
+        self._store = store
+        self._outbox = outbox
+        self._bounces = BounceProcessor(store, config)
+
+        # Returns the providers, vehicles, and launch sites of the launches in the feed. They are remembered in the
+        # store, and launch filters must match one of them. If None, any filter is kept.
+        self._known_terms = known_terms
+        self.learn_launch_terms()
+
+        # The blacklist is checked against every email, so its patterns are combined into one compiled regex
+        blacklist = config["subscription"]["subscribe"]["blacklist"]
+        self._blacklist = re.compile("|".join(f"(?:{pattern})" for pattern in blacklist)) if blacklist else None
+
+        # Restore the inbox high-water mark so that mail that arrived while the program was not running is processed
+        self._inbox_state_path = config["subscription"]["inbox_state_file"]
 
-        self.last_email_date = self._receiver.get_last_email()["date"]
+        if os.path.exists(self._inbox_state_path):
+            self._receiver.set_state(config_loader.load_json(self._inbox_state_path))
 
     def _add_subscription(self, email: str) -> None:
         """
-        Adds a subscription to the _secret file.
+        Adds a subscription to the subscriber store.
 
         :param email: The email to add
         """
 
-        self._secret["receiver"]["emails"].append(email)
-        self._secret["receiver"]["emails"] = list(set(self._secret["receiver"]["emails"]))
+        self._store.add(email)
 
     def _remove_subscription(self, email: str) -> None:
         """
-        Removes a subscription from the secret file.
+        Removes a subscription from the subscriber store.
 
         :param email: The email to remove
         """
 
-        try:
-            self._secret["receiver"]["emails"].remove(email)
-
-        except ValueError:
-            pass
+        self._store.remove(email)
 
     @staticmethod
     def _get_email_contents(email) -> list[str]:
@@ -61,31 +82,72 @@ class Subscriber:
 
         return email_contents
 
-    def _handle_subscription(self, email, subscribe: bool) -> None:
+    def _handle_subscription(self, address: str, subscribe: bool, launch_filters: list[str] | None = None) -> None:
         """
         Handles a subscription.
 
-        :param email: The email to subscribe or unsubscribe
+        :param address: The email address to subscribe or unsubscribe
         :param subscribe: Whether to subscribe or unsubscribe
+        :param launch_filters: The launch filters to add to the subscription. If None, the subscription is for every
+                               launch.
         """
 
-        if subscribe and email["From"]:
-            logging.info(f"Adding {email['From']} to the subscription list")
-            self._add_subscription(email["From"])
+        if subscribe:
+            logging.info(f"Adding {address} to the subscription list")
+            self._add_subscription(address)
+
+            # Subscribing again lifts the suppression of an address that kept bouncing
+            self._store.clear_bounces(address)
+
+            if launch_filters is None:
+                self._store.clear_filters(address)
+            else:
+                logging.info(f"Adding launch filters {launch_filters} to {address}")
+                self._store.add_filters(address, launch_filters)
 
         else:
-            logging.info(f"Removing {email['From']} from the subscription list")
-            self._remove_subscription(email["From"])
+            logging.info(f"Removing {address} from the subscription list")
+            self._remove_subscription(address)
 
-        sub_or_unsub = "subscribe" if subscribe else "unsubscribe"
+    def _send_confirmations(self, changes: dict[str, bool], launch_filters: dict[str, list[str] | None],
+                            ignored_filters: dict[str, list[str]]) -> None:
+        """
+        Queues one batch of confirmation emails for each distinct confirmation message.
 
-        emailer.send_email(
-            body=self._config["subscription"][sub_or_unsub]["message"],
-            subject=self._config["subscription"][sub_or_unsub]["subject"],
-            to=email["From"],
-            sender=self._secret["sender"]["username"],
-            password=self._secret["sender"]["password"]
-        )
+        :param changes: A dict of email address to whether it was subscribed or unsubscribed
+        :param launch_filters: A dict of email address to the launch filters that were added to it, or None if none were
+        :param ignored_filters: A dict of email address to the launch filters that it asked for but were ignored. The
+                                addresses that are not in changes are told that their subscription was not changed.
+        """
+
+        subscribe_config = self._config["subscription"]["subscribe"]
+        confirmations: dict[tuple[str, str], list[str]] = {}
+
+        for address, subscribe in changes.items():
+            sub_or_unsub = "subscribe" if subscribe else "unsubscribe"
+            subject = self._config["subscription"][sub_or_unsub]["subject"]
+
+            if subscribe and launch_filters.get(address) is not None:
+                body = subscribe_config["filtered_message"].format(filters=", ".join(self._store.filters(address)))
+            else:
+                body = self._config["subscription"][sub_or_unsub]["message"]
+
+            if subscribe and address in ignored_filters:
+                body += "\n\n" + subscribe_config["ignored_filters_message"].format(
+                    filters=", ".join(ignored_filters[address])
+                )
+
+            confirmations.setdefault((subject, body), []).append(address)
+
+        for address, filters in ignored_filters.items():
+            if address in changes:
+                continue
+
+            body = subscribe_config["unknown_filters_message"].format(filters=", ".join(filters))
+            confirmations.setdefault((subscribe_config["unknown_filters_subject"], body), []).append(address)
+
+        for (subject, body), addresses in confirmations.items():
+            self._outbox.enqueue(key=None, subject=subject, body=body, recipients=addresses)
 
     def _emailer_in_blacklist(self, email: str) -> bool:
         """
@@ -95,49 +157,159 @@ class Subscriber:
         :return: Whether the emailer is in the blacklist
         """
 
-        return any(
-            re.findall(blacklist_entry, email)
+        return self._blacklist is not None and self._blacklist.search(email) is not None
 
-            for blacklist_entry in self._config["subscription"]["subscribe"]["blacklist"]
-        )
+    @classmethod
+    def _get_subscription_action(cls, email) -> bool | None:
+        """
+        :param email: The email to check
+        :return: True if the email asks to subscribe, False if it asks to unsubscribe, and None if it asks for neither
+        """
+
+        # Search email contents for "subscribe" or "unsubscribe"
+        for content in cls._get_email_contents(email):
+            if content is None:
+                continue
+
+            if "unsubscribe" in content.lower().strip() == "unsubscribe":
+                return False
+
+            elif "subscribe" in content.lower().strip():
+                return True
+
+        return None
+
+    @classmethod
+    def _get_launch_filter(cls, email) -> str | None:
+        """
+        :param email: The email to check
+        :return: The launch filter that the email asks to subscribe to, e.g. "SpaceX" for "subscribe SpaceX", or None if
+                 it asks to subscribe to every launch
+        """
+
+        for content in cls._get_email_contents(email):
+            if content is None:
+                continue
+
+            match = _LAUNCH_FILTER_PATTERN.search(content)
+
+            if match is not None:
+                return match.group(1)
+
+        return None
+
+    def learn_launch_terms(self) -> None:
+        """
+        Remembers the providers, vehicles, and launch sites of the launches in the feed, so that launch filters for them
+        are accepted even after the launches left the feed. Should be called whenever the feed changes.
+        """
+
+        if self._known_terms is not None:
+            self._store.add_launch_terms(self._known_terms())
+
+    def _unknown_filters(self, launch_filters: set[str]) -> set[str]:
+        """
+        :param launch_filters: The requested launch filters
+        :return: The launch filters that match no provider, vehicle, or launch site of any launch seen so far, e.g. "me
+                 please" from "subscribe me please"
+        """
+
+        if self._known_terms is None or len(launch_filters) == 0:
+            return set()
+
+        return self._store.unknown_terms(launch_filters)
 
     def check(self) -> bool:
         """
-        Checks for new subscriptions and unsubscriptions.
+        Checks every email that arrived since the last check for new subscriptions and unsubscriptions, and for bounces.
+        All changes are applied in one pass and confirmed with one batch of emails.
 
-        :return: If changes were made to the _secret file
+        :return: If changes were made to the subscriber store
         """
 
-        email = self._receiver.get_last_email()
+        emails = self._receiver.get_new_emails(self._config["subscription"]["body_bytes"])
 
-        if (email is None
-                or email["date"] == self.last_email_date
-                or self._emailer_in_blacklist(email["From"])):
+        if len(emails) == 0:
             return False
 
-        self.last_email_date = email["date"]
+        # The last request of each address wins, e.g. subscribing then unsubscribing in one batch unsubscribes. Launch
+        # filters requested in a row are combined.
+        changes: dict[str, bool] = {}
+        launch_filters: dict[str, list[str] | None] = {}
 
-        # Search email contents for "subscribe" or "unsubscribe"
-        email_contents = self._get_email_contents(email)
+        suppressed: list[str] = []
 
-        # Subscribe and unsubscribe if the email contains the relevant strings
-        for content in email_contents:
-            if content is None:
+        for email in emails:
+            if self._bounces.is_bounce(email):
+                suppressed.extend(self._bounces.process(email))
                 continue
 
-            if "unsubscribe" in content.lower().strip() == "unsubscribe":
-                self._handle_subscription(email, False)
-                return True
+            if not email["From"] or self._emailer_in_blacklist(email["From"]):
+                continue
 
-            elif "subscribe" in content.lower().strip():
-                self._handle_subscription(email, True)
-                return True
+            # Subscribers are kept by their bare address, which is also how delivery reports name them
+            address = SubscriberStore.normalize_address(email["From"])
+            action = self._get_subscription_action(email)
+
+            if not address or action is None:
+                continue
+
+            changes.pop(address, None)
+            changes[address] = action
+
+            launch_filter = self._get_launch_filter(email) if action else None
+
+            if launch_filter is None:
+                launch_filters[address] = None
+            else:
+                launch_filters[address] = (launch_filters.get(address) or []) + [launch_filter]
+
+        # Filters that no launch has matched, e.g. "me please" from "subscribe me please", are ignored and listed in
+        # the reply. A subscription whose filters were all ignored is not changed, since it would otherwise widen.
+        unknown = self._unknown_filters(
+            {term for terms in launch_filters.values() if terms is not None for term in terms}
+        )
+        ignored_filters: dict[str, list[str]] = {}
+
+        for address, terms in list(launch_filters.items()):
+            if terms is None or unknown.isdisjoint(terms):
+                continue
+
+            ignored_filters[address] = [term for term in terms if term in unknown]
+            logging.info(f"Ignoring launch filters of {address} that match no launch: {ignored_filters[address]}")
+
+            terms = [term for term in terms if term not in unknown]
+
+            if len(terms) > 0:
+                launch_filters[address] = terms
+            else:
+                del launch_filters[address]
+                del changes[address]
+
+        with self._store.transaction():
+            for address, subscribe in changes.items():
+                self._handle_subscription(address, subscribe, launch_filters[address])
+
+        config_loader.write_json(self._inbox_state_path, self._receiver.get_state())
+
+        if len(changes) > 0 or len(ignored_filters) > 0:
+            self._send_confirmations(changes, launch_filters, ignored_filters)
+
+        return len(changes) > 0 or len(suppressed) > 0
+
+    def wait_for_mail(self, timeout: float) -> bool:
+        """
+        Waits until new mail may have arrived in the inbox or the timeout passes.
+
+        :param timeout: The maximum number of seconds to wait
+        :return: If new mail may have arrived
+        """
 
-        return False
+        return self._receiver.wait_for_mail(timeout)
 
-    def get_secret(self) -> dict:
+    def close(self) -> None:
         """
-        :return: The secret file
+        Closes the inbox session.
         """
 
-        return self._secret
+        self._receiver.logout()
@@ -0,0 +1,82 @@
+import email
+import os
+import sqlite3
+
+import pytest
+
+from src import subscriber
+from src.helper import config_loader
+from tests.test_launch_filters import _Inbox, _Outbox, _reply
+
+
+DSN = """\
+From: Mail Delivery Subsystem <mailer-daemon@example.net>
+Subject: Delivery Status Notification (Failure)
+MIME-Version: 1.0
+Content-Type: multipart/report; report-type=delivery-status; boundary="report"
+
+--report
+Content-Type: text/plain
+
+The email could not be delivered.
+
+--report
+Content-Type: message/delivery-status
+
+Reporting-MTA: dns; mx.example.net
+
+Final-Recipient: rfc822; jane@example.com
+Action: failed
+Status: 5.1.1
+
+--report--
+"""
+
+
+@pytest.fixture
+def config(tmp_path) -> dict:
+    config = config_loader.load_toml("config/config.toml")
+    config["subscription"]["database_file"] = os.path.join(tmp_path, "subscribers.db")
+    config["subscription"]["inbox_state_file"] = os.path.join(tmp_path, "inbox_state.json")
+    config["subscription"]["subscribe"]["blacklist"] = []
+
+    return config
+
+
+def test_subscriber_with_a_display_name_is_suppressed_by_its_bounces(config):
+    store = subscriber.store.SubscriberStore(config["subscription"]["database_file"])
+    inbox = _Inbox([_reply("Jane Doe <Jane@Example.com>", "subscribe")])
+    outbox = _Outbox()
+    sub = subscriber.subscriber.Subscriber(inbox, config, store, outbox)
+
+    sub.check()
+
+    assert list(store) == ["jane@example.com"]
+    assert outbox.emails[0]["recipients"] == ["jane@example.com"]
+
+    inbox.emails = [email.message_from_string(DSN)] * config["subscription"]["bounces"]["hard_bounce_limit"]
+    sub.check()
+
+    assert len(store) == 0
+
+    store.close()
+
+
+def test_stored_from_headers_are_migrated_to_bare_addresses(config):
+    path = config["subscription"]["database_file"]
+
+    store = subscriber.store.SubscriberStore(path)
+    store.close()
+
+    with sqlite3.connect(path) as connection:
+        connection.executemany("INSERT INTO subscribers (email) VALUES (?)",
+                               [("Jane Doe <jane@example.com>",), ("jane@example.com",), ("Bob@Example.com",)])
+        connection.execute("INSERT INTO filters (email, term) VALUES ('Jane Doe <jane@example.com>', 'spacex')")
+
+    store = subscriber.store.SubscriberStore(path)
+
+    assert sorted(store) == ["bob@example.com", "jane@example.com"]
+    assert store.filters("jane@example.com") == ["spacex"]
+    assert list(store.iter_audience(["SpaceX"])) == ["bob@example.com", "jane@example.com"]
+
+    store.close()
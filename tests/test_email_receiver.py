@@ -0,0 +1,142 @@
+import socketserver
+import threading
+import time
+
+import pytest
+
+from src.emailer.email_receiver import EmailReceiver
+
+
+HEADER = b"From: Jane Doe <jane@example.com>\r\nSubject: subscribe\r\n\r\n"
+MESSAGE = HEADER[:-2] + b"Content-Type: text/plain\r\n\r\nsubscribe SpaceX\r\n"
+
+
+class _Connection:
+    def __init__(self, responses: dict[str, list]):
+        """
+        Stands in for an imaplib connection, and returns FETCH data split the way imaplib splits it.
+
+        :param responses: The FETCH data to return for each data item that is fetched
+        """
+
+        self.responses = responses
+        self.fetched: list[tuple[str, str]] = []
+
+    def uid(self, command: str, uids: str, query: str) -> tuple[str, list]:
+        self.fetched.append((uids, query))
+
+        for item, data in self.responses.items():
+            if item in query:
+                return "OK", data
+
+        return "OK", [None]
+
+
+def _receiver(connection: _Connection) -> EmailReceiver:
+    receiver = EmailReceiver("test@localhost", "test")
+    receiver._connection = connection
+    receiver.uid_validity = 1
+    receiver.last_seen_uid = 6
+
+    return receiver
+
+
+def test_literal_in_bodystructure_falls_back_to_the_whole_email():
+    header_item = f"BODY[HEADER.FIELDS (FROM SUBJECT DATE)] {{{len(HEADER)}}}".encode()
+
+    connection = _Connection({
+        "BODYSTRUCTURE": [
+            # The file name of the first part is sent as a literal, so imaplib splits the message in two
+            (b'1 (UID 7 BODYSTRUCTURE (("text" "plain" ("name" {5}', b"hello"),
+            (b') NIL NIL "7bit" 5 1 NIL NIL NIL)("text" "html" NIL NIL NIL "7bit" 5 1 NIL NIL NIL) "mixed") '
+             + header_item, HEADER),
+            b")",
+            (b'2 (UID 8 BODYSTRUCTURE ("text" "plain" NIL NIL NIL "7bit" 17 1 NIL NIL NIL) ' + header_item, HEADER),
+            b")",
+            b"3 (FLAGS (\\Seen))"
+        ],
+        "RFC822": [(f"1 (UID 7 RFC822 {{{len(MESSAGE)}}}".encode(), MESSAGE), b")"]
+    })
+
+    receiver = _receiver(connection)
+    emails = receiver.get_new_emails(body_limit=1000)
+
+    assert [mail["From"] for mail in emails] == ["Jane Doe <jane@example.com>"] * 2
+    assert "subscribe SpaceX" in emails[0].get_payload()
+    assert ("7", "(UID RFC822)") in connection.fetched
+    assert receiver.last_seen_uid == 8
+
+
+class _StaleExistsHandler(socketserver.StreamRequestHandler):
+    def _reply(self, *lines: str) -> None:
+        self.wfile.write("".join(line + "\r\n" for line in lines).encode())
+
+    def handle(self) -> None:
+        self._reply("* OK IMAP4rev1 ready")
+
+        while line := self.rfile.readline():
+            tag, command = line.decode().split()[:2]
+            command = command.upper()
+
+            if command == "CAPABILITY":
+                self._reply("* CAPABILITY IMAP4rev1 IDLE", f"{tag} OK CAPABILITY completed")
+
+            elif command == "SELECT":
+                # The server reports the mailbox again right after SELECT, so it is left unread in the buffer
+                self._reply("* 1 EXISTS", "* OK [UIDVALIDITY 1] UIDs valid", "* OK [UIDNEXT 2] Predicted next UID",
+                            f"{tag} OK [READ-WRITE] SELECT completed", "* 1 EXISTS")
+
+            elif command == "UID":
+                self._reply("* SEARCH " + " ".join(str(uid) for uid in self.server.uids), f"{tag} OK SEARCH completed")
+
+            elif command == "IDLE":
+                self.server.idled += 1
+                self._reply("+ idling")
+                self.rfile.readline()
+                self._reply(f"{tag} OK IDLE terminated")
+
+            elif command == "LOGOUT":
+                self._reply("* BYE", f"{tag} OK LOGOUT completed")
+                return
+
+            else:
+                self._reply(f"{tag} OK {command} completed")
+
+
+@pytest.fixture
+def server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _StaleExistsHandler)
+    server.daemon_threads = True
+    server.uids = [1]
+    server.idled = 0
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_exists_left_from_before_idle_does_not_wake_the_receiver(server):
+    receiver = EmailReceiver("test@localhost", "test", "127.0.0.1", server.server_address[1], use_ssl=False)
+
+    start = time.monotonic()
+    assert not receiver.wait_for_mail(0.3)
+    assert time.monotonic() - start >= 0.3
+    assert server.idled == 1
+
+    receiver.logout()
+
+
+def test_exists_left_from_before_idle_wakes_the_receiver_for_new_mail(server):
+    receiver = EmailReceiver("test@localhost", "test", "127.0.0.1", server.server_address[1], use_ssl=False)
+    receiver._get_connection()
+
+    # Mail arrived after the inbox was selected, and was only reported by the response left in the buffer
+    server.uids = [1, 2]
+
+    assert receiver.wait_for_mail(5)
+    assert server.idled == 0
+
+    receiver.logout()
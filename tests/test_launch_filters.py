@@ -0,0 +1,169 @@
+import datetime
+import email.message
+import os
+
+import pytest
+
+from src import feed
+from src import notifs
+from src import subscriber
+from src.helper import clock
+from src.helper import config_loader
+from src.helper import dt_helper
+
+
+class _Inbox:
+    def __init__(self, emails: list[email.message.Message]):
+        self.emails = emails
+
+    def get_new_emails(self, body_limit: int | None = None) -> list[email.message.Message]:
+        emails, self.emails = self.emails, []
+        return emails
+
+    def get_state(self) -> dict:
+        return {}
+
+
+class _Outbox:
+    def __init__(self):
+        self.emails: list[dict] = []
+
+    def enqueue(self, key, subject, body, recipients=None, priority=None, audience=None) -> bool:
+        self.emails.append({"key": key, "body": body, "recipients": recipients, "audience": audience})
+        return True
+
+
+def _launch(launch_id: int, provider: str, t0: datetime.datetime) -> dict:
+    return {
+        "id": launch_id,
+        "name": f"Mission {launch_id}",
+        "provider": {"name": provider},
+        "vehicle": {"name": f"{provider} Rocket"},
+        "pad": {"name": "LC-1", "location": {"name": f"{provider} Site"}},
+        "t0": t0.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    }
+
+
+def _reply(address: str, text: str) -> email.message.Message:
+    mail = email.message.Message()
+    mail["From"] = address
+    mail["Subject"] = text
+    return mail
+
+
+@pytest.fixture
+def config(tmp_path) -> dict:
+    config = config_loader.load_toml("config/config.toml")
+    config["subscription"]["database_file"] = os.path.join(tmp_path, "subscribers.db")
+    config["subscription"]["inbox_state_file"] = os.path.join(tmp_path, "inbox_state.json")
+    config["subscription"]["subscribe"]["blacklist"] = []
+
+    return config
+
+
+@pytest.fixture
+def launch_differ() -> feed.LaunchDiffer:
+    t0 = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=5)
+
+    launch_differ = feed.LaunchDiffer()
+    launch_differ.diff({"result": [_launch(1, "SpaceX", t0), _launch(2, "Rocket Lab", t0)]})
+
+    return launch_differ
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("subscribe", []),
+    ("Subscribe SpaceX", ["spacex"]),
+    ("subscribe rocket lab site", ["rocket lab site"])
+])
+def test_known_launch_filters_are_kept(config, launch_differ, text, expected):
+    store = subscriber.store.SubscriberStore(config["subscription"]["database_file"])
+    sub = subscriber.subscriber.Subscriber(
+        _Inbox([_reply("a@example.com", text)]), config, store, _Outbox(), launch_differ.filter_terms
+    )
+
+    assert sub.check()
+    assert store.filters("a@example.com") == expected
+
+    store.close()
+
+
+def test_unknown_launch_filters_do_not_widen_a_subscription(config, launch_differ):
+    store = subscriber.store.SubscriberStore(config["subscription"]["database_file"])
+    store.add("filtered@example.com")
+    store.add_filters("filtered@example.com", ["SpaceX"])
+
+    outbox = _Outbox()
+    sub = subscriber.subscriber.Subscriber(
+        _Inbox([_reply("new@example.com", "subscribe me please"), _reply("filtered@example.com", "subscribe Blue")]),
+        config,
+        store,
+        outbox,
+        launch_differ.filter_terms
+    )
+
+    assert not sub.check()
+    assert "new@example.com" not in store
+    assert store.filters("filtered@example.com") == ["spacex"]
+
+    replies = {tuple(reply["recipients"]): reply["body"] for reply in outbox.emails}
+    assert "not changed: me please." in replies[("new@example.com",)]
+    assert "not changed: Blue." in replies[("filtered@example.com",)]
+
+    store.close()
+
+
+def test_launch_filters_are_kept_after_their_launches_leave_the_feed(config, launch_differ):
+    store = subscriber.store.SubscriberStore(config["subscription"]["database_file"])
+    subscriber.subscriber.Subscriber(_Inbox([]), config, store, _Outbox(), launch_differ.filter_terms)
+
+    # Only SpaceX launches are in the feed now
+    launch_differ.diff({"result": [_launch(1, "SpaceX", datetime.datetime.now(datetime.timezone.utc))]})
+
+    outbox = _Outbox()
+    sub = subscriber.subscriber.Subscriber(
+        _Inbox([_reply("a@example.com", "subscribe Rocket Lab")]), config, store, outbox, launch_differ.filter_terms
+    )
+
+    assert sub.check()
+    assert store.filters("a@example.com") == ["rocket lab"]
+    assert "ignored" not in outbox.emails[0]["body"]
+
+    store.close()
+
+
+def test_digest_lists_only_the_launches_of_each_filter_group(config):
+    timezone = dt_helper.get_timezone(config)
+    send_time = datetime.datetime.combine(datetime.date(2026, 10, 18), config["reminders"]["daily"]["send_time"],
+                                          tzinfo=timezone)
+
+    clock.set_clock(clock.ScaledClock((send_time + datetime.timedelta(seconds=1)).timestamp(), 1))
+
+    try:
+        t0 = send_time + datetime.timedelta(hours=3)
+        launches = feed.LaunchDiffer()
+        launches.diff({"result": [_launch(1, "SpaceX", t0), _launch(2, "Rocket Lab", t0)]})
+
+        store = subscriber.store.SubscriberStore(config["subscription"]["database_file"])
+        store.add("everything@example.com")
+        store.add("spacex@example.com")
+        store.add_filters("spacex@example.com", ["SpaceX"])
+
+        outbox = _Outbox()
+        digest = notifs.daily.DailyDigest(config, list(launches.launches.values()), send_time.date(),
+                                          store.filter_groups)
+        digest.send(outbox)
+
+        group, everyone = outbox.emails
+
+        assert group["recipients"] == ["spacex@example.com"]
+        assert "SpaceX" in group["body"] and "Rocket Lab" not in group["body"]
+
+        assert everyone["recipients"] is None and everyone["audience"] == []
+        assert "SpaceX" in everyone["body"] and "Rocket Lab" in everyone["body"]
+        assert list(store.iter_audience(everyone["audience"])) == ["everything@example.com"]
+
+        store.close()
+
+    finally:
+        clock.set_clock(clock.Clock())
@@ -0,0 +1,208 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+from src.emailer import outbox
+from src.emailer import smtp_pool
+from src.emailer.rate_governor import PRIORITY_PRELAUNCH
+from src.helper import clock
+from src.helper import config_loader
+from src.recording.mail_capture import MailCapture
+
+
+SECRET = {"senders": [{"username": "test@localhost", "password": "test"}]}
+
+
+# Shared pools keep the server they were created with, so every test sends to the same capture
+@pytest.fixture(scope="module")
+def capture():
+    capture = MailCapture()
+    capture.start()
+
+    smtp_pool.set_server("127.0.0.1", capture.port, starttls=False)
+
+    yield capture
+
+    smtp_pool.close_all()
+    capture.stop()
+
+
+@pytest.fixture
+def config(tmp_path) -> dict:
+    config = config_loader.load_toml("config/config.toml")
+    config["rate_limit"] = {"per_second": 0, "per_minute": 0, "per_day": 0, "max_wait_seconds": 5}
+    config["outbox"]["database_file"] = os.path.join(tmp_path, "outbox.db")
+    config["delivery"]["chunk_size"] = 2
+
+    return config
+
+
+def _wait_until_sent(mail_outbox: outbox.Outbox, count: int) -> None:
+    deadline = time.monotonic() + 10
+
+    while mail_outbox.counts().get("sent", 0) < count:
+        assert time.monotonic() < deadline, "the email was not sent"
+        time.sleep(0.01)
+
+
+def _statuses(path: str) -> dict[str, str]:
+    with sqlite3.connect(path) as connection:
+        return dict(connection.execute("SELECT key, status FROM outbox").fetchall())
+
+
+def test_restart_skips_recipients_that_were_already_sent_to(config, capture):
+    path = config["outbox"]["database_file"]
+    recipients = [f"{number}@example.com" for number in range(10)]
+
+    mail_outbox = outbox.Outbox(path, config, SECRET, lambda terms: [])
+    mail_outbox.enqueue("launch:prelaunch", "Launch Soon", "A launch is soon", recipients)
+    mail_outbox.close()
+
+    # Stop partway through the fan-out, after the first 6 recipients were sent to
+    with sqlite3.connect(path) as connection:
+        connection.execute("UPDATE outbox SET status = 'sending'")
+        connection.executemany("INSERT INTO delivered (key, email) VALUES ('launch:prelaunch', ?)",
+                               ((recipient,) for recipient in recipients[:6]))
+
+    recipients_before = capture.recipients
+
+    mail_outbox = outbox.Outbox(path, config, SECRET, lambda terms: [])
+    mail_outbox.start()
+
+    _wait_until_sent(mail_outbox, 1)
+    mail_outbox.close()
+
+    assert capture.recipients - recipients_before == 4
+
+
+def test_sent_email_forgets_its_delivered_recipients(config, capture):
+    path = config["outbox"]["database_file"]
+    recipients_before = capture.recipients
+
+    mail_outbox = outbox.Outbox(path, config, SECRET, lambda terms: [f"{number}@example.com" for number in range(5)])
+    mail_outbox.start()
+    mail_outbox.enqueue("daily", "Launch Upcoming", "A launch is today")
+
+    _wait_until_sent(mail_outbox, 1)
+    mail_outbox.close()
+
+    assert capture.recipients - recipients_before == 5
+
+    with sqlite3.connect(path) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM delivered").fetchone()[0] == 0
+
+
+def test_restart_counts_the_sends_of_the_last_day_against_the_daily_limit(config, capture):
+    path = config["outbox"]["database_file"]
+    config["rate_limit"]["per_day"] = 10
+
+    mail_outbox = outbox.Outbox(path, config, SECRET, lambda terms: [])
+    mail_outbox.start()
+    mail_outbox.enqueue("launch:prelaunch", "Launch Soon", "A launch is soon",
+                        [f"{number}@example.com" for number in range(10)])
+
+    _wait_until_sent(mail_outbox, 1)
+    mail_outbox.close()
+
+    mail_outbox = outbox.Outbox(path, config, SECRET, lambda terms: [])
+    governor = mail_outbox.shards._governors[SECRET["senders"][0]["username"]]
+
+    # The whole daily allowance was used, so the next recipient has to wait for the bucket to refill
+    assert governor._seconds_until_available(1) > 60 * 60
+
+    mail_outbox.close()
+
+
+def test_close_interrupts_a_fan_out_that_waits_for_the_rate_limit(config, capture):
+    path = config["outbox"]["database_file"]
+    config["rate_limit"]["per_minute"] = 2
+    config["rate_limit"]["max_wait_seconds"] = 120
+
+    mail_outbox = outbox.Outbox(path, config, SECRET, lambda terms: [])
+    mail_outbox.start()
+    mail_outbox.enqueue("daily", "Launch Upcoming", "A launch is today",
+                        [f"{number}@example.com" for number in range(10)])
+
+    # The first chunk uses the whole allowance, so the second one waits for a minute
+    deadline = time.monotonic() + 10
+
+    while mail_outbox.shards.stats()["waiting"] == 0:
+        assert time.monotonic() < deadline, "the email did not wait for the rate limit"
+        time.sleep(0.01)
+
+    start = time.monotonic()
+    mail_outbox.close()
+
+    assert time.monotonic() - start < 5
+
+    with sqlite3.connect(path) as connection:
+        assert connection.execute("SELECT status, attempts FROM outbox").fetchall() == [("pending", 0)]
+        assert connection.execute("SELECT COUNT(*) FROM delivered").fetchone()[0] == 2
+
+
+def test_prelaunch_email_overtakes_a_rate_limited_daily_fan_out(config, capture):
+    path = config["outbox"]["database_file"]
+    config["rate_limit"]["per_minute"] = 2
+    config["outbox"]["workers"] = 1
+
+    # A minute of the rate limit passes in 60 real milliseconds
+    clock.set_clock(clock.ScaledClock(time.time(), 1000))
+
+    try:
+        mail_outbox = outbox.Outbox(path, config, SECRET, lambda terms: [])
+        mail_outbox.start()
+        mail_outbox.enqueue("daily", "Launch Upcoming", "A launch is today",
+                            [f"{number}@example.com" for number in range(10)])
+
+        deadline = time.monotonic() + 10
+
+        with sqlite3.connect(path) as connection:
+            while connection.execute("SELECT COUNT(*) FROM delivered").fetchone()[0] == 0:
+                assert time.monotonic() < deadline, "the daily email was not started"
+                time.sleep(0.001)
+
+        # The only worker is in the middle of the daily fan-out, which needs 4 more minutes of the rate limit
+        mail_outbox.enqueue("launch:prelaunch", "Launch Soon", "A launch is soon", ["prelaunch@example.com"],
+                            PRIORITY_PRELAUNCH)
+
+        while _statuses(path)["launch:prelaunch"] != "sent":
+            assert time.monotonic() < deadline, "the prelaunch email was not sent"
+            time.sleep(0.001)
+
+        assert _statuses(path)["daily"] == "pending"
+
+        mail_outbox.close()
+
+    finally:
+        clock.set_clock(clock.Clock())
+
+
+def test_expired_rows_are_purged_while_the_outbox_runs(config, capture):
+    path = config["outbox"]["database_file"]
+    old = time.time() - 30 * 24 * 60 * 60
+
+    mail_outbox = outbox.Outbox(path, config, SECRET, lambda terms: [])
+    mail_outbox.start()
+
+    with sqlite3.connect(path) as connection:
+        connection.execute("INSERT INTO outbox (key, subject, body, status, next_attempt, created) "
+                           "VALUES ('old', 'Launch Soon', 'A launch is soon', 'sent', ?, ?)", (old, old))
+        connection.execute("INSERT INTO sends (account, time, recipients) VALUES ('test@localhost', ?, 2)", (old,))
+        connection.execute("INSERT INTO delivered (key, email) VALUES ('old', 'a@example.com')")
+
+    mail_outbox.enqueue("launch:prelaunch", "Launch Soon", "A launch is soon", ["a@example.com"])
+    deadline = time.monotonic() + 10
+
+    while _statuses(path)["launch:prelaunch"] != "sent":
+        assert time.monotonic() < deadline, "the email was not sent"
+        time.sleep(0.01)
+
+    # The worker purges after it finishes the email, and close waits for the worker
+    mail_outbox.close()
+
+    with sqlite3.connect(path) as connection:
+        assert connection.execute("SELECT key FROM outbox").fetchall() == [("launch:prelaunch",)]
+        assert connection.execute("SELECT COUNT(*) FROM sends WHERE time < ?", (old + 1,)).fetchone()[0] == 0
+        assert connection.execute("SELECT COUNT(*) FROM delivered").fetchone()[0] == 0
@@ -0,0 +1,133 @@
+import datetime
+import json
+import os
+
+from src import feed
+from src import notifs
+from src.helper import config_loader
+
+
+# A launch ID as the API sends it. Launches and reminders hold it as a string.
+LAUNCH_ID = 1234
+
+
+def _config(directory: str) -> dict:
+    """
+    :param directory: The directory to keep the reminder state in
+    :return: The config file data with the reminder state in the directory
+    """
+
+    config = config_loader.load_toml("config/config.toml")
+    config["reminders"]["prelaunch"]["state_file"] = os.path.join(directory, "reminder_state.json")
+
+    return config
+
+
+def _feed(t0: datetime.datetime) -> dict:
+    """
+    :param t0: The launch time
+    :return: A feed with one launch
+    """
+
+    return {"result": [{
+        "id": LAUNCH_ID,
+        "name": f"Mission {LAUNCH_ID}",
+        "provider": {"name": "SpaceX"},
+        "vehicle": {"name": "Falcon 9"},
+        "pad": {"name": "SLC-40", "location": {"name": "Cape Canaveral SFS"}},
+        "t0": t0.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    }]}
+
+
+def _reminder_list(config: dict) -> notifs.prelaunch.ReminderList:
+    """
+    :param config: The config file data
+    :return: A reminder list that restores from and persists to the reminder state of the config
+    """
+
+    state = notifs.ReminderState(config["reminders"]["prelaunch"]["state_file"])
+    return notifs.prelaunch.ReminderList(config, None, state)
+
+
+def _restart_and_reschedule(directory: str, snapshot: bool) -> tuple[notifs.prelaunch.ReminderList, datetime.datetime]:
+    """
+    Schedules a reminder, restarts, and moves T-0 by 3 hours.
+
+    :param directory: The directory to keep the reminder state in
+    :param snapshot: If the first run writes a snapshot when it stops. Otherwise, it stops without one, as in a crash,
+                     and the reminder is restored from the journal.
+    :return: The reminder list after the restart, and the new T-0
+    """
+
+    config = _config(directory)
+    t0 = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0) + datetime.timedelta(hours=5)
+
+    reminder_list = _reminder_list(config)
+    reminder_list.apply_delta(feed.LaunchDiffer().diff(_feed(t0)))
+
+    if snapshot:
+        reminder_list.close()
+    else:
+        reminder_list.state.close()
+
+    new_t0 = t0 + datetime.timedelta(hours=3)
+
+    reminder_list = _reminder_list(config)
+    reminder_list.apply_delta(feed.LaunchDiffer().diff(_feed(new_t0)))
+
+    return reminder_list, new_t0
+
+
+def _assert_rescheduled(reminder_list: notifs.prelaunch.ReminderList, t0: datetime.datetime) -> None:
+    """
+    :param reminder_list: The reminder list after the restart
+    :param t0: The new T-0
+    """
+
+    remind_time = t0 - datetime.timedelta(minutes=reminder_list.config["reminders"]["prelaunch"]["mins_before_launch"])
+
+    assert list(reminder_list._reminders) == [str(LAUNCH_ID)]
+    assert reminder_list.get_reminder(str(LAUNCH_ID)).time_to_remind == remind_time
+    assert reminder_list.next_due_time() == remind_time
+
+
+def test_restore_from_snapshot_reschedules_the_same_reminder(tmp_path):
+    reminder_list, t0 = _restart_and_reschedule(str(tmp_path), snapshot=True)
+    _assert_rescheduled(reminder_list, t0)
+
+
+def test_restore_from_journal_reschedules_the_same_reminder(tmp_path):
+    reminder_list, t0 = _restart_and_reschedule(str(tmp_path), snapshot=False)
+    _assert_rescheduled(reminder_list, t0)
+
+
+def test_second_restart_restores_one_reminder_per_launch(tmp_path):
+    reminder_list, t0 = _restart_and_reschedule(str(tmp_path), snapshot=False)
+    reminder_list.close()
+
+    restored = _reminder_list(reminder_list.config)
+    _assert_rescheduled(restored, t0)
+    restored.close()
+
+
+def test_int_launch_ids_of_old_state_files_are_restored_as_strings(tmp_path):
+    config = _config(str(tmp_path))
+    t0 = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0) + datetime.timedelta(hours=5)
+
+    reminder_list = _reminder_list(config)
+    reminder_list.apply_delta(feed.LaunchDiffer().diff(_feed(t0)))
+    state = reminder_list.get_reminder(str(LAUNCH_ID)).to_state()
+    reminder_list.state.close()
+
+    # Rewrite the journal as it was written when launch IDs were kept as the API sent them
+    state["launch_id"] = LAUNCH_ID
+
+    with open(config["reminders"]["prelaunch"]["state_file"] + ".journal", "w") as f:
+        f.write(json.dumps({"launch_id": LAUNCH_ID, "reminder": state}) + "\n")
+
+    new_t0 = t0 + datetime.timedelta(hours=3)
+
+    reminder_list = _reminder_list(config)
+    reminder_list.apply_delta(feed.LaunchDiffer().diff(_feed(new_t0)))
+
+    _assert_rescheduled(reminder_list, new_t0)
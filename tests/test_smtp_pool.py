@@ -0,0 +1,60 @@
+import socketserver
+import threading
+
+import pytest
+
+from src.emailer import smtp_pool
+
+
+class _DropAfterDataHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str) -> None:
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self) -> None:
+        self._reply("220 localhost")
+
+        while line := self.rfile.readline():
+            command = line[:4].upper()
+
+            if command == b"EHLO":
+                self._reply("250-localhost")
+                self._reply("250 AUTH PLAIN LOGIN")
+
+            elif command == b"AUTH":
+                self._reply("235 2.7.0 Authentication successful")
+
+            elif command == b"DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+
+                # The message was received, but the connection drops before the reply
+                self.server.messages += 1
+                return
+
+            else:
+                self._reply("250 OK")
+
+
+@pytest.fixture
+def server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _DropAfterDataHandler)
+    server.daemon_threads = True
+    server.messages = 0
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_message_is_not_sent_again_if_the_connection_drops_after_data(server):
+    pool = smtp_pool.SMTPPool("test@localhost", "test", "127.0.0.1", server.server_address[1], starttls=False)
+
+    assert pool.sendmail("test@localhost", ["a@example.com", "b@example.com"], b"Subject: Launch Soon\r\n\r\nSoon") == {}
+    assert server.messages == 1
+
+    pool.close()